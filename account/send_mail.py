@@ -1,4 +1,4 @@
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, send_mail
 
 HOST = 'localhost:3000'
 
@@ -26,6 +26,32 @@ def send_confirmation_email(user, code):
     )
 
 
+def order_notification_message(user_email, order_id, price, status=None):
+    """
+    Формирует письмо о заказе без отправки (для отправки пачкой через одно соединение).
+
+    Аргументы:
+    - user_email (str): Email пользователя, которому отправляется уведомление.
+    - order_id (int): Номер заказа.
+    - price (float): Полная стоимость заказа.
+    - status (str): Новый статус заказа; None - письмо о создании заказа.
+
+    Возвращает:
+    - EmailMessage: Письмо, готовое к отправке.
+    """
+    if status is None:
+        subject = 'Уведомление о создании заказа!'
+        body = (f'Вы создали заказ №{order_id}, ожидайте звонка!\n'
+                f'Полная стоимость вашего заказа: {price}.\n'
+                f'Спасибо за то что выбрали нас!')
+    else:
+        subject = f'Статус заказа №{order_id} изменён'
+        body = (f'Статус вашего заказа №{order_id}: {status}.\n'
+                f'Полная стоимость заказа: {price}.\n'
+                f'Спасибо за то что выбрали нас!')
+    return EmailMessage(subject, body, 'from@example.com', [user_email])
+
+
 def send_notification(user_email, order_id, price):
     """
     Отправляет уведомление пользователю о созданном заказе.
@@ -37,6 +63,7 @@ def send_notification(user_email, order_id, price):
 
     Примечание:
     - Письмо содержит информацию о заказе, его номере и стоимости.
+    - Заказы отправляют уведомления через очередь OrderNotification (order.notifications).
     """
     send_mail(
         'Уведомление о создании заказа!',
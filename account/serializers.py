@@ -3,14 +3,16 @@ from django.contrib.auth.password_validation import validate_password
 from rest_framework import serializers
 
 from account.models import CustomUser
+from config.serializers import SparseFieldsetMixin
 
 # Получаем модель пользователя, указанную в настройках проекта.
 User = get_user_model()
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Сериализатор для модели User, используется для представления пользователей без пароля.
+    Поля ответа можно ограничить параметрами ?fields= и ?omit=.
     """
     class Meta:
         model = User
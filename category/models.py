@@ -3,6 +3,8 @@ from django.db.models.signals import pre_save
 from django.dispatch import receiver
 from django.template.defaultfilters import slugify as django_slugify
 
+from config.cache import register_cache_tags
+
 
 class Category(models.Model):
     """
@@ -36,6 +38,10 @@ class Category(models.Model):
         verbose_name_plural = 'categories'
 
 
+# Закешированные списки категорий (и продуктов с названиями категорий) сбрасываются при изменении категорий
+register_cache_tags(Category, 'categories')
+
+
 @receiver(pre_save, sender=Category)
 def category_slug_save(sender, instance, *args, **kwargs):
     """
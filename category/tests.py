@@ -1,3 +1,19 @@
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from category.models import Category
+
+
+class CategoryConditionalTest(TestCase):
+
+    def test_category_change_invalidates_etag(self):
+        category, client = Category.objects.create(name='phones'), APIClient()
+        url = f'/api/v1/categories/{category.slug}/'
+        response = client.get(url)
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        # У категорий нет дат: ETag держится на версии тега 'categories'
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='cases', parent=category)
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        self.assertEqual(client.get('/api/v1/categories/missing/').status_code, 404)
@@ -1,5 +1,5 @@
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
+from config.cache import cache_response, get_tag_versions
+from config.conditional import conditional_response
 from rest_framework import generics, permissions
 from . import serializers
 from .models import Category
@@ -17,13 +17,13 @@ class CategoryCreateListView(generics.ListCreateAPIView):
     Примечание:
     - Представление позволяет создавать новые категории и просматривать список существующих.
     - Разрешено только администраторам (IsAdminUser) создавать новые категории.
-    - При просмотре списка категорий применено кеширование на 1 минуту.
+    - Список категорий кешируется до изменения категорий (тег 'categories').
     """
     queryset = Category.objects.all()  # QuerySet, содержащий все объекты модели Category.
     serializer_class = serializers.CategorySerializer  # Сериализатор для преобразования данных категории.
     permission_classes = (permissions.IsAdminUser, )  # Только администраторам разрешено создавать категории.
 
-    @method_decorator(cache_page(60))  # Кеширование списка на 1 минуту.
+    @cache_response(tags=('categories',))  # Кеширование списка до изменения категорий.
     def list(self, request, *args, **kwargs):
         """
         Метод для получения списка категорий.
@@ -48,6 +48,13 @@ class CategoryCreateListView(generics.ListCreateAPIView):
         return permissions.IsAdminUser(),  # Только администраторам разрешено создавать новые категории.
 
 
+def category_state(view, request, pk=None, **kwargs):
+    """
+    Состояние категории для ETag: у категорий нет дат, поэтому используется версия тега 'categories'.
+    """
+    return (pk, get_tag_versions(('categories',))), None
+
+
 class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
     Представление для просмотра, обновления и удаления отдельной категории товаров.
@@ -64,6 +71,10 @@ class CategoryDetailView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Category.objects.all()  # QuerySet, содержащий все объекты модели Category.
     serializer_class = serializers.CategorySerializer  # Сериализатор для преобразования данных категории.
 
+    @conditional_response(category_state)  # 304, если категории не менялись с прошлого запроса клиента.
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
     def get_permissions(self):
         """
         Возвращает список прав доступа для каждого метода представления.
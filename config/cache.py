@@ -0,0 +1,180 @@
+import hashlib
+import time
+import uuid
+from functools import wraps
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.http import HttpResponse
+
+# Версия тега: меняется при любом изменении моделей с этим тегом
+CACHE_TAG_KEY = 'cache:tag:{}'
+CACHE_RESPONSE_KEY = 'cache:response:{}:{}'
+# Ответы хранятся долго: устаревание определяется версиями тегов, а не временем жизни
+CACHE_RESPONSE_TIMEOUT = 6 * 60 * 60
+# Сколько один процесс может пересобирать ответ, пока остальные отдают предыдущую версию
+CACHE_REBUILD_LOCK_TIMEOUT = 30
+# Сколько ждать ответа, который собирает другой процесс, если предыдущей версии нет (холодный промах)
+CACHE_COLD_WAIT = 2
+CACHE_COLD_POLL_INTERVAL = 0.05
+
+
+def _new_version():
+    # Версия от времени не повторяется, даже если ключ тега вытеснен из Redis
+    return time.time_ns()
+
+
+def get_tag_versions(tags):
+    """
+    Возвращает текущие версии тегов, создавая отсутствующие.
+
+    Возвращает:
+    - tuple: Версии в порядке tags.
+    """
+    keys = [CACHE_TAG_KEY.format(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = _new_version()
+            versions[key] = version if cache.add(key, version, timeout=None) else cache.get(key, version)
+    return tuple(versions[key] for key in keys)
+
+
+def bump_tags(*tags):
+    """
+    Делает недействительными все закешированные ответы с указанными тегами.
+    """
+    for tag in tags:
+        key = CACHE_TAG_KEY.format(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), timeout=None)
+
+
+def deleted_with(origin, model):
+    """
+    Проверяет, что объект удаляется каскадом вместе с объектами модели model.
+
+    Аргументы:
+    - origin: Аргумент origin сигналов pre_delete/post_delete (объект или QuerySet, с которого началось удаление).
+    - model (Model): Родительская модель.
+    """
+    return (origin.model if isinstance(origin, QuerySet) else type(origin)) is model
+
+
+def register_cache_tags(model, *tags, cascade_from=None):
+    """
+    Подключает сброс тегов к сигналам post_save и post_delete модели.
+
+    Теги сбрасываются после фиксации транзакции, чтобы параллельный запрос
+    не закешировал под новой версией ещё не сохранённые данные.
+
+    Аргументы:
+    - model (Model): Модель, изменения которой сбрасывают теги.
+    - *tags (str | callable): Теги; функция получает сохранённый объект и возвращает тег
+      (например, тег владельца) или None.
+    - cascade_from (Model): Родительская модель, сигнал которой сам сбрасывает эти теги:
+      при каскадном удалении вместе с ней теги не вычисляются для каждой записи.
+
+    Примечание:
+    - bulk_create, update() и другие массовые операции сигналов не вызывают,
+      после них нужно вызывать bump_tags явно.
+    """
+    def handler(sender, instance, **kwargs):
+        if cascade_from is not None and deleted_with(kwargs.get('origin'), cascade_from):
+            return
+        names = [tag(instance) if callable(tag) else tag for tag in tags]
+        transaction.on_commit(lambda: bump_tags(*filter(None, names)))
+
+    post_save.connect(handler, sender=model, weak=False, dispatch_uid=f'cache_tags_save_{model._meta.label}')
+    post_delete.connect(handler, sender=model, weak=False, dispatch_uid=f'cache_tags_delete_{model._meta.label}')
+
+
+def response_cache_key(view_method, request, per_user=False):
+    """
+    Ключ закешированного ответа: путь с параметрами запроса, формат ответа и (при per_user) пользователь.
+    """
+    renderer = getattr(request, 'accepted_renderer', None)
+    user = request.user.pk if per_user and request.user.is_authenticated else None
+    digest = hashlib.md5(f'{request.get_full_path()}|{getattr(renderer, "format", "")}|{user}'.encode())
+    return CACHE_RESPONSE_KEY.format(view_method.__qualname__, digest.hexdigest())
+
+
+def _wait_for_entry(key):
+    deadline = time.monotonic() + CACHE_COLD_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(CACHE_COLD_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def _entry_response(entry):
+    _, content, status, content_type = entry
+    return HttpResponse(content, status=status, content_type=content_type)
+
+
+def _release_lock(lock, token):
+    # Блокировка могла истечь и достаться другому процессу: удаляем только свою
+    if token is not None and cache.get(lock) == token:
+        cache.delete(lock)
+
+
+def cache_response(tags, timeout=CACHE_RESPONSE_TIMEOUT, per_user=False):
+    """
+    Декоратор метода DRF-представления: кеширует ответ GET до изменения моделей с тегами tags.
+
+    Ключ строится из пути с параметрами запроса, формата ответа и (при per_user) пользователя;
+    версии тегов хранятся внутри записи. Когда версия устарела, ответ пересобирает только
+    один процесс, остальные до его завершения получают предыдущий ответ. Если предыдущего
+    ответа нет, остальные до CACHE_COLD_WAIT секунд ждут ответ этого процесса и только
+    потом собирают его сами.
+
+    Аргументы:
+    - tags (tuple | callable): Теги моделей, от которых зависит ответ (например, ('products', 'categories')),
+      или функция запроса, возвращающая теги (например, теги текущего пользователя).
+    - timeout (int): Время жизни записи в секундах.
+    - per_user (bool): Кешировать ответ отдельно для каждого пользователя.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_method(self, request, *args, **kwargs)
+            key = response_cache_key(view_method, request, per_user)
+            versions = get_tag_versions(tags(request) if callable(tags) else tags)
+
+            entry = cache.get(key)
+            if entry is not None and entry[0] == versions:
+                return _entry_response(entry)
+            lock, token = f'{key}:lock', uuid.uuid4().hex
+            if not cache.add(lock, token, CACHE_REBUILD_LOCK_TIMEOUT):
+                # Ответ уже собирает другой процесс: отдаём предыдущую версию или недолго ждём новую
+                entry = entry or _wait_for_entry(key)
+                if entry is not None:
+                    return _entry_response(entry)
+                token = None
+
+            try:
+                response = view_method(self, request, *args, **kwargs)
+            except Exception:
+                _release_lock(lock, token)
+                raise
+
+            def store(rendered):
+                if rendered.status_code == 200:
+                    cache.set(key, (versions, rendered.content, rendered.status_code, rendered['Content-Type']),
+                              timeout)
+                _release_lock(lock, token)
+
+            if hasattr(response, 'add_post_render_callback'):
+                response.add_post_render_callback(store)
+            else:
+                store(response)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,47 @@
+import hashlib
+from functools import wraps
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+def conditional_response(get_state):
+    """
+    Декоратор метода DRF-представления: поддержка условных GET по ETag и Last-Modified.
+
+    Состояние объекта вычисляется функцией get_state без сериализатора (одним
+    лёгким запросом), поэтому запросы с If-None-Match / If-Modified-Since для
+    неизменившегося объекта получают 304 без сборки тела ответа.
+
+    Аргументы:
+    - get_state (callable): get_state(view, request, *args, **kwargs) -> (parts, last_modified) или None,
+      если объект не найден. parts - значения, от которых зависит ответ (из них строится ETag),
+      last_modified - datetime последнего изменения или None.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_method(self, request, *args, **kwargs)
+            state = get_state(self, request, *args, **kwargs)
+            if state is None:
+                return view_method(self, request, *args, **kwargs)
+            parts, last_modified = state
+            renderer = getattr(request, 'accepted_renderer', None)
+            # Параметры запроса (?fields=, ?omit=) меняют тело ответа, поэтому входят в ETag
+            parts = (*parts, getattr(renderer, 'format', ''), request.GET.urlencode())
+            etag = quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+            timestamp = int(last_modified.timestamp()) if last_modified else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = view_method(self, request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+                if timestamp is not None:
+                    response['Last-Modified'] = http_date(timestamp)
+                # Ответ может зависеть от пользователя (лайки, избранное)
+                patch_vary_headers(response, ('Authorization', 'Cookie'))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,138 @@
+import csv
+import sys
+import zlib
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+EXPORT_FORMATS = ('csv', 'jsonl')
+EXPORT_CHUNK_SIZE = 2000
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson; charset=utf-8'}
+
+
+class Echo:
+    # Псевдо-файл для csv.writer: возвращает строку вместо записи в буфер
+    def write(self, value):
+        return value
+
+
+def iter_rows(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Читает строки через серверный курсор, не загружая таблицу в память.
+    """
+    return queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+def iter_lines(queryset, fields, file_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Построчно форматирует выгрузку в CSV или JSONL.
+
+    Аргументы:
+    - queryset (QuerySet): Выгружаемые записи.
+    - fields (tuple): Поля (в том числе через "__"), они же заголовки колонок.
+    - file_format (str): 'csv' или 'jsonl'.
+    - chunk_size (int): Количество строк, получаемых из базы за раз.
+
+    Возвращает:
+    - generator: Строки файла.
+    """
+    rows = iter_rows(queryset, fields, chunk_size)
+    if file_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow(row)
+        return
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(fields, row))) + '\n'
+
+
+def iter_export(queryset, fields, file_format, compress=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Формирует выгрузку блоками байтов фиксированного размера (опционально в gzip).
+
+    Возвращает:
+    - generator: Блоки bytes, пригодные для StreamingHttpResponse или записи в файл.
+    """
+    # wbits=31 - формат gzip, который открывается обычными архиваторами
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buffer, size = [], 0
+    for line in iter_lines(queryset, fields, file_format, chunk_size):
+        data = line.encode()
+        buffer.append(data)
+        size += len(data)
+        if size >= 64 * 1024:
+            block = b''.join(buffer)
+            buffer, size = [], 0
+            block = compressor.compress(block) if compressor else block
+            if block:
+                yield block
+    block = b''.join(buffer)
+    if compressor:
+        block = compressor.compress(block) + compressor.flush()
+    if block:
+        yield block
+
+
+def export_response(queryset, fields, file_format, filename, compress=False):
+    """
+    Возвращает потоковый HTTP-ответ с выгрузкой в виде файла.
+
+    Аргументы:
+    - queryset (QuerySet): Выгружаемые записи.
+    - fields (tuple): Выгружаемые поля.
+    - file_format (str): 'csv' или 'jsonl'.
+    - filename (str): Имя файла без расширения.
+    - compress (bool): Сжать выгрузку в gzip.
+    """
+    filename = f'{filename}.{file_format}'
+    content_type = CONTENT_TYPES[file_format]
+    if compress:
+        filename, content_type = f'{filename}.gz', 'application/gzip'
+    response = StreamingHttpResponse(iter_export(queryset, fields, file_format, compress), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def export_request_options(request):
+    """
+    Разбирает параметры выгрузки из запроса: ?file_format=csv|jsonl&gzip=1.
+
+    Возвращает:
+    - tuple: (формат | None, если формат неизвестен, признак сжатия).
+    """
+    file_format = request.query_params.get('file_format', 'csv')
+    compress = request.query_params.get('gzip', '').lower() in ('1', 'true', 'yes')
+    return (file_format if file_format in EXPORT_FORMATS else None), compress
+
+
+class ExportCommand(BaseCommand):
+    """
+    Базовая команда выгрузки: наследники задают fields и get_queryset.
+    """
+    fields = ()
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-', help='Output file ("-" for stdout)')
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv', help='Output format')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE,
+                            help='Rows fetched from the database per round trip')
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def handle(self, *args, **options):
+        blocks = iter_export(self.get_queryset(), self.fields, options['format'], options['gzip'],
+                             options['chunk_size'])
+        if options['path'] == '-':
+            for block in blocks:
+                sys.stdout.buffer.write(block)
+            sys.stdout.buffer.flush()
+            return
+        with open(options['path'], 'wb') as output:
+            for block in blocks:
+                output.write(block)
+        self.stderr.write(self.style.SUCCESS(f'Exported to {options["path"]}'))
@@ -0,0 +1,98 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_KEY = 'idempotency:{}:{}:{}'
+# Сколько хранится ответ: повтор с тем же ключом в течение суток вернёт исходный ответ
+IDEMPOTENCY_TIMEOUT = 24 * 60 * 60
+# Время жизни блокировки на случай падения процесса во время обработки
+IDEMPOTENCY_LOCK_TIMEOUT = 30
+# Сколько параллельный дубликат ждёт ответа первого запроса, прежде чем вернуть 409
+IDEMPOTENCY_WAIT = 10
+IDEMPOTENCY_POLL_INTERVAL = 0.1
+IDEMPOTENCY_MAX_KEY_LENGTH = 255
+
+
+def _replay(entry):
+    _, status_code, content, content_type = entry
+    response = HttpResponse(content, status=status_code, content_type=content_type)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(scope, timeout=IDEMPOTENCY_TIMEOUT):
+    """
+    Декоратор метода DRF-представления: повтор запроса с тем же заголовком Idempotency-Key
+    возвращает сохранённый ответ первого запроса, не выполняя метод повторно.
+
+    Ключ действует в пределах пользователя. Вместе с ответом хранится отпечаток тела
+    запроса: тот же ключ с другим телом отклоняется (422). Пока первый запрос выполняется,
+    дубликаты ждут его ответа под блокировкой cache.add. Ответы 4xx сохраняются, в том числе
+    построенные из исключений DRF (ValidationError и т.п.); ответы 5xx не сохраняются,
+    такой запрос можно повторить с тем же ключом.
+
+    Аргументы:
+    - scope (str): Имя операции в ключе кеша (например, 'orders').
+    - timeout (int): Время хранения ответа в секундах.
+
+    Примечание:
+    - Запросы без заголовка обрабатываются как обычно.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not idempotency_key:
+                return view_method(self, request, *args, **kwargs)
+            if len(idempotency_key) > IDEMPOTENCY_MAX_KEY_LENGTH:
+                return Response(f'{IDEMPOTENCY_HEADER} is too long', status=status.HTTP_400_BAD_REQUEST)
+
+            user = request.user.pk if request.user.is_authenticated else None
+            key = IDEMPOTENCY_KEY.format(scope, user, hashlib.sha256(idempotency_key.encode()).hexdigest())
+            fingerprint = hashlib.sha256(request.method.encode() + request.get_full_path().encode()
+                                         + request.body).hexdigest()
+
+            deadline = time.monotonic() + IDEMPOTENCY_WAIT
+            while True:
+                entry = cache.get(key)
+                if entry is not None:
+                    if entry[0] != fingerprint:
+                        return Response(f'{IDEMPOTENCY_HEADER} was already used with a different request',
+                                        status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+                    return _replay(entry)
+                if cache.add(f'{key}:lock', 1, IDEMPOTENCY_LOCK_TIMEOUT):
+                    break
+                if time.monotonic() >= deadline:
+                    return Response('A request with this idempotency key is still in progress',
+                                    status=status.HTTP_409_CONFLICT)
+                time.sleep(IDEMPOTENCY_POLL_INTERVAL)
+
+            try:
+                response = view_method(self, request, *args, **kwargs)
+            except APIException as error:
+                # Ответ на ошибку строим здесь, чтобы сохранить его так же, как обычный ответ
+                response = self.handle_exception(error)
+            except Exception:
+                cache.delete(f'{key}:lock')
+                raise
+
+            def store(rendered):
+                if rendered.status_code < 500:
+                    cache.set(key, (fingerprint, rendered.status_code, rendered.content, rendered['Content-Type']),
+                              timeout)
+                cache.delete(f'{key}:lock')
+
+            if hasattr(response, 'add_post_render_callback'):
+                response.add_post_render_callback(store)
+            else:
+                store(response)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,59 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class CursorOptInPagination(PageNumberPagination):
+    """
+    Постраничная пагинация с опциональным режимом курсора (keyset).
+
+    По умолчанию работает как PageNumberPagination (?page=N), чтобы старые клиенты
+    не заметили изменений. Если в запросе передан ?pagination=cursor или ?cursor=...,
+    используется CursorPagination: без COUNT(*) и OFFSET, со стабильными
+    непрозрачными курсорами в ссылках next/previous.
+
+    Атрибуты:
+    - cursor_ordering (tuple): Сортировка для режима курсора, первое поле должно
+      быть неизменяемым и покрываться индексом.
+    - cursor_conflicting_params (tuple): Параметры запроса, задающие другую сортировку
+      (?ordering=, поиск по релевантности); вместе с курсором они дают 400, а не
+      молча заменяются сортировкой cursor_ordering.
+    """
+    cursor_query_param = 'cursor'
+    mode_query_param = 'pagination'
+    cursor_ordering = ('id',)
+    cursor_conflicting_params = ()
+
+    def use_cursor(self, request):
+        params = request.query_params
+        return params.get(self.mode_query_param) == 'cursor' or self.cursor_query_param in params
+
+    def get_cursor_paginator(self):
+        paginator = CursorPagination()
+        paginator.page_size = self.page_size
+        paginator.ordering = self.cursor_ordering
+        paginator.cursor_query_param = self.cursor_query_param
+        return paginator
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.use_cursor(request):
+            conflicting = [param for param in self.cursor_conflicting_params if request.query_params.get(param)]
+            if conflicting:
+                raise ValidationError({self.mode_query_param: (
+                    f'cursor pagination is ordered by {", ".join(self.cursor_ordering)} '
+                    f'and cannot be combined with: {", ".join(conflicting)}')})
+            self.cursor_paginator = self.get_cursor_paginator()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_schema_fields(self, view):
+        return super().get_schema_fields(view) + self.get_cursor_paginator().get_schema_fields(view)
+
+    def get_schema_operation_parameters(self, view):
+        return (super().get_schema_operation_parameters(view)
+                + self.get_cursor_paginator().get_schema_operation_parameters(view))
@@ -0,0 +1,56 @@
+from rest_framework import serializers
+
+
+class SparseFieldsetMixin:
+    """
+    Выбор полей ответа параметрами запроса ?fields=a,b и ?omit=c,d.
+
+    Лишние поля удаляются в get_fields до сериализации, поэтому их источники и
+    SerializerMethodField не вычисляются. Блоки, которые сериализатор добавляет
+    в to_representation сам, перечисляются в computed_fields и проверяются через wants().
+
+    Атрибуты:
+    - computed_fields (tuple): Имена блоков, которые добавляются в to_representation.
+
+    Примечание:
+    - Выбор действует только для GET и только на верхнем уровне ответа (не для вложенных сериализаторов).
+    """
+    fields_query_param = 'fields'
+    omit_query_param = 'omit'
+    computed_fields = ()
+
+    def _query_names(self, request, param):
+        value = request.query_params.get(param)
+        if value is None:
+            return None
+        return {name.strip() for name in value.split(',') if name.strip()}
+
+    def get_field_selection(self):
+        # Возвращает (fields | None, omit); None в fields означает "все поля"
+        if hasattr(self, '_field_selection'):
+            return self._field_selection
+        selection = (None, set())
+        request = self.context.get('request')
+        root = self.parent is None or (isinstance(self.parent, serializers.ListSerializer) and self.parent.parent is None)
+        if root and request is not None and request.method == 'GET' and hasattr(request, 'query_params'):
+            selection = (self._query_names(request, self.fields_query_param),
+                         self._query_names(request, self.omit_query_param) or set())
+        self._field_selection = selection
+        return selection
+
+    def wants(self, *names):
+        """
+        Проверяет, нужен ли в ответе хотя бы один из блоков names.
+        """
+        fields, omit = self.get_field_selection()
+        return any((fields is None or name in fields) and name not in omit for name in names)
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected, omit = self.get_field_selection()
+        if selected is None and not omit:
+            return fields
+        for name in list(fields):
+            if not self.wants(name):
+                fields.pop(name)
+        return fields
@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # installed Apps
     'rest_framework',
@@ -213,7 +214,17 @@ CACHES = {
         'OPTIONS': {
             'CLIENT_CLASS': 'django_redis.client.DefaultClient',
         }
-    }
+    },
+    # Лайки, ещё не сброшенные в базу, хранятся только здесь (product.likes), поэтому отдельно от кеша:
+    # cache.clear() их не затрагивает. Политика вытеснения задаётся на весь сервер Redis, поэтому
+    # в продакшене это отдельный инстанс с maxmemory-policy noeviction
+    'likes': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': config('LIKES_REDIS_URL', default='redis://127.0.0.1:6379/1'),
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        }
+    },
 }
 
 REDIS_HOST = '127.0.0.1'
@@ -236,6 +247,37 @@ CELERY_RESULT_SERIALIZER = 'json'
 #     },
 # }
 
+CELERY_BEAT_SCHEDULE = {
+    'refresh_leaderboards': {
+        'task': 'product.tasks.refresh_leaderboards_task',
+        'schedule': crontab(minute='*/15'),  # Пересчёт списков лучших продуктов каждые 15 минут
+    },
+    'flush_likes': {
+        'task': 'product.tasks.flush_likes_task',
+        'schedule': crontab(minute='*'),  # Перенос лайков из Redis в базу каждую минуту
+    },
+    'save_trending_snapshot': {
+        'task': 'product.tasks.save_trending_snapshot_task',
+        'schedule': crontab(minute='*/10'),  # Снимок популярных сейчас продуктов каждые 10 минут
+    },
+    'compute_recommendations': {
+        'task': 'product.tasks.compute_recommendations_task',
+        'schedule': crontab(hour=3, minute=0),  # Пересчёт персональных рекомендаций каждую ночь
+    },
+    'send_order_notifications': {
+        'task': 'order.tasks.send_order_notifications_task',
+        'schedule': crontab(minute='*/5'),  # Повторная отправка писем о заказах, не ушедших сразу
+    },
+    'update_sales_rollups': {
+        'task': 'order.tasks.update_sales_rollups_task',
+        'schedule': crontab(minute='*/10'),  # Дневные итоги продаж по новым и изменённым заказам
+    },
+    'compute_bought_together': {
+        'task': 'order.tasks.compute_bought_together_task',
+        'schedule': crontab(hour=3, minute=30),  # Полный пересчёт пар "покупают вместе" каждую ночь
+    },
+}
+
 # -----> LOGGING
 ENABLE_DECORATOR_LOGGING = os.getenv('ENABLE_DECORATOR_LOGGING', True)
 
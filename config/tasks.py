@@ -1,22 +1,4 @@
-from account.send_mail import send_notification
-from .celery import app
-
-
-@app.task
-def send_notification_task(user_email, order_id, price):
-    """
-    Асинхронная задача для отправки уведомления пользователю о создании заказа.
-
-    Аргументы:
-    - user_email (str): Электронный адрес пользователя, которому отправляется уведомление.
-    - order_id (int): Номер созданного заказа.
-    - price (float): Полная стоимость заказа.
-
-    Примечание:
-    - Задача запускается в фоновом режиме с помощью Celery.
-    - Отправляет уведомление о создании заказа на указанный электронный адрес.
-    """
-    send_notification(user_email, order_id, price)
+# Письма о заказах отправляет order.tasks.send_order_notifications_task из очереди OrderNotification
 
 
 #---------
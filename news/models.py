@@ -1,5 +1,7 @@
 from django.db import models
 
+from config.cache import register_cache_tags
+
 class News(models.Model):
     """
     Модель новостей.
@@ -22,10 +24,18 @@ class News(models.Model):
     class Meta:
         verbose_name = 'news'
         verbose_name_plural = 'news'
+        indexes = [
+            # Покрывает сортировку ленты и keyset-пагинацию по (-created_at, -id)
+            models.Index(fields=['-created_at', '-id'], name='news_created_id_idx'),
+        ]
 
     def __str__(self):
         return f'{self.id} {self.title} {self.created_at}'
 
+
+# Закешированная лента новостей сбрасывается при изменении новостей
+register_cache_tags(News, 'news')
+
 # from django.db import models
 #
 #
@@ -1,9 +1,11 @@
 from rest_framework import serializers
 
+from config.serializers import SparseFieldsetMixin
+
 from .models import News
 
 
-class NewsSerializer(serializers.ModelSerializer):
+class NewsSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Сериализатор для модели новостей.
 
@@ -15,6 +17,7 @@ class NewsSerializer(serializers.ModelSerializer):
     - В данном случае используется 'serializers.ModelSerializer', который автоматически
       создает сериализатор на основе модели и ее полей, указанных в 'fields'.
       Это позволяет автоматически обрабатывать данные, сохраняя поля и связи модели.
+    - Поля ответа можно ограничить параметрами ?fields= и ?omit= (SparseFieldsetMixin).
     """
     class Meta:
         model = News
@@ -1,3 +1,57 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from news.models import News
+from news.views import StandartResultPagination
+
+
+class NewsTestMixin:
+    """
+    Общие данные тестов новостей: лента из нескольких новостей с разными датами.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.news = []
+        for index in range(5):
+            news = News.objects.create(title=f'news {index}', image='https://example.com/image.png', text='text')
+            News.objects.filter(pk=news.pk).update(created_at=timezone.now() - timedelta(hours=index))
+            self.news.append(news)
+
+
+class NewsPaginationTest(NewsTestMixin, TestCase):
+
+    def test_cursor_mode_follows_feed_order(self):
+        client, pages, url, params = APIClient(), [], '/api/v1/news/', {'pagination': 'cursor'}
+        with mock.patch.object(StandartResultPagination, 'page_size', 2):
+            while url:
+                data = client.get(url, params).json()
+                self.assertNotIn('count', data)
+                pages.append([news['id'] for news in data['results']])
+                url, params = data['next'], None
+        self.assertEqual(pages, [[news.id for news in self.news[start:start + 2]] for start in (0, 2, 4)])
+        self.assertEqual(client.get('/api/v1/news/').json()['count'], 5)
+
+
+class NewsConditionalTest(NewsTestMixin, TestCase):
+
+    def test_edit_changes_etag_without_last_modified(self):
+        news, client = News.objects.get(pk=self.news[0].pk), APIClient()
+        url = f'/api/v1/news/{news.id}/'
+        response = client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertNotEqual(client.get(url, {'format': 'json'})['ETag'], response['ETag'])
 
-# Create your tests here.
+        # Правка не меняет created_at, но сбрасывает версию тега 'news'
+        news.title = 'edited'
+        with self.captureOnCommitCallbacks(execute=True):
+            news.save()
+        response = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((response.status_code, response.json()['title']), (200, 'edited'))
+        self.assertEqual(client.get('/api/v1/news/0/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 404)
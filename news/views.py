@@ -1,29 +1,46 @@
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
 from rest_framework import permissions
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.response import Response
 from requests import get
 from multiprocessing import Pool
 
+from config.cache import cache_response, get_tag_versions
+from config.conditional import conditional_response
+from config.pagination import CursorOptInPagination
 from . import serializers
 from .models import News
 from .tasks import parsing
 
 
 # Класс для пагинации результатов
-class StandartResultPagination(PageNumberPagination):
+class StandartResultPagination(CursorOptInPagination):
     """
     Пагинация результатов запроса.
 
     Атрибуты:
     - page_size (int): Количество элементов на странице (по умолчанию 10).
     - page_query_param (str): Название параметра запроса для указания номера страницы (по умолчанию 'page').
+    - cursor_ordering (tuple): Сортировка в режиме курсора (?pagination=cursor), совпадает с сортировкой queryset.
     """
     page_size = 10
     page_query_param = 'page'
+    cursor_ordering = ('-created_at', '-id')
+
+
+def news_state(view, request, pk=None, **kwargs):
+    """
+    Состояние новости для ETag: дата создания и версия тега 'news' (меняется при правках).
+
+    Last-Modified не отдаётся: правка не меняет created_at, и If-Modified-Since давал бы устаревший 304.
+    """
+    try:
+        row = News.objects.filter(pk=pk).values_list('id', 'created_at').first()
+    except (TypeError, ValueError):
+        return None
+    if row is None:
+        return None
+    return (*row, get_tag_versions(('news',))), None
 
 
 # Ваш ViewSet для модели News
@@ -38,10 +55,10 @@ class NewsViewSet(ModelViewSet):
 
     Методы:
     - get_permissions: Возвращает список разрешений в зависимости от типа запроса.
-    - list: Переопределенный метод для получения списка объектов News с кешированием на 1 минуту.
+    - list: Переопределенный метод для получения списка объектов News с кешированием до изменения новостей.
     - parse_news: Метод действия API для запуска асинхронной задачи парсинга новостей.
     """
-    queryset = News.objects.all().order_by('-created_at')
+    queryset = News.objects.all().order_by('-created_at', '-id')
     pagination_class = StandartResultPagination
     serializer_class = serializers.NewsSerializer
 
@@ -60,17 +77,27 @@ class NewsViewSet(ModelViewSet):
             return [permissions.AllowAny(), ]
         return [permissions.IsAdminUser(), ]
 
-    # Декоратор cache_page для кеширования результатов на 1 минуту
-    @method_decorator(cache_page(60))
+    # Ответ кешируется до изменения новостей (тег 'news')
+    @cache_response(tags=('news',))
     def list(self, request, *args, **kwargs):
         """
-        Метод для получения списка объектов News с кешированием на 1 минуту.
+        Метод для получения списка объектов News с кешированием до изменения новостей.
 
         Возвращает:
         - super().list(request, *args, **kwargs): Результат выполнения родительского метода list.
         """
         return super().list(request, *args, **kwargs)
 
+    @conditional_response(news_state)
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Метод для получения новости с поддержкой условных запросов по ETag.
+
+        Возвращает:
+        - Response: Новость или 304, если она не изменилась с прошлого запроса клиента.
+        """
+        return super().retrieve(request, *args, **kwargs)
+
     @action(detail=False, methods=['GET'])
     def parse_news(self, request, *args, **kwargs):
         """
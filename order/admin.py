@@ -1,6 +1,7 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
 from order.models import Order, OrderItem
+from order.state import transition_orders
 
 
 class OrderItemAdmin(admin.TabularInline):
@@ -11,3 +12,21 @@ class OrderItemAdmin(admin.TabularInline):
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     inlines = [OrderItemAdmin, ]
+    list_display = ('id', 'user', 'status', 'total_sum', 'created_at')
+    list_filter = ('status',)
+    actions = ('mark_in_process', 'mark_closed')
+
+    def transition(self, request, queryset, status):
+        # Один UPDATE и одна пачка уведомлений вместо сохранения каждого заказа
+        updated, skipped = transition_orders(queryset.values_list('id', flat=True), status)
+        self.message_user(request, f'Переведено заказов: {len(updated)}')
+        if skipped:
+            self.message_user(request, f'Пропущено (переход не разрешён): {len(skipped)}', messages.WARNING)
+
+    @admin.action(description='Перевести в статус "В обработке"')
+    def mark_in_process(self, request, queryset):
+        self.transition(request, queryset, 'in_process')
+
+    @admin.action(description='Перевести в статус "Закрыт"')
+    def mark_closed(self, request, queryset):
+        self.transition(request, queryset, 'closed')
@@ -0,0 +1,152 @@
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, Max, Min, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import DailyCategorySales, DailySales, DailySellerSales, Order, OrderItem, SalesRollupState
+
+# Заказы моложе этого срока ещё не учитываются: их транзакция может быть не зафиксирована
+ROLLUP_LAG = timedelta(minutes=5)
+ROLLUP_LOCK = 'sales_rollups:lock'
+# Группировки аналитики: таблица итогов и поле группы
+ANALYTICS_GROUPS = {
+    'day': (DailySales, 'day'),
+    'category': (DailyCategorySales, 'category_id'),
+    'owner': (DailySellerSales, 'owner_id'),
+}
+
+
+def day_bounds(day):
+    # Начало и конец дня в часовом поясе проекта: фильтр по диапазону использует индекс created_at
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def get_state():
+    state, _ = SalesRollupState.objects.get_or_create(pk=1)
+    return state
+
+
+def mark_dirty_day(day):
+    """
+    Отмечает день для пересчёта (удалённые заказы не видны по updated_at).
+    """
+    with transaction.atomic():
+        state, _ = SalesRollupState.objects.select_for_update().get_or_create(pk=1)
+        if day.isoformat() not in state.dirty_days:
+            state.dirty_days.append(day.isoformat())
+            state.save(update_fields=['dirty_days'])
+
+
+def _totals():
+    # Выручка по цене на момент заказа; у старых позиций без цены - по текущей цене продукта
+    revenue = Sum(F('quantity') * Coalesce('price', 'product__price'), output_field=DecimalField())
+    return {'revenue_sum': Coalesce(revenue, Value(0), output_field=DecimalField()),
+            'units_sum': Coalesce(Sum('quantity'), 0), 'orders_count': Count('order_id', distinct=True)}
+
+
+def rebuild_day(day):
+    """
+    Пересчитывает итоги одного дня из позиций заказов (три агрегирующих запроса).
+
+    Пересчёт дня целиком, а не прибавление разницы, одинаково обрабатывает новые,
+    изменённые и удалённые заказы.
+    """
+    start, end = day_bounds(day)
+    items = OrderItem.objects.filter(order__created_at__gte=start, order__created_at__lt=end).order_by()
+    total = items.aggregate(**_totals())
+    by_category = items.values('product__category_id').annotate(**_totals())
+    by_owner = items.values('product__owner_id').annotate(**_totals())
+    with transaction.atomic():
+        for model in (DailySales, DailyCategorySales, DailySellerSales):
+            model.objects.filter(day=day).delete()
+        if total['orders_count']:
+            DailySales.objects.create(day=day, revenue=total['revenue_sum'], units=total['units_sum'],
+                                      orders=total['orders_count'])
+        DailyCategorySales.objects.bulk_create([
+            DailyCategorySales(day=day, category_id=row['product__category_id'], revenue=row['revenue_sum'],
+                               units=row['units_sum'], orders=row['orders_count'])
+            for row in by_category])
+        DailySellerSales.objects.bulk_create([
+            DailySellerSales(day=day, owner_id=row['product__owner_id'], revenue=row['revenue_sum'],
+                             units=row['units_sum'], orders=row['orders_count'])
+            for row in by_owner])
+
+
+def update_sales_rollups(full=False):
+    """
+    Обновляет дневные итоги продаж по заказам, созданным или изменённым после водяного знака.
+
+    Пересчитываются только дни, к которым относятся такие заказы, и дни удалённых заказов.
+
+    Аргументы:
+    - full (bool): Пересчитать все дни с первого заказа.
+
+    Возвращает:
+    - int: Количество пересчитанных дней.
+    """
+    if not cache.add(ROLLUP_LOCK, 1, timeout=30 * 60):
+        return 0
+    try:
+        state = get_state()
+        until = timezone.now() - ROLLUP_LAG
+        changed = Order.objects.filter(updated_at__lte=until)
+        if full:
+            bounds = Order.objects.aggregate(first=Min('created_at'), last=Max('created_at'))
+            days = set()
+            if bounds['first']:
+                first, last = (timezone.localtime(bounds[name]).date() for name in ('first', 'last'))
+                days = {first + timedelta(days=offset) for offset in range((last - first).days + 1)}
+        else:
+            if state.watermark is not None:
+                changed = changed.filter(updated_at__gt=state.watermark)
+            days = {timezone.localtime(created_at).date()
+                    for created_at in changed.values_list('created_at', flat=True).iterator()}
+        days |= {datetime.strptime(day, '%Y-%m-%d').date() for day in state.dirty_days}
+
+        for day in sorted(days):
+            rebuild_day(day)
+        with transaction.atomic():
+            state = SalesRollupState.objects.select_for_update().get(pk=state.pk)
+            # Дни, отмеченные во время пересчёта, останутся до следующего запуска
+            state.dirty_days = [day for day in state.dirty_days
+                                if datetime.strptime(day, '%Y-%m-%d').date() not in days]
+            state.watermark = until
+            state.save(update_fields=['dirty_days', 'watermark'])
+        return len(days)
+    finally:
+        cache.delete(ROLLUP_LOCK)
+
+
+def sales_analytics(date_from, date_to, group_by='day'):
+    """
+    Отвечает на запрос аналитики за период по таблицам итогов, не читая заказы.
+
+    Аргументы:
+    - date_from (date): Первый день периода.
+    - date_to (date): Последний день периода (включительно).
+    - group_by (str): 'day', 'category' или 'owner'.
+
+    Возвращает:
+    - dict: total - итоги периода, results - итоги по группам по убыванию выручки (по дням - по дате).
+
+    Примечание:
+    - При group_by='category' продажи относятся только к категории продукта: родительским
+      категориям они не добавляются, итоги по ветке дерева суммируются на клиенте.
+    """
+    model, group = ANALYTICS_GROUPS[group_by]
+    rows = model.objects.filter(day__gte=date_from, day__lte=date_to)
+    total = DailySales.objects.filter(day__gte=date_from, day__lte=date_to).aggregate(
+        revenue=Coalesce(Sum('revenue'), 0, output_field=DecimalField()), units=Coalesce(Sum('units'), 0),
+        orders=Coalesce(Sum('orders'), 0))
+    ordering = ('day',) if group_by == 'day' else ('-revenue', group)
+    results = rows.values(group).annotate(revenue=Sum('revenue'), units=Sum('units'),
+                                          orders=Sum('orders')).order_by(*ordering)
+    return {
+        'date_from': date_from, 'date_to': date_to, 'group_by': group_by, 'total': total,
+        'results': [{'key': row[group], 'revenue': row['revenue'], 'units': row['units'], 'orders': row['orders']}
+                    for row in results],
+    }
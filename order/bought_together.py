@@ -0,0 +1,142 @@
+import heapq
+from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import connection, transaction
+
+from product.models import Product
+from .models import BoughtTogether, BoughtTogetherOrder, OrderItem
+
+# Сколько продуктов "покупают вместе" хранится для каждого продукта при полном пересчёте
+BOUGHT_TOGETHER_TOP_K = 20
+# Предел количества пар в памяти при полном пересчёте: при превышении редкие пары отбрасываются
+BOUGHT_TOGETHER_MAX_PAIRS = 2_000_000
+BOUGHT_TOGETHER_BATCH_SIZE = 5000
+# Заказы с большим количеством позиций (оптовые) не говорят о совместном выборе товаров
+BASKET_MAX_SIZE = 50
+
+
+def iter_baskets(queryset=None, chunk_size=BOUGHT_TOGETHER_BATCH_SIZE):
+    """
+    Перебирает корзины заказов: множества product_id, сгруппированные по order_id.
+
+    Позиции читаются серверным курсором в порядке order_id, поэтому в памяти
+    одновременно находится только одна корзина.
+
+    Возвращает:
+    - generator: Отсортированные кортежи product_id одного заказа.
+    """
+    queryset = OrderItem.objects.all() if queryset is None else queryset
+    rows = queryset.order_by('order_id').values_list('order_id', 'product_id').iterator(chunk_size=chunk_size)
+    for _, items in groupby(rows, key=itemgetter(0)):
+        basket = tuple(sorted({product_id for _, product_id in items}))
+        if 1 < len(basket) <= BASKET_MAX_SIZE:
+            yield basket
+
+
+def count_pairs(baskets, max_pairs=BOUGHT_TOGETHER_MAX_PAIRS):
+    """
+    Считает, сколько раз каждая пара продуктов встречалась в одном заказе.
+
+    Память ограничена: когда пар становится больше max_pairs, из счётчика удаляются
+    пары с наименьшим количеством (порог растёт с каждой очисткой). Частые пары,
+    которые и попадают в top-k, при этом сохраняются.
+
+    Аргументы:
+    - baskets (iterable): Отсортированные кортежи product_id.
+    - max_pairs (int): Предел количества пар в счётчике.
+
+    Возвращает:
+    - dict: {(product_id, product_id): количество} для пар с a < b.
+    """
+    counts = defaultdict(int)
+    threshold = 0
+    for basket in baskets:
+        for index, first in enumerate(basket):
+            for second in basket[index + 1:]:
+                counts[first, second] += 1
+        if len(counts) > max_pairs:
+            while len(counts) > max_pairs // 2:
+                threshold += 1
+                counts = defaultdict(int, {pair: count for pair, count in counts.items() if count > threshold})
+    return counts
+
+
+def top_k_pairs(counts, k=BOUGHT_TOGETHER_TOP_K):
+    """
+    Отбирает для каждого продукта k самых частых соседей по корзине.
+
+    Для каждого продукта поддерживается куча размера k, поэтому память не зависит
+    от количества его пар.
+
+    Возвращает:
+    - dict: {product_id: [(other_id, количество), ...]} по убыванию количества.
+    """
+    heaps = defaultdict(list)
+    for (first, second), count in counts.items():
+        for product_id, other_id in ((first, second), (second, first)):
+            heap = heaps[product_id]
+            # При равном количестве выше продукт с меньшим id
+            item = (count, -other_id)
+            if len(heap) < k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+    return {product_id: [(-other_id, count) for count, other_id in sorted(heap, reverse=True)]
+            for product_id, heap in heaps.items()}
+
+
+def compute_bought_together(k=BOUGHT_TOGETHER_TOP_K, max_pairs=BOUGHT_TOGETHER_MAX_PAIRS,
+                            batch_size=BOUGHT_TOGETHER_BATCH_SIZE):
+    """
+    Полностью пересчитывает таблицу BoughtTogether по всем заказам.
+
+    Возвращает:
+    - int: Количество продуктов, для которых сохранены пары.
+    """
+    top = top_k_pairs(count_pairs(iter_baskets(chunk_size=batch_size), max_pairs), k)
+    with transaction.atomic():
+        existing = set(Product.objects.filter(id__in=top.keys()).values_list('id', flat=True))
+        BoughtTogether.objects.all().delete()
+        BoughtTogether.objects.bulk_create(
+            (BoughtTogether(product_id=product_id, other_id=other_id, count=count)
+             for product_id, others in top.items() if product_id in existing
+             for other_id, count in others if other_id in existing),
+            batch_size=batch_size)
+    return len(top)
+
+
+def record_order(order_id):
+    """
+    Добавляет пары продуктов нового заказа в таблицу BoughtTogether.
+
+    Пары записываются одним INSERT ... ON CONFLICT DO UPDATE SET count = count + 1:
+    параллельные заказы с одной и той же новой парой не теряют приращения.
+    Заказ отмечается в BoughtTogetherOrder в той же транзакции, поэтому повторная
+    доставка задачи ничего не меняет. Лишние пары сверх top-k остаются до следующего
+    полного пересчёта: выдача всё равно сортируется по количеству.
+
+    Аргументы:
+    - order_id (int): Идентификатор заказа.
+
+    Возвращает:
+    - int: Количество учтённых пар (в обе стороны); 0, если заказ уже учтён.
+
+    Примечание:
+    - Заказы, созданные во время полного пересчёта, могут быть учтены дважды или
+      пропущены; такие расхождения исправляет следующий ночной пересчёт.
+    """
+    basket = next(iter_baskets(OrderItem.objects.filter(order_id=order_id)), ())
+    pairs = sorted((first, second) for first in basket for second in basket if first != second)
+    with transaction.atomic():
+        _, created = BoughtTogetherOrder.objects.get_or_create(order_id=order_id)
+        if not created or not pairs:
+            return 0
+        table = connection.ops.quote_name(BoughtTogether._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (product_id, other_id, count) VALUES {", ".join(["(%s, %s, 1)"] * len(pairs))} '
+                f'ON CONFLICT (product_id, other_id) DO UPDATE SET count = {table}.count + 1',
+                [product_id for pair in pairs for product_id in pair])
+    return len(pairs)
@@ -0,0 +1,21 @@
+from django_filters import rest_framework as filters
+
+from .models import STATUS_CHOICES, Order
+
+
+class OrderFilter(filters.FilterSet):
+    """
+    Фильтры списка заказов.
+
+    Параметры запроса:
+    - created_after (datetime): Заказы, созданные не раньше указанного момента.
+    - created_before (datetime): Заказы, созданные не позже указанного момента.
+    - status (str): Статус заказа; можно передать несколько (?status=open&status=closed).
+    """
+    created_after = filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='gte')
+    created_before = filters.IsoDateTimeFilter(field_name='created_at', lookup_expr='lte')
+    status = filters.MultipleChoiceFilter(choices=STATUS_CHOICES)
+
+    class Meta:
+        model = Order
+        fields = ('created_after', 'created_before', 'status')
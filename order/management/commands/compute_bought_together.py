@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from order.bought_together import (BOUGHT_TOGETHER_BATCH_SIZE, BOUGHT_TOGETHER_MAX_PAIRS, BOUGHT_TOGETHER_TOP_K,
+                                   compute_bought_together)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the "frequently bought together" table from order item co-occurrence'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=BOUGHT_TOGETHER_TOP_K,
+                            help='Number of pairs stored per product')
+        parser.add_argument('--max-pairs', type=int, default=BOUGHT_TOGETHER_MAX_PAIRS,
+                            help='Maximum number of pair counters kept in memory')
+        parser.add_argument('--batch-size', type=int, default=BOUGHT_TOGETHER_BATCH_SIZE,
+                            help='Rows fetched and inserted per round trip')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        products = compute_bought_together(options['top'], options['max_pairs'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Bought-together pairs computed for {products} products in {time.perf_counter() - started:.1f} s'))
+
+# пересчёт пар "покупают вместе"
+# python manage.py compute_bought_together
@@ -0,0 +1,13 @@
+from config.exports import ExportCommand
+from order.models import ORDER_EXPORT_FIELDS, OrderItem
+
+
+class Command(ExportCommand):
+    help = 'Stream orders (one row per order item) to CSV/JSONL using a server-side cursor'
+    fields = ORDER_EXPORT_FIELDS
+
+    def get_queryset(self):
+        return OrderItem.objects.order_by('order_id', 'id')
+
+# выгрузка заказов в JSONL
+# python manage.py export_orders orders.jsonl --format jsonl
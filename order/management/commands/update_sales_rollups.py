@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from order.analytics import update_sales_rollups
+
+
+class Command(BaseCommand):
+    help = 'Update daily sales rollups from orders created or changed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild every day since the first order')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        days = update_sales_rollups(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Sales rollups updated for {days} days in {time.perf_counter() - started:.1f} s'))
+
+# полный пересчёт итогов продаж
+# python manage.py update_sales_rollups --full
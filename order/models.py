@@ -1,11 +1,17 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from category.models import Category
 from product.models import Product
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
+from django.utils import timezone
 
 # from account.send_mail import send_notification
-from config.tasks import send_notification_task
+from config.cache import deleted_with, register_cache_tags
+from .tasks import send_order_notifications_task
 
 User = get_user_model()
 
@@ -23,10 +29,12 @@ class OrderItem(models.Model):
     - order (ForeignKey): Ссылка на заказ, к которому относится данный элемент.
     - product (ForeignKey): Ссылка на продукт, связанный с элементом заказа.
     - quantity (PositiveSmallIntegerField): Количество продуктов в данном элементе заказа (по умолчанию 1).
+    - price (DecimalField): Цена продукта на момент заказа (пусто у позиций, созданных до появления поля).
     """
     order = models.ForeignKey('Order', related_name='items', on_delete=models.CASCADE)
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveSmallIntegerField(default=1)
+    price = models.DecimalField(max_digits=9, decimal_places=2, null=True, blank=True)
 
 class Order(models.Model):
     """
@@ -51,21 +59,233 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Список заказов пользователя с фильтром по дате и сортировкой по created_at;
+        # выборка изменённых заказов для аналитики - по updated_at
+        indexes = [models.Index(fields=('user', 'created_at'), name='order_user_created_idx'),
+                   models.Index(fields=('updated_at',), name='order_updated_idx')]
+
     def __str__(self):
         return f'{self.id} -> {self.user}'
 
+    def clean(self):
+        # Смена статуса в админке проверяется по тем же переходам, что и массовый перевод
+        from .state import can_transition
+
+        loaded = getattr(self, '_loaded_status', None)
+        if self.pk and loaded and self.status != loaded and not can_transition(loaded, self.status):
+            raise ValidationError({'status': f'Нельзя перевести заказ из статуса {loaded} в {self.status}'})
+
+
+class BoughtTogether(models.Model):
+    """
+    Модель пары продуктов, которые покупали в одном заказе.
+
+    Атрибуты:
+    - product (ForeignKey): Продукт, для которого показываются предложения.
+    - other (ForeignKey): Продукт, который покупали вместе с product.
+    - count (PositiveIntegerField): Количество заказов, в которых встречались оба продукта.
+
+    Примечание:
+    - Пара хранится в обе стороны; таблица пересчитывается командой compute_bought_together
+      и дополняется при создании заказов.
+    """
+    product = models.ForeignKey(Product, related_name='bought_together_links', on_delete=models.CASCADE)
+    other = models.ForeignKey(Product, related_name='bought_together_for', on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'other')
+        indexes = [models.Index(fields=('product', '-count'), name='bought_together_top_idx')]
+
+
+class BoughtTogetherOrder(models.Model):
+    """
+    Модель отметки заказа, пары которого уже добавлены в BoughtTogether.
+
+    Повторная доставка задачи record_order_task для того же заказа не увеличивает счётчики второй раз.
+
+    Атрибуты:
+    - order (OneToOneField): Учтённый заказ.
+    """
+    order = models.OneToOneField('Order', primary_key=True, related_name='+', on_delete=models.CASCADE)
+
+
+class OrderNotification(models.Model):
+    """
+    Модель очереди уведомлений о заказах (transactional outbox).
+
+    Запись создаётся в той же транзакции, что и изменение заказа, поэтому письмо
+    не уходит по откатившемуся заказу и не теряется при падении после фиксации.
+
+    Атрибуты:
+    - order (ForeignKey): Заказ, о котором уведомление.
+    - email (EmailField): Адрес получателя на момент изменения заказа.
+    - status (CharField): Новый статус заказа; пусто - уведомление о создании.
+    - total_sum (DecimalField): Сумма заказа на момент изменения.
+    - created_at (DateTimeField): Момент постановки в очередь.
+    - sent_at (DateTimeField): Момент отправки; пусто, пока письмо не отправлено.
+    - attempts (PositiveSmallIntegerField): Количество неудачных попыток отправки.
+    - last_error (TextField): Текст последней ошибки отправки.
+    """
+    order = models.ForeignKey(Order, related_name='notifications', on_delete=models.CASCADE)
+    email = models.EmailField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, blank=True)
+    total_sum = models.DecimalField(max_digits=9, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        # Частичный индекс: выборка очереди не читает уже отправленные уведомления
+        indexes = [models.Index(fields=('id',), condition=Q(sent_at__isnull=True),
+                                name='order_notification_pending_idx')]
+
+
+class DailySales(models.Model):
+    """
+    Модель дневных итогов продаж.
+
+    Атрибуты:
+    - day (DateField): День создания заказов (в часовом поясе проекта).
+    - revenue (DecimalField): Выручка по позициям заказов.
+    - units (PositiveIntegerField): Количество проданных единиц.
+    - orders (PositiveIntegerField): Количество заказов.
+    """
+    day = models.DateField(unique=True)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.PositiveIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+
+
+class DailyCategorySales(models.Model):
+    """
+    Модель дневных итогов продаж по категории продукта.
+
+    Атрибуты:
+    - day (DateField): День создания заказов.
+    - category (ForeignKey): Категория проданных продуктов.
+    - revenue, units, orders: Выручка, единицы и количество заказов с продуктами категории.
+    """
+    day = models.DateField()
+    category = models.ForeignKey(Category, related_name='daily_sales', on_delete=models.CASCADE)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.PositiveIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('day', 'category')
+
+
+class DailySellerSales(models.Model):
+    """
+    Модель дневных итогов продаж по продавцу (владельцу продукта).
+
+    Атрибуты:
+    - day (DateField): День создания заказов.
+    - owner (ForeignKey): Владелец проданных продуктов.
+    - revenue, units, orders: Выручка, единицы и количество заказов с продуктами продавца.
+    """
+    day = models.DateField()
+    owner = models.ForeignKey(User, related_name='daily_sales', on_delete=models.CASCADE)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.PositiveIntegerField(default=0)
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('day', 'owner')
+
+
+class SalesRollupState(models.Model):
+    """
+    Модель состояния инкрементальной агрегации продаж.
+
+    Атрибуты:
+    - watermark (DateTimeField): Заказы с updated_at не позже этого момента уже учтены.
+    - dirty_days (JSONField): Дни удалённых заказов, которые нужно пересчитать.
+    """
+    watermark = models.DateTimeField(null=True, blank=True)
+    dirty_days = models.JSONField(default=list, blank=True)
+
+
+# Статусы, о смене на которые пользователь получает письмо
+NOTIFY_STATUSES = ('in_process', 'closed')
+
+# Колонки выгрузки заказов: одна строка на позицию заказа (export_orders и /orders/export/)
+ORDER_EXPORT_FIELDS = ('order_id', 'order__number', 'order__user__email', 'order__status', 'order__address',
+                       'order__total_sum', 'order__created_at', 'product_id', 'product__title', 'quantity')
+
+# Тег списка заказов одного пользователя: его изменения не сбрасывают кеш других пользователей
+ORDER_USER_TAG = 'orders:user:{}'
+
+
+def order_item_user_tag(item):
+    # Заказ, загруженный вместе с позицией, не запрашиваем повторно; иначе владельца берём одним запросом по order_id
+    if 'order' in item._state.fields_cache:
+        user_id = item.order.user_id
+    else:
+        user_id = Order.objects.filter(pk=item.order_id).values_list('user_id', flat=True).first()
+    return ORDER_USER_TAG.format(user_id) if user_id else None
+
+
+# Закешированные списки заказов сбрасываются при изменении заказов и их позиций:
+# 'orders' - общий список администратора, ORDER_USER_TAG - список владельца заказа.
+# Позиции, удаляемые вместе с заказом, теги не сбрасывают: это делает сигнал самого заказа
+register_cache_tags(Order, 'orders', lambda order: ORDER_USER_TAG.format(order.user_id))
+register_cache_tags(OrderItem, 'orders', order_item_user_tag, cascade_from=Order)
+
+@receiver(post_init, sender=Order)
+def order_post_init(sender, instance, *args, **kwargs):
+    # Запоминаем загруженный статус, чтобы в post_save отличить смену статуса от других правок
+    instance._loaded_status = instance.status
+
+
 @receiver(post_save, sender=Order)
-def order_post_save(sender, instance, *args, **kwargs):
+def order_post_save(sender, instance, created, *args, **kwargs):
     """
     Обработчик сигнала post_save для модели Order.
 
-    Отправляет асинхронное задание для отправки уведомления о создании заказа пользователю.
+    Ставит в очередь уведомление о создании заказа или о смене статуса на один из
+    NOTIFY_STATUSES; другие правки заказа писем не порождают. Отправку запускает
+    задача send_order_notifications_task после фиксации транзакции.
 
     Аргументы:
     - sender: Класс модели, которая инициировала сигнал (в данном случае Order).
     - instance: Экземпляр модели Order, который был сохранен.
+    - created (bool): True, если заказ создан.
+    """
+    status_changed = instance.status != instance._loaded_status and instance.status in NOTIFY_STATUSES
+    instance._loaded_status = instance.status
+    if not created and not status_changed:
+        return
+    OrderNotification.objects.create(
+        order=instance, email=instance.user.email, total_sum=instance.total_sum,
+        status='' if created else instance.status)
+    transaction.on_commit(send_order_notifications_task.delay)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def order_item_touch(sender, instance, origin=None, *args, **kwargs):
     """
-    send_notification_task.delay(instance.user.email, instance.id, instance.total_sum)
+    Обновляет Order.updated_at при изменении позиций, чтобы аналитика пересчитала день заказа.
+
+    При удалении заказа его позиции не обновляются: день пересчитывает order_post_delete.
+    """
+    if deleted_with(origin, Order):
+        return
+    Order.objects.filter(pk=instance.order_id).update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Order)
+def order_post_delete(sender, instance, *args, **kwargs):
+    """
+    Отмечает день удалённого заказа для пересчёта итогов продаж.
+    """
+    from .analytics import mark_dirty_day
+
+    mark_dirty_day(timezone.localtime(instance.created_at).date())
 
 # from django.db import models
 # from django.contrib.auth import get_user_model
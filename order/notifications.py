@@ -0,0 +1,77 @@
+from django.core.cache import cache
+from django.core.mail import get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from account.send_mail import order_notification_message
+from .models import OrderNotification
+
+NOTIFICATIONS_BATCH_SIZE = 100
+# После стольких неудачных попыток уведомление больше не отправляется (остаётся в таблице для разбора)
+NOTIFICATIONS_MAX_ATTEMPTS = 5
+# Пока очередь разбирает один обработчик, остальные запуски сразу возвращают 0. Письма, записанные
+# после последней пачки, подхватывает повторный запуск, который обработчик ставит после снятия блокировки
+NOTIFICATIONS_LOCK = 'order_notifications:lock'
+
+
+def pending_notifications():
+    return OrderNotification.objects.filter(sent_at__isnull=True, attempts__lt=NOTIFICATIONS_MAX_ATTEMPTS)
+
+
+def send_order_notifications(batch_size=NOTIFICATIONS_BATCH_SIZE):
+    """
+    Отправляет накопившиеся уведомления о заказах пачками через одно SMTP-соединение.
+
+    Пачка блокируется SELECT ... FOR UPDATE SKIP LOCKED, поэтому параллельный
+    обработчик возьмёт другие записи. Успешные отправки отмечаются одним UPDATE на пачку.
+    Если после разбора очереди и снятия блокировки в ней снова есть письма (их задачи
+    вернули 0, пока блокировка была занята), задача ставится в очередь ещё раз.
+
+    Аргументы:
+    - batch_size (int): Количество уведомлений в одной пачке.
+
+    Возвращает:
+    - int: Количество отправленных писем.
+    """
+    if not cache.add(NOTIFICATIONS_LOCK, 1, timeout=10 * 60):
+        return 0
+    sent_total = 0
+    drained = False
+    connection = get_connection()
+    try:
+        connection.open()
+        while True:
+            with transaction.atomic():
+                batch = list(pending_notifications().select_for_update(skip_locked=True).order_by('id')[:batch_size])
+                if not batch:
+                    drained = True
+                    break
+                sent, failed = [], {}
+                for notification in batch:
+                    message = order_notification_message(notification.email, notification.order_id,
+                                                         notification.total_sum, notification.status or None)
+                    message.connection = connection
+                    try:
+                        message.send()
+                    except Exception as error:  # noqa: BLE001 - ошибка одного письма не останавливает очередь
+                        failed[notification.id] = str(error)
+                    else:
+                        sent.append(notification.id)
+                OrderNotification.objects.filter(id__in=sent).update(sent_at=timezone.now())
+                for notification_id, error in failed.items():
+                    OrderNotification.objects.filter(id=notification_id).update(
+                        attempts=F('attempts') + 1, last_error=error)
+            sent_total += len(sent)
+            if failed:
+                # Ошибки отправки повторяются следующим запуском задачи
+                break
+    finally:
+        connection.close()
+        cache.delete(NOTIFICATIONS_LOCK)
+    # После ошибок отправки не перезапускаемся: повтор выполнит периодический запуск
+    if drained and pending_notifications().exists():
+        from .tasks import send_order_notifications_task
+
+        send_order_notifications_task.delay()
+    return sent_total
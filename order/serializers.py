@@ -1,10 +1,19 @@
+from functools import reduce
+from operator import or_
+
 from django.db import transaction
-from django.shortcuts import get_object_or_404
+from django.db.models import Case, F, Q, When
+from django.http import Http404
+from django.utils import timezone
 from rest_framework import serializers
-from rest_framework.response import Response
 
-from .models import OrderItem, Order
+from config.cache import bump_tags
+from config.serializers import SparseFieldsetMixin
+from .models import ORDER_USER_TAG, STATUS_CHOICES, OrderItem, Order
+from .state import allowed_sources
+from .tasks import record_order_task
 from product.models import Product
+from product.trending import TRENDING_WEIGHTS, record_events
 
 
 class OrderItemSerializer(serializers.ModelSerializer):
@@ -21,71 +30,114 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = ('product', 'quantity', 'product_title')
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderItemWriteSerializer(serializers.Serializer):
+    """
+    Сериализатор позиции создаваемого заказа.
+
+    Поля:
+    - product (IntegerField): Идентификатор продукта (существование проверяется при создании заказа).
+    - quantity (IntegerField): Количество, не меньше 1.
+    """
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, max_value=32767)
+
+
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     Сериализатор для заказа.
 
     Поля:
     - status (CharField): Статус заказа (только для чтения).
     - user (ReadOnlyField): Email пользователя, только для чтения (source='user.email').
-    - products (OrderItemSerializer): Сериализатор для элементов заказа (только для записи, множественный).
+    - products (OrderItemWriteSerializer): Элементы заказа (только для записи, множественный).
     """
     status = serializers.CharField(read_only=True)
     user = serializers.ReadOnlyField(source='user.email')
-    products = OrderItemSerializer(write_only=True, many=True)
+    products = OrderItemWriteSerializer(write_only=True, many=True)
+    computed_fields = ('products',)  # Позиции заказа добавляются в to_representation
 
     class Meta:
         model = Order
-        fields = '__all__'
+        # Позиции отдаются полем products; M2M product потребовал бы отдельного запроса на каждый заказ
+        exclude = ('product',)
 
     def validate_products(self, products):
         """
-        Проверка доступного количества продуктов в заказе.
+        Проверка состава заказа без обращения к базе.
 
         Аргументы:
         - products (list): Список элементов заказа.
 
         Исключения:
-        - serializers.ValidationError: Возникает, если количество продуктов в заказе превышает доступное количество.
+        - serializers.ValidationError: Возникает, если заказ пуст.
 
         Возвращает:
-        - list: Отфильтрованный список элементов заказа.
+        - dict: Количество по идентификатору продукта (повторяющиеся позиции объединены).
+
+        Примечание:
+        - Наличие продуктов проверяется в create под блокировкой строк.
         """
+        if not products:
+            raise serializers.ValidationError('Заказ не содержит продуктов')
+        quantities = {}
         for product in products:
-            product_id = product['product'].id
-
-            product_data = get_object_or_404(Product, id=product_id)
-
-            if product_data.quantity < product['quantity']:
-                raise serializers.ValidationError(f'В наличии {product_data.title} {product_data.quantity} шт')
-        return products
+            quantities[product['product']] = quantities.get(product['product'], 0) + product['quantity']
+        return quantities
 
     def create(self, validated_data):
         """
-        Создание заказа и элементов заказа.
+        Создание заказа и элементов заказа с резервированием остатков.
+
+        Продукты блокируются одним SELECT ... FOR UPDATE в порядке id (параллельные
+        заказы ждут друг друга, а не взаимоблокируются), остатки проверяются в памяти
+        и уменьшаются одним UPDATE с условием на остаток. Количество запросов не зависит
+        от числа позиций.
 
         Аргументы:
         - validated_data (dict): Валидированные данные заказа.
 
+        Исключения:
+        - Http404: Возникает, если продукт не найден.
+        - serializers.ValidationError: Возникает, если количество продуктов в заказе превышает доступное количество.
+
         Возвращает:
         - Order: Созданный объект заказа.
         """
-        products = validated_data.pop('products')
+        quantities = validated_data.pop('products')
         user = self.context['request'].user
-        total_sum = 0
-        for product in products:
-            product_id = product['product'].id
-            total_sum += product['quantity'] * product['product'].price
+        with transaction.atomic():
+            locked = {product.id: product for product in Product.objects.select_for_update().filter(
+                id__in=quantities).order_by('id').only('id', 'title', 'price', 'quantity')}
+            total_sum = 0
+            for product_id, quantity in quantities.items():
+                product = locked.get(product_id)
+                if product is None:
+                    raise Http404(f'Продукт {product_id} не найден')
+                if product.quantity < quantity:
+                    raise serializers.ValidationError({'products': [f'В наличии {product.title} {product.quantity} шт']})
+                total_sum += quantity * product.price
 
-            product_data = get_object_or_404(Product, id=product_id)
+            # Условие на остаток - дополнительная защита: под блокировкой оно всегда выполняется
+            updated = Product.objects.filter(
+                reduce(or_, (Q(id=product_id, quantity__gte=quantity) for product_id, quantity in quantities.items()))
+            ).update(
+                quantity=Case(*(When(id=product_id, then=F('quantity') - quantity)
+                                for product_id, quantity in quantities.items())),
+                updated_at=timezone.now(),
+            )
+            if updated != len(quantities):
+                raise serializers.ValidationError({'products': ['Недостаточно продуктов в наличии']})
 
-            product_data.quantity -= product['quantity']
-            product_data.save()
-
-        order = Order.objects.create(user=user, total_sum=total_sum, status='open', **validated_data)
-        order_item_objects = [
-            OrderItem(order=order, product=product['product'], quantity=product['quantity']) for product in products]
-        OrderItem.objects.bulk_create(order_item_objects)
+            order = Order.objects.create(user=user, total_sum=total_sum, status='open', **validated_data)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_id=product_id, quantity=quantity, price=locked[product_id].price)
+                for product_id, quantity in quantities.items()])
+            # bulk_create и update() не вызывают сигналы: сбрасываем кеш заказов и продуктов явно
+            transaction.on_commit(lambda: bump_tags('orders', ORDER_USER_TAG.format(user.pk), 'products'))
+            # Пары "покупают вместе" обновляются в фоне после фиксации заказа
+            transaction.on_commit(lambda: record_order_task.delay(order.id))
+            ordered = {product_id: TRENDING_WEIGHTS['order'] * quantity for product_id, quantity in quantities.items()}
+            transaction.on_commit(lambda: record_events(ordered))
         return order
 
     def to_representation(self, instance):
@@ -99,10 +151,46 @@ class OrderSerializer(serializers.ModelSerializer):
         - dict: Представление заказа с сериализованными элементами заказа.
         """
         repr = super().to_representation(instance)
-        repr['products'] = OrderItemSerializer(instance.items.all(), many=True).data
-        repr.pop('product')
+        if self.wants('products'):
+            # Позиции берутся из prefetch_related, если список загружен представлением
+            prefetched = 'items' in getattr(instance, '_prefetched_objects_cache', {})
+            items = instance.items.all() if prefetched else instance.items.select_related('product')
+            repr['products'] = OrderItemSerializer(items, many=True).data
         return repr
 
+
+class OrderTransitionSerializer(serializers.Serializer):
+    """
+    Сериализатор массового перевода заказов в другой статус.
+
+    Поля:
+    - orders (ListField): Идентификаторы заказов (до 10000 за запрос).
+    - status (ChoiceField): Новый статус.
+    """
+    orders = serializers.ListField(child=serializers.IntegerField(min_value=1), min_length=1, max_length=10000)
+    status = serializers.ChoiceField(choices=STATUS_CHOICES)
+
+    def validate_status(self, status):
+        if not allowed_sources(status):
+            raise serializers.ValidationError(f'Нельзя перевести заказ в статус {status}')
+        return status
+
+
+class SalesTotalsSerializer(serializers.Serializer):
+    """
+    Сериализатор итогов продаж (выручка строкой, как у остальных денежных полей API).
+    """
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    units = serializers.IntegerField()
+    orders = serializers.IntegerField()
+
+
+class SalesRowSerializer(SalesTotalsSerializer):
+    """
+    Сериализатор итогов продаж одной группы: key - день, slug категории или id продавца.
+    """
+    key = serializers.ReadOnlyField()
+
 # from django.db import transaction
 # from django.shortcuts import get_object_or_404
 # from rest_framework import serializers
@@ -0,0 +1,67 @@
+from django.db import transaction
+from django.utils import timezone
+
+from config.cache import bump_tags
+from .models import NOTIFY_STATUSES, ORDER_USER_TAG, Order, OrderNotification
+from .tasks import send_order_notifications_task
+
+# Разрешённые переходы статусов заказа: open -> in_process -> closed
+TRANSITIONS = {
+    'open': ('in_process',),
+    'in_process': ('closed',),
+    'closed': (),
+}
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+def can_transition(current, target):
+    return target in TRANSITIONS.get(current, ())
+
+
+def allowed_sources(target):
+    """
+    Возвращает статусы, из которых заказ может перейти в target.
+    """
+    return tuple(status for status, targets in TRANSITIONS.items() if target in targets)
+
+
+def transition_orders(order_ids, target):
+    """
+    Переводит заказы в статус target одним UPDATE ... WHERE status IN (...).
+
+    Заказы, для которых переход не разрешён, пропускаются. Уведомления о смене
+    статуса ставятся в очередь одним INSERT, отправку запускает одна задача после
+    фиксации транзакции; сигналы post_save по заказам не вызываются.
+
+    Аргументы:
+    - order_ids (iterable): Идентификаторы заказов.
+    - target (str): Новый статус.
+
+    Исключения:
+    - InvalidTransition: Возникает, если в статус target нельзя перейти ни из какого статуса.
+
+    Возвращает:
+    - tuple: (список переведённых id, список пропущенных id).
+    """
+    sources = allowed_sources(target)
+    if not sources:
+        raise InvalidTransition(f'Нельзя перевести заказ в статус {target}')
+    order_ids = set(order_ids)
+    with transaction.atomic():
+        # Строки блокируются, чтобы параллельный переход не изменил статус между выборкой и UPDATE
+        orders = list(Order.objects.select_for_update(of=('self',)).filter(id__in=order_ids, status__in=sources)
+                      .order_by('id').values_list('id', 'user_id', 'user__email', 'total_sum'))
+        updated = [order_id for order_id, *_ in orders]
+        Order.objects.filter(id__in=updated).update(status=target, updated_at=timezone.now())
+        if target in NOTIFY_STATUSES and orders:
+            OrderNotification.objects.bulk_create([
+                OrderNotification(order_id=order_id, email=email, status=target, total_sum=total_sum)
+                for order_id, _, email, total_sum in orders])
+            transaction.on_commit(send_order_notifications_task.delay)
+        # update() не вызывает сигналы: сбрасываем кеш списков заказов явно
+        tags = {'orders'} | {ORDER_USER_TAG.format(user_id) for _, user_id, *_ in orders}
+        transaction.on_commit(lambda: bump_tags(*tags))
+    return updated, sorted(order_ids - set(updated))
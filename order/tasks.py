@@ -0,0 +1,50 @@
+from config.celery import app
+
+
+@app.task
+def compute_bought_together_task():
+    """
+    Ночная задача полного пересчёта пар "покупают вместе".
+
+    Примечание:
+    - Полный пересчёт убирает пары, вытесненные из top-k после инкрементальных обновлений.
+    """
+    from .bought_together import compute_bought_together
+
+    return compute_bought_together()
+
+
+@app.task
+def record_order_task(order_id):
+    """
+    Асинхронная задача учёта пар продуктов нового заказа.
+
+    Аргументы:
+    - order_id (int): Идентификатор созданного заказа.
+    """
+    from .bought_together import record_order
+
+    return record_order(order_id)
+
+
+@app.task
+def send_order_notifications_task():
+    """
+    Асинхронная задача отправки писем из очереди OrderNotification.
+
+    Примечание:
+    - Запускается после фиксации изменений заказа и периодически (для писем, которые не удалось отправить).
+    """
+    from .notifications import send_order_notifications
+
+    return send_order_notifications()
+
+
+@app.task
+def update_sales_rollups_task():
+    """
+    Периодическая задача инкрементального обновления дневных итогов продаж.
+    """
+    from .analytics import update_sales_rollups
+
+    return update_sales_rollups()
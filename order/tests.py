@@ -1,3 +1,473 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core import mail
+from django.core.mail import get_connection
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from category.models import Category
+from order.bought_together import record_order
+from order.models import BoughtTogether, Order, OrderItem, OrderNotification
+from order.analytics import mark_dirty_day, update_sales_rollups
+from order.notifications import NOTIFICATIONS_LOCK, pending_notifications, send_order_notifications
+from product.models import Product
+
+User = get_user_model()
+
+
+class OrderTestMixin:
+    """
+    Общие данные тестов заказов: пользователь, категория и отключённые фоновые задачи.
+    """
+
+    def setUp(self):
+        self.mocks = {}
+        # Уведомления, пары "покупают вместе", популярность и пересчёт похожих продуктов проверяются отдельно
+        for target in ('order.models.send_order_notifications_task', 'order.state.send_order_notifications_task',
+                       'order.serializers.record_order_task', 'order.serializers.record_events',
+                       'product.tasks.schedule_similar_products'):
+            patcher = mock.patch(target)
+            self.mocks[target] = patcher.start()
+            self.addCleanup(patcher.stop)
+        self.user = User.objects.create_user('buyer@example.com', 'password123')
+        self.category = Category.objects.create(name='phones')
+
+    def create_product(self, title='phone', price=100, quantity=10):
+        return Product.objects.create(owner=self.user, title=title, description='description',
+                                      category=self.category, price=price, quantity=quantity)
+
+    def order_payload(self, *lines):
+        return {'address': 'Bishkek', 'number': '+996700000000',
+                'products': [{'product': product.id, 'quantity': quantity} for product, quantity in lines]}
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+
+class OrderCreateTest(OrderTestMixin, TestCase):
+
+    def test_create_decrements_stock_and_total(self):
+        first, second = self.create_product(price=100, quantity=5), self.create_product(price=30, quantity=3)
+        response = self.client_for(self.user).post(
+            '/api/v1/orders/', self.order_payload((first, 2), (second, 1), (first, 1)), format='json')
+
+        self.assertEqual(response.status_code, 201, response.content)
+        order = Order.objects.get()
+        self.assertEqual(order.total_sum, 330)
+        self.assertEqual(dict(order.items.values_list('product_id', 'quantity')), {first.id: 3, second.id: 1})
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.quantity, second.quantity), (2, 2))
+
+    def test_insufficient_stock_creates_nothing(self):
+        first, second = self.create_product(quantity=5), self.create_product(quantity=1)
+        response = self.client_for(self.user).post(
+            '/api/v1/orders/', self.order_payload((first, 2), (second, 2)), format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(list(Product.objects.order_by('id').values_list('quantity', flat=True)), [5, 1])
+
+    def test_unknown_product(self):
+        response = self.client_for(self.user).post(
+            '/api/v1/orders/', {'address': 'Bishkek', 'number': '1', 'products': [{'product': 999, 'quantity': 1}]},
+            format='json')
+
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_query_count_does_not_depend_on_lines(self):
+        products = [self.create_product(title=f'phone {index}') for index in range(5)]
+        client = self.client_for(self.user)
+
+        queries = []
+        for lines in ([(products[0], 1)], [(product, 1) for product in products]):
+            with CaptureQueriesContext(connection) as context:
+                response = client.post('/api/v1/orders/', self.order_payload(*lines), format='json')
+            self.assertEqual(response.status_code, 201, response.content)
+            queries.append(len(context.captured_queries))
+        self.assertEqual(queries[0], queries[1])
+
+
+class OrderListTest(OrderTestMixin, TestCase):
+
+    def create_orders(self, user, count, products):
+        for index in range(count):
+            order = Order.objects.create(user=user, address='Bishkek', number=str(index), status='open', total_sum=0)
+            OrderItem.objects.bulk_create([OrderItem(order=order, product=product) for product in products])
+
+    def test_query_count_does_not_depend_on_order_count(self):
+        products = [self.create_product(title=f'phone {index}') for index in range(3)]
+        client = self.client_for(self.user)
+
+        for count in (1, 20):
+            self.create_orders(self.user, count, products)
+            cache.clear()
+            # Количество для пагинации, заказы с пользователями и позиции с названиями продуктов
+            with self.assertNumQueries(3):
+                response = client.get('/api/v1/orders/')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 21)
+        data = response.json()['results']
+        self.assertEqual(len(data), 20)
+        self.assertEqual(data[0]['user'], self.user.email)
+        self.assertEqual(sorted(item['product_title'] for item in data[0]['products']),
+                         ['phone 0', 'phone 1', 'phone 2'])
+
+    def test_only_own_orders(self):
+        product = self.create_product()
+        other = User.objects.create_user('other@example.com', 'password123')
+        self.create_orders(self.user, 2, [product])
+        self.create_orders(other, 3, [product])
+        cache.clear()
+
+        self.assertEqual(self.client_for(other).get('/api/v1/orders/').json()['count'], 3)
+
+    def test_user_cache_is_invalidated_only_by_own_orders(self):
+        product = self.create_product()
+        other = User.objects.create_user('other@example.com', 'password123')
+        client = self.client_for(self.user)
+        self.create_orders(self.user, 1, [product])
+        cache.clear()
+        client.get('/api/v1/orders/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_orders(other, 1, [product])
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get('/api/v1/orders/').json()['count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_orders(self.user, 1, [product])
+        self.assertEqual(client.get('/api/v1/orders/').json()['count'], 2)
+
+    def test_item_signals_do_not_query_per_item(self):
+        products = [self.create_product(title=f'phone {index}') for index in range(3)]
+        order = Order.objects.create(user=self.user, address='Bishkek', number='1', status='open', total_sum=0)
+        # Заказ уже загружен вместе с позицией: владелец не запрашивается, остаётся только UPDATE updated_at
+        with self.assertNumQueries(2):
+            OrderItem.objects.create(order=order, product=products[0])
+
+        # Позиции, удаляемые вместе с заказом, не запрашивают владельца и не обновляют заказ
+        mark_dirty_day(timezone.localdate())
+        delete_queries = []
+        for count in (1, 3):
+            order = Order.objects.create(user=self.user, address='Bishkek', number='2', status='open', total_sum=0)
+            OrderItem.objects.bulk_create([OrderItem(order=order, product=product) for product in products[:count]])
+            with CaptureQueriesContext(connection) as queries:
+                Order.objects.get(pk=order.pk).delete()
+            delete_queries.append(len(queries))
+        self.assertEqual(delete_queries[0], delete_queries[1])
+
+    def test_filters(self):
+        product = self.create_product()
+        self.create_orders(self.user, 3, [product])
+        Order.objects.filter(number='0').update(status='closed', created_at=timezone.now() - timedelta(days=10))
+        cache.clear()
+        client = self.client_for(self.user)
+
+        self.assertEqual(client.get('/api/v1/orders/?status=closed').json()['count'], 1)
+        self.assertEqual(client.get('/api/v1/orders/?status=open&status=closed').json()['count'], 3)
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        self.assertEqual(client.get('/api/v1/orders/', {'created_after': since}).json()['count'], 2)
+        self.assertEqual(client.get('/api/v1/orders/', {'created_before': since}).json()['count'], 1)
+
+
+class OrderIdempotencyTest(OrderTestMixin, TestCase):
+
+    def post_order(self, payload, key):
+        return self.client_for(self.user).post('/api/v1/orders/', payload, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_returns_original_response(self):
+        cache.clear()
+        product = self.create_product(quantity=5)
+        payload = self.order_payload((product, 2))
+        first = self.post_order(payload, 'checkout-1')
+
+        with self.assertNumQueries(0):
+            retry = self.post_order(payload, 'checkout-1')
+        self.assertEqual((retry.status_code, retry.content), (first.status_code, first.content))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 3)
+
+        self.assertEqual(self.post_order(payload, 'checkout-2').status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_key_reused_with_different_body(self):
+        cache.clear()
+        product = self.create_product()
+        self.post_order(self.order_payload((product, 1)), 'checkout-1')
+
+        response = self.post_order(self.order_payload((product, 3)), 'checkout-1')
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_validation_error_is_replayed(self):
+        cache.clear()
+        product = self.create_product(quantity=1)
+        payload = self.order_payload((product, 5))
+        first = self.post_order(payload, 'checkout-1')
+        self.assertEqual(first.status_code, 400)
+
+        with mock.patch('order.views.CreateOrderView.create') as create:
+            retry = self.post_order(payload, 'checkout-1')
+        create.assert_not_called()
+        self.assertEqual((retry.status_code, retry.content), (400, first.content))
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+
+    def test_request_in_progress(self):
+        cache.clear()
+        product = self.create_product()
+        with mock.patch('config.idempotency.IDEMPOTENCY_WAIT', 0), \
+                mock.patch('config.idempotency.cache.add', return_value=False):
+            response = self.post_order(self.order_payload((product, 1)), 'checkout-1')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.exists())
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OrderNotificationTest(OrderTestMixin, TestCase):
+
+    def test_outbox_written_on_create_and_status_change(self):
+        product = self.create_product()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client_for(self.user).post('/api/v1/orders/', self.order_payload((product, 1)),
+                                                       format='json')
+        self.assertEqual(response.status_code, 201)
+        # Отправка запускается только после фиксации транзакции
+        self.mocks['order.models.send_order_notifications_task'].delay.assert_called_once()
+        order = Order.objects.get()
+        self.assertEqual(list(order.notifications.values_list('status', 'email')), [('', self.user.email)])
+
+        order = Order.objects.get()
+        order.address = 'Osh'
+        order.save()
+        self.assertEqual(order.notifications.count(), 1)
+        order.status = 'in_process'
+        order.save()
+        order.save()
+        self.assertEqual(list(order.notifications.order_by('id').values_list('status', flat=True)),
+                         ['', 'in_process'])
+
+    def test_outbox_rolled_back_with_order(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Order.objects.create(user=self.user, address='Bishkek', number='1', status='open', total_sum=10)
+            raise RuntimeError
+        self.assertFalse(OrderNotification.objects.exists())
+
+    def test_drain_uses_one_connection(self):
+        for index in range(3):
+            Order.objects.create(user=self.user, address='Bishkek', number=str(index), status='open', total_sum=10)
+        order = Order.objects.get(number='0')
+        order.status = 'closed'
+        order.save()
+
+        with mock.patch('order.notifications.get_connection', wraps=get_connection) as connection:
+            self.assertEqual(send_order_notifications(batch_size=2), 4)
+        connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual({message.to[0] for message in mail.outbox}, {self.user.email})
+        self.assertFalse(pending_notifications().exists())
+        self.assertEqual(send_order_notifications(), 0)
+
+    def test_requeued_when_notification_arrives_during_drain(self):
+        Order.objects.create(user=self.user, address='Bishkek', number='1', status='open', total_sum=10)
+        self.assertTrue(cache.add(NOTIFICATIONS_LOCK, 1))
+        # Пока блокировка занята, запуск ничего не отправляет
+        self.assertEqual(send_order_notifications(), 0)
+        cache.delete(NOTIFICATIONS_LOCK)
+
+        release = cache.delete
+
+        def late_order_then_release(key):
+            # Заказ зафиксирован после последней пачки, но до снятия блокировки
+            Order.objects.create(user=self.user, address='Bishkek', number='2', status='open', total_sum=10)
+            release(key)
+
+        with mock.patch('order.tasks.send_order_notifications_task') as task, \
+                mock.patch.object(cache, 'delete', side_effect=late_order_then_release):
+            self.assertEqual(send_order_notifications(), 1)
+        task.delay.assert_called_once()
+        self.assertEqual(pending_notifications().count(), 1)
+
+    def test_failed_message_is_retried(self):
+        Order.objects.create(user=self.user, address='Bishkek', number='1', status='open', total_sum=10)
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=OSError('down')):
+            self.assertEqual(send_order_notifications(), 0)
+        notification = OrderNotification.objects.get()
+        self.assertEqual((notification.attempts, notification.last_error, notification.sent_at), (1, 'down', None))
+
+        self.assertEqual(send_order_notifications(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+
+@mock.patch('order.analytics.ROLLUP_LAG', timedelta(0))
+class SalesAnalyticsTest(OrderTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.seller = User.objects.create_user('seller@example.com', 'password123')
+        self.admin = User.objects.create_superuser('admin@example.com', 'password123')
+        self.phone = self.create_product(title='phone', price=100)
+        self.case = Product.objects.create(owner=self.seller, title='case', description='description',
+                                           category=Category.objects.create(name='cases'), price=10, quantity=10)
+
+    def create_order(self, days_ago, *lines):
+        order = Order.objects.create(user=self.user, address='Bishkek', number='1', status='open', total_sum=0)
+        OrderItem.objects.bulk_create([OrderItem(order=order, product=product, quantity=quantity, price=product.price)
+                                       for product, quantity in lines])
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        return order
+
+    def analytics(self, **params):
+        return self.client_for(self.admin).get('/api/v1/orders/analytics/', params)
+
+    def test_rollups_by_day_category_and_owner(self):
+        self.create_order(1, (self.phone, 2), (self.case, 1))
+        self.create_order(1, (self.case, 3))
+        self.create_order(3, (self.phone, 1))
+        self.assertEqual(update_sales_rollups(), 2)
+
+        with self.assertNumQueries(2):
+            data = self.analytics(group_by='category').json()
+        self.assertEqual(data['total'], {'revenue': '340.00', 'units': 7, 'orders': 3})
+        self.assertEqual([(row['key'], row['revenue'], row['orders']) for row in data['results']],
+                         [('phones', '300.00', 2), ('cases', '40.00', 2)])
+        owners = {row['key']: row['units'] for row in self.analytics(group_by='owner').json()['results']}
+        self.assertEqual(owners, {self.user.pk: 3, self.seller.pk: 4})
+        since = (timezone.localdate() - timedelta(days=2)).isoformat()
+        self.assertEqual(self.analytics(date_from=since).json()['total']['orders'], 2)
+
+    def test_incremental_update_and_delete(self):
+        old = self.create_order(5, (self.phone, 1))
+        recent = self.create_order(1, (self.case, 1))
+        update_sales_rollups()
+        self.assertEqual(update_sales_rollups(), 0)
+
+        item = recent.items.get()
+        item.quantity = 4
+        item.save()
+        self.assertEqual(update_sales_rollups(), 1)
+        self.assertEqual(self.analytics().json()['total']['revenue'], '140.00')
+
+        Order.objects.get(pk=old.pk).delete()
+        self.assertEqual(update_sales_rollups(), 1)
+        self.assertEqual(self.analytics().json()['total'], {'revenue': '40.00', 'units': 4, 'orders': 1})
+
+    def test_admin_only_and_validation(self):
+        self.assertEqual(self.client_for(self.user).get('/api/v1/orders/analytics/').status_code, 403)
+        self.assertEqual(self.analytics(group_by='city').status_code, 400)
+        self.assertEqual(self.analytics(date_from='yesterday').status_code, 400)
+
+
+class BoughtTogetherRecordTest(OrderTestMixin, TestCase):
+
+    def create_order(self, *products):
+        order = Order.objects.create(user=self.user, address='Bishkek', number='1', status='open', total_sum=0)
+        OrderItem.objects.bulk_create([OrderItem(order=order, product=product, quantity=1, price=product.price)
+                                       for product in products])
+        return order
+
+    def counts(self):
+        return dict(((link.product_id, link.other_id), link.count) for link in BoughtTogether.objects.all())
+
+    def test_record_order_upserts_pairs_once_per_order(self):
+        phone, case, charger = self.create_product('phone'), self.create_product('case'), self.create_product('charger')
+        first = self.create_order(phone, case)
+        self.assertEqual(record_order(first.pk), 2)
+        # Повторная доставка задачи не увеличивает счётчики
+        self.assertEqual(record_order(first.pk), 0)
+        self.assertEqual(record_order(self.create_order(phone, case, charger).pk), 6)
+        self.assertEqual(self.counts(), {(phone.pk, case.pk): 2, (case.pk, phone.pk): 2,
+                                         (phone.pk, charger.pk): 1, (charger.pk, phone.pk): 1,
+                                         (case.pk, charger.pk): 1, (charger.pk, case.pk): 1})
+
+
+class OrderTransitionTest(OrderTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser('admin@example.com', 'password123')
+
+    def create_orders(self, count, status='open'):
+        return Order.objects.bulk_create([
+            Order(user=self.user, address='Bishkek', number=str(index), status=status, total_sum=10)
+            for index in range(count)])
+
+    def transition(self, orders, status):
+        return self.client_for(self.admin).post('/api/v1/orders/transition/',
+                                                {'orders': [order.id for order in orders], 'status': status},
+                                                format='json')
+
+    def test_bulk_transition_in_constant_queries(self):
+        orders = self.create_orders(50)
+        closed = self.create_orders(2, status='closed')
+
+        # Блокировка, UPDATE и вставка уведомлений внутри точки сохранения транзакции теста
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(5):
+            response = self.transition(orders + closed, 'in_process')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['updated']), 50)
+        self.assertEqual(response.json()['skipped'], sorted(order.id for order in closed))
+        self.assertEqual(Order.objects.filter(status='in_process').count(), 50)
+        self.assertEqual(OrderNotification.objects.filter(status='in_process').count(), 50)
+        self.mocks['order.state.send_order_notifications_task'].delay.assert_called_once()
+
+    def test_transition_must_follow_state_machine(self):
+        orders = self.create_orders(2)
+        response = self.transition(orders, 'closed')
+        self.assertEqual(response.json(), {'updated': [], 'skipped': sorted(order.id for order in orders)})
+        self.assertEqual(self.transition(orders, 'open').status_code, 400)
+        self.assertEqual(self.client_for(self.user).post('/api/v1/orders/transition/', {}).status_code, 403)
+
+    def test_admin_form_rejects_invalid_transition(self):
+        order = Order.objects.get(pk=self.create_orders(1)[0].pk)
+        order.status = 'closed'
+        with self.assertRaises(ValidationError):
+            order.full_clean()
+        order.status = 'in_process'
+        order.full_clean()
+
+
+class OrderConcurrencyTest(OrderTestMixin, TransactionTestCase):
+
+    def test_parallel_checkouts_do_not_oversell(self):
+        stock, buyers = 5, 12
+        products = [self.create_product(title='phone', quantity=stock),
+                    self.create_product(title='case', quantity=stock * 2)]
+        users = [User.objects.create_user(f'buyer{index}@example.com', 'password123') for index in range(buyers)]
+        barrier = threading.Barrier(buyers)
+        statuses = []
+
+        def checkout(user, lines):
+            try:
+                client = self.client_for(user)
+                barrier.wait()
+                statuses.append(client.post('/api/v1/orders/', self.order_payload(*lines), format='json').status_code)
+            finally:
+                connection.close()
+
+        # Половина покупателей перечисляет продукты в обратном порядке: блокировка по id не даёт взаимоблокировок
+        threads = [threading.Thread(target=checkout, args=(user, [(products[index % 2], 1), (products[1 - index % 2], 1)]))
+                   for index, user in enumerate(users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(statuses), [201] * stock + [400] * (buyers - stock))
+        self.assertEqual(Order.objects.count(), stock)
+        self.assertEqual(list(Product.objects.order_by('id').values_list('quantity', flat=True)), [0, stock])
+        self.assertEqual(OrderItem.objects.filter(product=products[0]).count(), stock)
@@ -2,5 +2,8 @@ from django.urls import path
 from order import views
 urlpatterns = [
     path('', views.CreateOrderView.as_view()),
+    path('export/', views.OrderExportView.as_view()),
+    path('analytics/', views.OrderAnalyticsView.as_view()),
+    path('transition/', views.OrderTransitionView.as_view()),
     path('<pk>/', views.CreateOrderView.as_view()),
 ]
\ No newline at end of file
@@ -1,11 +1,37 @@
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
+from datetime import date, timedelta
+
+from django.db.models import Prefetch
+from django.utils import timezone
+from django_filters.rest_framework import DjangoFilterBackend
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
 from rest_framework.generics import ListCreateAPIView
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from config.cache import cache_response
+from config.exports import export_request_options, export_response
+from config.idempotency import IDEMPOTENCY_HEADER, idempotent
+from config.pagination import CursorOptInPagination
+from order.analytics import ANALYTICS_GROUPS, sales_analytics
+from order.filters import OrderFilter
+from order.models import ORDER_EXPORT_FIELDS, ORDER_USER_TAG, Order, OrderItem
+from order.serializers import (OrderSerializer, OrderTransitionSerializer, SalesRowSerializer,
+                               SalesTotalsSerializer)
+from order.state import transition_orders
+
+
+class OrderPagination(CursorOptInPagination):
+    page_size = 20
+    cursor_ordering = ('-created_at', '-id')
 
-from order.models import Order
-from order.serializers import OrderSerializer
+
+def order_cache_tags(request):
+    # Администратор видит все заказы, пользователь - только свои: его кеш сбрасывают только его заказы
+    if request.user.is_superuser:
+        return ('orders',)
+    return (ORDER_USER_TAG.format(request.user.pk),)
 
 
 class CreateOrderView(ListCreateAPIView):
@@ -16,12 +42,35 @@ class CreateOrderView(ListCreateAPIView):
     - queryset (QuerySet): Запрос для получения списка заказов.
     - serializer_class (OrderSerializer): Сериализатор для заказов.
     - permission_classes (list): Список классов разрешений для доступа к представлению.
+    - pagination_class (OrderPagination): Постраничная выдача, новые заказы первыми.
+    - filterset_class (OrderFilter): Фильтры по дате создания и статусу.
     """
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     permission_classes = [IsAdminUser | IsAuthenticatedOrReadOnly, ]
+    pagination_class = OrderPagination
+    filter_backends = (DjangoFilterBackend,)
+    filterset_class = OrderFilter
+
+    def get_queryset(self):
+        """
+        Заказы текущего пользователя (все заказы для администратора) с позициями и продуктами.
+
+        Пользователь подгружается JOIN-ом, позиции с названиями продуктов - одним
+        дополнительным запросом на весь список, независимо от количества заказов.
+        """
+        user = self.request.user
+        queryset = Order.objects.select_related('user').prefetch_related(Prefetch(
+            'items', queryset=OrderItem.objects.select_related('product').only(
+                'id', 'order_id', 'product_id', 'quantity', 'product__id', 'product__title'))
+        ).order_by('-created_at', '-id')
+        if user.is_superuser:  # Проверка, является ли пользователь администратором
+            return queryset
+        if not user.is_authenticated:
+            return queryset.none()
+        return queryset.filter(user=user)
 
-    @method_decorator(cache_page(60))  # Кеширование на 1 минуту
+    @cache_response(tags=order_cache_tags, per_user=True)  # Кеш отдельный для каждого пользователя, сбрасывается при изменении его заказов
     def get(self, request, *args, **kwargs):
         """
         Обработчик HTTP GET-запроса.
@@ -32,15 +81,98 @@ class CreateOrderView(ListCreateAPIView):
         - **kwargs: Дополнительные именованные аргументы.
 
         Возвращает:
-        - Response: Ответ с данными о заказах или ошибкой в случае отсутствия прав доступа.
+        - Response: Страница заказов с учётом фильтров.
         """
-        user = request.user
-        if user.is_superuser:  # Проверка, является ли пользователь администратором
-            orders = Order.objects.all()
-        else:
-            orders = user.orders.all()
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data, status=200)
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        serializer = OrderSerializer(page, many=True, context={'request': request})
+        return self.get_paginated_response(serializer.data)
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter(IDEMPOTENCY_HEADER, openapi.IN_HEADER, 'unique key of the checkout attempt: '
+                          'a retry with the same key returns the original response', False,
+                          type=openapi.TYPE_STRING)])
+    @idempotent('orders')  # Повтор запроса клиентом не создаёт второй заказ
+    def post(self, request, *args, **kwargs):
+        return super().post(request, *args, **kwargs)
+
+
+class OrderExportView(APIView):
+    """
+    Потоковая выгрузка заказов для администраторов: одна строка на позицию заказа.
+
+    Параметры запроса:
+    - file_format (str): 'csv' (по умолчанию) или 'jsonl'.
+    - gzip (bool): Сжать файл в gzip.
+    """
+    permission_classes = [IsAdminUser, ]
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('file_format', openapi.IN_QUERY, 'output format', False,
+                          type=openapi.TYPE_STRING, enum=['csv', 'jsonl']),
+        openapi.Parameter('gzip', openapi.IN_QUERY, 'compress the file with gzip', False,
+                          type=openapi.TYPE_BOOLEAN)])
+    def get(self, request):
+        file_format, compress = export_request_options(request)
+        if file_format is None:
+            return Response('file_format must be one of: csv, jsonl', status=400)
+        queryset = OrderItem.objects.order_by('order_id', 'id')
+        return export_response(queryset, ORDER_EXPORT_FIELDS, file_format, 'orders', compress)
+
+
+class OrderAnalyticsView(APIView):
+    """
+    Аналитика продаж для администраторов по дневным таблицам итогов.
+
+    Параметры запроса:
+    - date_from (date): Первый день периода (по умолчанию 30 дней назад).
+    - date_to (date): Последний день периода включительно (по умолчанию сегодня).
+    - group_by (str): 'day' (по умолчанию), 'category' или 'owner'.
+
+    Примечание:
+    - Итоги обновляет задача update_sales_rollups_task, заказы последних минут в них ещё не попадают.
+    """
+    permission_classes = [IsAdminUser, ]
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('date_from', openapi.IN_QUERY, 'first day (YYYY-MM-DD)', False,
+                          type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+        openapi.Parameter('date_to', openapi.IN_QUERY, 'last day, inclusive (YYYY-MM-DD)', False,
+                          type=openapi.TYPE_STRING, format=openapi.FORMAT_DATE),
+        openapi.Parameter('group_by', openapi.IN_QUERY, 'grouping of the results', False,
+                          type=openapi.TYPE_STRING, enum=list(ANALYTICS_GROUPS))])
+    def get(self, request):
+        today = timezone.localdate()
+        try:
+            date_from = date.fromisoformat(request.query_params.get('date_from', str(today - timedelta(days=30))))
+            date_to = date.fromisoformat(request.query_params.get('date_to', str(today)))
+        except ValueError:
+            return Response('date_from and date_to must be dates in YYYY-MM-DD format', status=400)
+        group_by = request.query_params.get('group_by', 'day')
+        if group_by not in ANALYTICS_GROUPS:
+            return Response(f'group_by must be one of: {", ".join(ANALYTICS_GROUPS)}', status=400)
+        if date_from > date_to:
+            return Response('date_from must not be later than date_to', status=400)
+        data = sales_analytics(date_from, date_to, group_by)
+        data['total'] = SalesTotalsSerializer(data['total']).data
+        data['results'] = SalesRowSerializer(data['results'], many=True).data
+        return Response(data)
+
+
+class OrderTransitionView(APIView):
+    """
+    Массовый перевод заказов в другой статус для администраторов.
+
+    Тело запроса: {"orders": [id, ...], "status": "closed"}. Заказы, для которых
+    переход не разрешён (см. order.state.TRANSITIONS), возвращаются в skipped.
+    """
+    permission_classes = [IsAdminUser, ]
+
+    @swagger_auto_schema(request_body=OrderTransitionSerializer)
+    def post(self, request):
+        serializer = OrderTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        updated, skipped = transition_orders(serializer.validated_data['orders'], serializer.validated_data['status'])
+        return Response({'updated': updated, 'skipped': skipped})
 
 # from django.utils.decorators import method_decorator
 # from django.views.decorators.cache import cache_page
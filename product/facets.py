@@ -0,0 +1,111 @@
+import hashlib
+from collections import defaultdict
+
+from django.db.models import Count, Q
+
+from category.models import Category
+
+# Границы ценовых диапазонов гистограммы; последний диапазон открыт сверху
+PRICE_BUCKETS = (0, 1000, 5000, 10000, 50000, 100000)
+# Сколько продавцов с наибольшим количеством продуктов возвращать
+FACET_OWNERS_LIMIT = 20
+# Параметры запроса, от которых зависят фасеты (те же, что у списка продуктов)
+FACET_PARAMS = ('owner', 'category', 'q', 'search')
+
+
+def price_ranges():
+    bounds = list(PRICE_BUCKETS) + [None]
+    return list(zip(bounds, bounds[1:]))
+
+
+def facets_cache_key(params, versions):
+    """
+    Ключ кеша фасетов по нормализованному запросу.
+
+    Учитываются только параметры фильтрации: порядок, регистр и лишние пробелы в q
+    и параметры пагинации не порождают отдельных записей.
+    """
+    normalized = []
+    for name in FACET_PARAMS:
+        values = sorted(' '.join(value.split()).lower() for value in params.getlist(name) if value.strip())
+        if values:
+            normalized.append(f'{name}={",".join(values)}')
+    digest = hashlib.md5('&'.join(normalized).encode()).hexdigest()
+    return f'facets:{digest}:{":".join(map(str, versions))}'
+
+
+def _by_count(item):
+    # Сначала самые многочисленные, при равенстве - по идентификатору для стабильного порядка
+    return -item['count'], str(item.get('slug', item.get('id')))
+
+
+def category_roots():
+    """
+    Возвращает корневую категорию для каждой категории, поднимаясь по всей цепочке родителей.
+
+    Категорий немного, поэтому дерево читается одним запросом целиком.
+
+    Возвращает:
+    - dict: slug -> (slug корня, название корня).
+    """
+    categories = {slug: (parent, name)
+                  for slug, parent, name in Category.objects.values_list('slug', 'parent', 'name')}
+    roots = {}
+    for slug in categories:
+        root, seen = slug, {slug}
+        while categories[root][0] in categories and categories[root][0] not in seen:
+            root = categories[root][0]
+            seen.add(root)
+        roots[slug] = (root, categories[root][1])
+    return roots
+
+
+def compute_facets(queryset):
+    """
+    Считает фасеты выдачи одним запросом GROUP BY с агрегатами FILTER
+    (и одним запросом дерева категорий для подсчёта по корневым).
+
+    Аргументы:
+    - queryset (QuerySet): Отфильтрованные продукты (фильтры и поиск уже применены).
+
+    Возвращает:
+    - dict: total - количество продуктов, categories - количество по категориям,
+      parents - то же с подсчётом по корневым категориям, prices - гистограмма цен,
+      owners - продавцы с наибольшим количеством продуктов.
+    """
+    ranges = price_ranges()
+    buckets = {
+        f'price_{index}': Count('id', filter=Q(price__gte=low) & (Q(price__lt=high) if high is not None else Q()))
+        for index, (low, high) in enumerate(ranges)
+    }
+    rows = queryset.order_by().values(
+        'category_id', 'category__name', 'category__parent_id', 'owner_id', 'owner__email',
+    ).annotate(count=Count('id'), **buckets)
+    roots = category_roots()
+
+    total = 0
+    categories, parents, owners = {}, {}, defaultdict(int)
+    prices = [0] * len(ranges)
+    for row in rows:
+        total += row['count']
+        category = categories.setdefault(row['category_id'], {
+            'slug': row['category_id'], 'name': row['category__name'], 'parent': row['category__parent_id'],
+            'count': 0})
+        category['count'] += row['count']
+        # Продукты засчитываются корню всей цепочки родителей; продукты корневой категории - ей самой
+        root_slug, root_name = roots.get(row['category_id'], (row['category_id'], row['category__name']))
+        root = parents.setdefault(root_slug, {'slug': root_slug, 'name': root_name, 'count': 0})
+        root['count'] += row['count']
+        owners[(row['owner_id'], row['owner__email'])] += row['count']
+        for index in range(len(ranges)):
+            prices[index] += row[f'price_{index}']
+
+    top_owners = sorted(({'id': owner_id, 'email': email, 'count': count}
+                         for (owner_id, email), count in owners.items()), key=_by_count)
+    return {
+        'total': total,
+        'categories': sorted(categories.values(), key=_by_count),
+        'parents': sorted(parents.values(), key=_by_count),
+        'prices': [{'from': low, 'to': high, 'count': count} for (low, high), count in zip(ranges, prices)],
+        'owners': top_owners[:FACET_OWNERS_LIMIT],
+    }
@@ -0,0 +1,18 @@
+from rest_framework.filters import SearchFilter
+
+from .search import search_products
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    Поиск продуктов по параметру search через полнотекстовый индекс PostgreSQL.
+
+    В отличие от стандартного SearchFilter не строит icontains по search_fields,
+    а использует search_vector (GIN-индекс) и сортирует результат по релевантности.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+        return search_products(queryset, ' '.join(search_terms))
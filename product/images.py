@@ -0,0 +1,148 @@
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from config.cache import bump_tags
+from .models import Product, ProductImage
+
+# Размеры вариантов: максимальная ширина и высота с сохранением пропорций
+IMAGE_VARIANTS = {
+    'thumbnail': (200, 200),
+    'card': (600, 600),
+    'full': (1600, 1600),
+}
+# Форматы вариантов и параметры кодировщика Pillow
+IMAGE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+VARIANTS_DIR = 'images/variants'
+
+
+def variant_name(source, size, extension):
+    # Имя зависит от исходного файла, поэтому повторный запуск перезаписывает те же файлы
+    stem = os.path.splitext(os.path.basename(source))[0]
+    digest = hashlib.sha1(source.encode()).hexdigest()[:8]
+    return f'{VARIANTS_DIR}/{stem}_{digest}_{size}.{extension}'
+
+
+def is_up_to_date(source, variants):
+    """
+    Проверяет, что варианты построены для текущего файла и все они существуют в хранилище.
+    """
+    if not source or not variants or variants.get('source') != source:
+        return False
+    paths = [variants.get(size, {}).get(extension) for size in IMAGE_VARIANTS for extension in IMAGE_FORMATS]
+    return all(path and default_storage.exists(path) for path in paths)
+
+
+def generate_variants(source):
+    """
+    Строит уменьшенные копии изображения в форматах WebP и JPEG без метаданных.
+
+    Аргументы:
+    - source (str): Имя исходного файла в хранилище (например, 'images/photo.jpg').
+
+    Возвращает:
+    - dict: {'source': source, 'thumbnail': {'webp': путь, 'jpeg': путь}, ...}.
+    """
+    with default_storage.open(source, 'rb') as file:
+        original = Image.open(file)
+        # Поворачиваем по EXIF до удаления метаданных, иначе фото с телефона окажутся боком
+        original = ImageOps.exif_transpose(original)
+        original.load()
+    has_alpha = original.mode in ('RGBA', 'LA') or (original.mode == 'P' and 'transparency' in original.info)
+    original = original.convert('RGBA' if has_alpha else 'RGB')
+    original.info = {}
+
+    variants = {'source': source}
+    for size, box in IMAGE_VARIANTS.items():
+        resized = original.copy()
+        resized.thumbnail(box, Image.LANCZOS)
+        variants[size] = {}
+        for extension, (image_format, options) in IMAGE_FORMATS.items():
+            image = resized
+            if image_format == 'JPEG' and image.mode != 'RGB':
+                # В JPEG нет прозрачности: подкладываем белый фон
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            buffer = BytesIO()
+            image.save(buffer, image_format, **options)
+            name = variant_name(source, size, extension)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            variants[size][extension] = default_storage.save(name, ContentFile(buffer.getvalue()))
+    return variants
+
+
+def _generate_safely(source):
+    try:
+        return source, generate_variants(source), None
+    except Exception as error:  # повреждённый или не-графический файл не должен останавливать обработку
+        return source, None, str(error)
+
+
+def process_images(sources, workers=None):
+    """
+    Строит варианты для набора изображений в пуле процессов.
+
+    Внутри демонических процессов (воркеры Celery) дочерние процессы создавать нельзя,
+    поэтому там изображения обрабатываются последовательно.
+
+    Возвращает:
+    - generator: Тройки (source, variants | None, ошибка | None).
+    """
+    sources = list(dict.fromkeys(source for source in sources if source))
+    if workers == 1 or len(sources) < 2 or multiprocessing.current_process().daemon:
+        yield from map(_generate_safely, sources)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(_generate_safely, sources)
+
+
+def process_product_images(products, workers=None):
+    """
+    Строит недостающие варианты превью и изображений продуктов и сохраняет пути к ним.
+
+    Уже обработанные файлы пропускаются, поэтому повторный запуск безопасен.
+
+    Аргументы:
+    - products (QuerySet): Продукты, изображения которых нужно обработать.
+    - workers (int | None): Количество процессов в пуле (None - по числу ядер).
+
+    Возвращает:
+    - tuple: (количество обработанных файлов, список ошибок).
+    """
+    pending = {}
+    for row in products.values('id', 'preview', 'preview_variants'):
+        if row['preview'] and not is_up_to_date(row['preview'], row['preview_variants']):
+            pending.setdefault(row['preview'], []).append(
+                (Product, 'preview', 'preview_variants', row['id'], row['id']))
+    for row in ProductImage.objects.filter(product__in=products).values('id', 'image', 'variants', 'product_id'):
+        if row['image'] and not is_up_to_date(row['image'], row['variants']):
+            pending.setdefault(row['image'], []).append(
+                (ProductImage, 'image', 'variants', row['id'], row['product_id']))
+
+    processed, errors, touched = 0, [], set()
+    for source, variants, error in process_images(pending, workers):
+        if error:
+            errors.append(f'{source}: {error}')
+            continue
+        for model, source_field, variants_field, pk, product_id in pending[source]:
+            # Файл могли заменить, пока строились варианты: тогда запись не трогаем
+            if model.objects.filter(pk=pk, **{source_field: source}).update(**{variants_field: variants}):
+                touched.add(product_id)
+        processed += 1
+    if touched:
+        # Пути записаны через update() без сигналов: обновляем updated_at (ETag карточки) и кеш списков явно
+        Product.objects.filter(id__in=touched).update(updated_at=timezone.now())
+        bump_tags('products')
+    return processed, errors
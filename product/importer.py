@@ -0,0 +1,172 @@
+import csv
+import io
+import json
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.functions import Lower
+from rest_framework import serializers
+
+from category.models import Category
+from config.cache import bump_tags
+from .models import Product, ProductStats
+from .search import update_search_vectors
+
+User = get_user_model()
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+IMPORT_BATCH_SIZE = 1000
+
+
+class ImportRowSerializer(serializers.Serializer):
+    """
+    Проверка одной строки импорта.
+
+    Категория и владелец передаются slug-ом и email-ом и разрешаются по словарям
+    ProductImporter, чтобы не делать запросов на каждую строку.
+    """
+    title = serializers.CharField(max_length=150)
+    description = serializers.CharField()
+    category = serializers.CharField(max_length=50)
+    owner = serializers.EmailField(required=False, allow_blank=True)
+    price = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=0)
+    quantity = serializers.IntegerField(min_value=0, max_value=32767, required=False, default=0)
+
+
+def read_rows(stream, file_format):
+    """
+    Построчно читает CSV или JSONL, не загружая файл в память целиком.
+
+    Аргументы:
+    - stream (file): Текстовый или бинарный поток.
+    - file_format (str): 'csv' или 'jsonl'.
+
+    Возвращает:
+    - generator: Пары (номер строки, dict с данными | строка с ошибкой разбора).
+    """
+    if isinstance(stream.read(0), bytes):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig')
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            # Пустые ячейки считаем отсутствующими, чтобы сработали значения по умолчанию
+            yield reader.line_num, {key: value for key, value in row.items() if key and value not in ('', None)}
+        return
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield line_number, f'Invalid JSON: {error}'
+            continue
+        yield line_number, row if isinstance(row, dict) else 'Expected a JSON object'
+
+
+class ProductImporter:
+    """
+    Потоковый импорт продуктов пачками.
+
+    Строки проверяются пачками по batch_size, каждая пачка сохраняется одним
+    bulk_create в отдельной транзакции. Ошибочные строки попадают в errors и не
+    прерывают загрузку остальных.
+
+    Атрибуты:
+    - default_owner (User | None): Владелец для строк без колонки owner.
+    - batch_size (int): Количество строк в одной пачке.
+    - created (int): Количество созданных продуктов.
+    - errors (list): Ошибки в виде {'line': номер строки, 'errors': описание}.
+    """
+
+    def __init__(self, default_owner=None, batch_size=IMPORT_BATCH_SIZE):
+        self.default_owner = default_owner
+        self.batch_size = batch_size
+        self.created = 0
+        self.errors = []
+        # Категорий немного, поэтому загружаем их один раз; владельцев подгружаем по мере появления
+        self.categories = set(Category.objects.values_list('slug', flat=True))
+        self.owners = {}
+
+    def run(self, rows):
+        batch = []
+        for line_number, row in rows:
+            batch.append((line_number, row))
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch)
+                batch = []
+        if batch:
+            self.import_batch(batch)
+        if self.created:
+            from .tasks import schedule_similar_products
+
+            # bulk_create не вызывает сигналы: сбрасываем кеш списков продуктов явно
+            transaction.on_commit(lambda: bump_tags('products'))
+            transaction.on_commit(schedule_similar_products)
+        return self
+
+    def resolve_owners(self, emails):
+        missing = {email.lower() for email in emails} - self.owners.keys()
+        if missing:
+            # Email в базе может храниться с заглавными буквами: сравниваем без учёта регистра
+            users = User.objects.annotate(email_lower=Lower('email')).filter(email_lower__in=missing)
+            for user_id, email in users.values_list('id', 'email_lower'):
+                self.owners[email] = user_id
+            # Запоминаем и отсутствующих, чтобы не искать их повторно
+            self.owners.update({email: None for email in missing - self.owners.keys()})
+
+    def validate(self, row):
+        if isinstance(row, str):
+            return None, row
+        serializer = ImportRowSerializer(data=row)
+        if not serializer.is_valid():
+            return None, serializer.errors
+        data = serializer.validated_data
+        errors = {}
+        if data['category'] not in self.categories:
+            errors['category'] = f'Unknown category "{data["category"]}"'
+        owner = data.get('owner')
+        owner_id = self.owners.get(owner.lower()) if owner else getattr(self.default_owner, 'pk', None)
+        if owner_id is None:
+            errors['owner'] = f'Unknown owner "{owner}"' if owner else 'Owner is required'
+        if errors:
+            return None, errors
+        return Product(owner_id=owner_id, category_id=data['category'], title=data['title'],
+                       description=data['description'], price=data['price'], quantity=data['quantity']), None
+
+    def import_batch(self, batch):
+        self.resolve_owners(str(row['owner']) for _, row in batch if isinstance(row, dict) and row.get('owner'))
+        products = []
+        for line_number, row in batch:
+            product, errors = self.validate(row)
+            if errors:
+                self.errors.append({'line': line_number, 'errors': errors})
+            else:
+                products.append(product)
+        if not products:
+            return
+        with transaction.atomic():
+            # bulk_create не вызывает сигналы post_save, поэтому статистику и поисковые векторы создаём здесь
+            products = Product.objects.bulk_create(products)
+            ids = [product.pk for product in products]
+            ProductStats.objects.bulk_create([ProductStats(product_id=pk) for pk in ids])
+            update_search_vectors(Product.objects.filter(id__in=ids))
+        self.created += len(products)
+
+
+def import_products(stream, file_format, default_owner=None, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Импортирует продукты из CSV или JSONL.
+
+    Аргументы:
+    - stream (file): Поток с данными; колонки: title, description, category (slug),
+      owner (email, необязательно), price, quantity.
+    - file_format (str): 'csv' или 'jsonl'.
+    - default_owner (User | None): Владелец для строк без owner.
+    - batch_size (int): Количество строк в одной транзакции.
+
+    Возвращает:
+    - ProductImporter: Результат с количеством созданных продуктов и ошибками по строкам.
+    """
+    if file_format not in IMPORT_FORMATS:
+        raise ValueError(f'Unsupported format "{file_format}"')
+    return ProductImporter(default_owner, batch_size).run(read_rows(stream, file_format))
@@ -0,0 +1,136 @@
+from django.core.cache import cache
+from django.db.models import F, FloatField, Window
+from django.db.models.functions import Cast, RowNumber
+
+from config.cache import bump_tags
+from .models import Product, ProductStats
+
+# Сколько продуктов показываем в блоке рекомендаций
+LEADERBOARD_SIZE = 5
+# Сколько продуктов храним в кеше, чтобы точечные обновления не опустошали список
+LEADERBOARD_DEPTH = 50
+# Время жизни в кеше; периодическая задача обновляет списки гораздо чаще
+LEADERBOARD_TIMEOUT = 60 * 60 * 24
+
+
+def leaderboard_key(category=None):
+    return f'leaderboard:{category or "all"}'
+
+
+def _rated_stats():
+    # Статистика продуктов, у которых есть хотя бы один отзыв, со средней оценкой
+    return ProductStats.objects.filter(rating_count__gt=0).annotate(
+        rating=Cast(F('rating_sum'), FloatField()) / F('rating_count'))
+
+
+def _entry(row):
+    return {
+        'id': row['product_id'],
+        'title': row['product__title'],
+        'rating': row['rating'],
+        'preview': row['product__preview'],
+        'category': row['product__category_id'],
+    }
+
+
+ENTRY_FIELDS = ('product_id', 'product__title', 'rating', 'product__preview', 'product__category_id')
+
+
+def build_leaderboards(depth=LEADERBOARD_DEPTH):
+    """
+    Рассчитывает общий список лучших продуктов и списки по каждой категории.
+
+    Оба расчёта выполняются по таблице ProductStats: один запрос для общего списка
+    и один запрос с оконной функцией для всех категорий сразу.
+
+    Возвращает:
+    - dict: Ключ кеша -> список продуктов, отсортированный по убыванию рейтинга.
+    """
+    ordering = ('-rating', 'product_id')
+    boards = {leaderboard_key(): [_entry(row) for row in _rated_stats().order_by(*ordering).values(*ENTRY_FIELDS)[:depth]]}
+    per_category = _rated_stats().annotate(
+        position=Window(RowNumber(), partition_by=F('product__category_id'), order_by=[F('rating').desc(), 'product_id'])
+    ).filter(position__lte=depth).order_by('product__category_id', 'position').values(*ENTRY_FIELDS)
+    for row in per_category:
+        boards.setdefault(leaderboard_key(row['product__category_id']), []).append(_entry(row))
+    return boards
+
+
+def _bump_if_top_changed(old_board, new_board):
+    # Блок рекомендаций входит в ETag карточки продукта: меняем версию, только если изменился показываемый топ
+    if (old_board or [])[:LEADERBOARD_SIZE] != (new_board or [])[:LEADERBOARD_SIZE]:
+        bump_tags('recommendations')
+
+
+def refresh_leaderboards():
+    """
+    Пересчитывает и сохраняет в кеш все списки лучших продуктов.
+    """
+    old_board = cache.get(leaderboard_key())
+    boards = build_leaderboards()
+    cache.set_many(boards, timeout=LEADERBOARD_TIMEOUT)
+    _bump_if_top_changed(old_board, boards.get(leaderboard_key()))
+    return len(boards)
+
+
+def _merge(board, entry):
+    # Убирает старую запись продукта и вставляет новую, если она попадает в топ
+    board = [item for item in board if item['id'] != entry['id']]
+    if entry['rating'] is not None:
+        board.append(entry)
+    board.sort(key=lambda item: (-item['rating'], item['id']))
+    return board[:LEADERBOARD_DEPTH]
+
+
+def patch_leaderboard(product_id):
+    """
+    Точечно обновляет закешированные списки после изменения отзывов продукта.
+
+    Если продукт выпал из списка, который уже был заполнен до LEADERBOARD_DEPTH,
+    список пересчитывается целиком, чтобы не потерять продукты за его пределами.
+    """
+    row = _rated_stats().filter(product_id=product_id).values(*ENTRY_FIELDS).first()
+    if row is None:
+        category = Product.objects.filter(pk=product_id).values_list('category_id', flat=True).first()
+        entry = {'id': product_id, 'rating': None, 'category': category}
+    else:
+        entry = _entry(row)
+    keys = [leaderboard_key(), leaderboard_key(entry['category'])]
+    boards = cache.get_many(keys)
+    updated = {}
+    for key, board in boards.items():
+        merged = _merge(board, entry)
+        if len(board) >= LEADERBOARD_DEPTH and len(merged) < LEADERBOARD_DEPTH:
+            return refresh_leaderboards()
+        updated[key] = merged
+    if updated:
+        cache.set_many(updated, timeout=LEADERBOARD_TIMEOUT)
+        if leaderboard_key() in updated:
+            _bump_if_top_changed(boards[leaderboard_key()], updated[leaderboard_key()])
+
+
+def get_leaderboard(category=None, size=LEADERBOARD_SIZE):
+    """
+    Возвращает лучшие продукты по рейтингу одним обращением к кешу.
+
+    Аргументы:
+    - category (str | None): Slug категории, None - общий список.
+    - size (int): Количество продуктов в ответе.
+
+    Возвращает:
+    - list: Несохранённые экземпляры Product с атрибутом rating.
+    """
+    key = leaderboard_key(category)
+    board = cache.get(key)
+    if board is None:
+        boards = build_leaderboards()
+        cache.set_many(boards, timeout=LEADERBOARD_TIMEOUT)
+        board = boards.get(key, [])
+        if key not in boards:
+            cache.set(key, board, timeout=LEADERBOARD_TIMEOUT)
+    products = []
+    for item in board[:size]:
+        product = Product(id=item['id'], title=item['title'], preview=item['preview'], category_id=item['category'])
+        product.rating = item['rating']
+        products.append(product)
+    return products
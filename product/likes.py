@@ -0,0 +1,296 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from .models import Likes, Product, ProductStats
+
+User = get_user_model()
+
+# Хеш user_id -> 1 для пользователей, лайкнувших продукт
+LIKES_KEY = 'likes:product:{}'
+# Множество продуктов, лайки которых загружены в Redis
+LIKES_WARM_KEY = 'likes:warm'
+# Пары "product_id:user_id", изменённые после последнего сброса в базу
+LIKES_DIRTY_KEY = 'likes:dirty'
+# Пары, которые сейчас сбрасываются в базу (переживает падение воркера)
+LIKES_FLUSHING_KEY = 'likes:flushing'
+# Блокировка сброса в базу; её же держит rebuild_like_cache на всё время перестроения
+LIKES_FLUSH_LOCK = 'likes:flush:lock'
+LIKES_FLUSH_LOCK_TIMEOUT = 10 * 60
+LIKES_FLUSH_BATCH = 1000
+# Сколько раз rebuild_like_cache повторяет сброс, если во время перестроения приходят новые переключения
+LIKES_REBUILD_ATTEMPTS = 5
+
+# Переключает лайк и помечает пару как изменённую; возвращает новое состояние
+TOGGLE_SCRIPT = """
+local member = ARGV[2] .. ':' .. ARGV[1]
+redis.call('SADD', KEYS[2], member)
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], 1)
+return 1
+"""
+
+# Загружает лайки продукта из базы, если продукт ещё не загружен другим процессом
+WARM_SCRIPT = """
+if redis.call('SISMEMBER', KEYS[2], ARGV[1]) == 1 then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+for i = 2, #ARGV do
+    redis.call('HSET', KEYS[1], ARGV[i], 1)
+end
+redis.call('SADD', KEYS[2], ARGV[1])
+return 1
+"""
+
+# Удаляет загруженные лайки, только если не осталось несброшенных переключений (ARGV[2] == '1' - удалить всё)
+CLEAR_SCRIPT = """
+if ARGV[2] ~= '1' and (redis.call('SCARD', KEYS[2]) > 0 or redis.call('EXISTS', KEYS[3]) == 1) then
+    return 0
+end
+for _, product_id in ipairs(redis.call('SMEMBERS', KEYS[1])) do
+    redis.call('DEL', ARGV[1] .. product_id)
+end
+redis.call('DEL', KEYS[1], KEYS[2], KEYS[3])
+return 1
+"""
+
+
+def get_connection():
+    # Отдельное соединение 'likes': несброшенные переключения не должны пропадать при очистке кеша
+    return get_redis_connection('likes')
+
+
+def acquire_flush_lock(connection, wait=False):
+    """
+    Захватывает блокировку сброса лайков.
+
+    Аргументы:
+    - wait (bool): Ждать освобождения блокировки, а не возвращать False сразу.
+    """
+    while not connection.set(LIKES_FLUSH_LOCK, 1, nx=True, ex=LIKES_FLUSH_LOCK_TIMEOUT):
+        if not wait:
+            return False
+        time.sleep(0.5)
+    return True
+
+
+def warm_products(product_ids, connection=None):
+    """
+    Загружает в Redis лайки продуктов, которых там ещё нет (один запрос к базе на все продукты).
+    """
+    connection = connection or get_connection()
+    product_ids = list(product_ids)
+    pipe = connection.pipeline(transaction=False)
+    for product_id in product_ids:
+        pipe.sismember(LIKES_WARM_KEY, product_id)
+    cold = [product_id for product_id, warm in zip(product_ids, pipe.execute()) if not warm]
+    if not cold:
+        return
+    liked = {product_id: [] for product_id in cold}
+    for product_id, user_id in Likes.objects.filter(product_id__in=cold, is_liked=True).values_list(
+            'product_id', 'user_id'):
+        liked[product_id].append(user_id)
+    warm = connection.register_script(WARM_SCRIPT)
+    for product_id, user_ids in liked.items():
+        warm(keys=[LIKES_KEY.format(product_id), LIKES_WARM_KEY], args=[product_id, *user_ids], client=connection)
+
+
+def toggle_like(product_id, user_id):
+    """
+    Переключает лайк пользователя в Redis; запись в базу выполнит flush_likes.
+
+    Возвращает:
+    - bool: True, если после переключения продукт лайкнут.
+    """
+    connection = get_connection()
+    warm_products([product_id], connection)
+    toggle = connection.register_script(TOGGLE_SCRIPT)
+    return bool(toggle(keys=[LIKES_KEY.format(product_id), LIKES_DIRTY_KEY], args=[user_id, product_id],
+                       client=connection))
+
+
+def like_counts(product_ids):
+    """
+    Возвращает количество лайков продуктов из Redis.
+
+    Возвращает:
+    - dict: product_id -> количество лайков.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+    connection = get_connection()
+    warm_products(product_ids, connection)
+    pipe = connection.pipeline(transaction=False)
+    for product_id in product_ids:
+        pipe.hlen(LIKES_KEY.format(product_id))
+    return dict(zip(product_ids, pipe.execute()))
+
+
+def liked_product_ids(user_id, product_ids):
+    """
+    Возвращает множество продуктов из product_ids, которые лайкнул пользователь.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return set()
+    connection = get_connection()
+    warm_products(product_ids, connection)
+    pipe = connection.pipeline(transaction=False)
+    for product_id in product_ids:
+        pipe.hexists(LIKES_KEY.format(product_id), user_id)
+    return {product_id for product_id, liked in zip(product_ids, pipe.execute()) if liked}
+
+
+def sync_like(product_id, user_id, liked):
+    """
+    Переносит в Redis изменение лайка, сделанное напрямую в базе (например, через админку).
+    """
+    connection = get_connection()
+    if not connection.sismember(LIKES_WARM_KEY, product_id):
+        return
+    if liked:
+        connection.hset(LIKES_KEY.format(product_id), user_id, 1)
+    else:
+        connection.hdel(LIKES_KEY.format(product_id), user_id)
+
+
+def refresh_likes_count(product_ids=None):
+    """
+    Пересчитывает ProductStats.likes_count по таблице Likes одним UPDATE.
+
+    Аргументы:
+    - product_ids (iterable | None): Идентификаторы продуктов, None - все продукты.
+    """
+    liked = Likes.objects.filter(product=OuterRef('product'), is_liked=True).values('product').annotate(
+        count=Count('id')).values('count')
+    queryset = ProductStats.objects.all()
+    if product_ids is not None:
+        queryset = queryset.filter(product_id__in=product_ids)
+    return queryset.update(likes_count=Coalesce(Subquery(liked), Value(0)), updated_at=timezone.now())
+
+
+def _apply_states(states):
+    # states: {(product_id, user_id): liked} - текущее состояние из Redis
+    product_ids = set(Product.objects.filter(id__in={product_id for product_id, _ in states}).values_list(
+        'id', flat=True))
+    user_ids = set(User.objects.filter(id__in={user_id for _, user_id in states}).values_list('id', flat=True))
+    # Продукт или пользователь могли быть удалены, пока переключение ждало сброса
+    states = {(product_id, user_id): liked for (product_id, user_id), liked in states.items()
+              if product_id in product_ids and user_id in user_ids}
+    with transaction.atomic():
+        existing = Likes.objects.filter(product_id__in=product_ids, user_id__in=user_ids).select_for_update()
+        seen, changed = set(), []
+        for like in existing:
+            key = (like.product_id, like.user_id)
+            if key not in states:
+                continue
+            seen.add(key)
+            if like.is_liked != states[key]:
+                like.is_liked = states[key]
+                changed.append(like)
+        Likes.objects.bulk_update(changed, ['is_liked'], batch_size=LIKES_FLUSH_BATCH)
+        Likes.objects.bulk_create([
+            Likes(product_id=product_id, user_id=user_id, is_liked=True)
+            for (product_id, user_id), liked in states.items() if liked and (product_id, user_id) not in seen
+        ], batch_size=LIKES_FLUSH_BATCH)
+        refresh_likes_count(product_ids)
+
+
+def flush_likes(batch_size=LIKES_FLUSH_BATCH):
+    """
+    Сбрасывает накопленные в Redis переключения лайков в таблицы Likes и ProductStats.
+
+    Записывается итоговое состояние пары (пользователь, продукт), а не каждое
+    нажатие, поэтому повторная обработка после сбоя безопасна.
+
+    Возвращает:
+    - int: Количество обработанных пар.
+    """
+    connection = get_connection()
+    if not acquire_flush_lock(connection):
+        return 0
+    try:
+        return _flush_pending(connection, batch_size)
+    finally:
+        connection.delete(LIKES_FLUSH_LOCK)
+
+
+def _flush_pending(connection, batch_size=LIKES_FLUSH_BATCH):
+    # Незавершённый предыдущий сброс обрабатываем повторно, иначе забираем новые изменения
+    if not connection.exists(LIKES_FLUSHING_KEY):
+        if not connection.exists(LIKES_DIRTY_KEY):
+            return 0
+        connection.rename(LIKES_DIRTY_KEY, LIKES_FLUSHING_KEY)
+    total, batch = 0, []
+    for member in connection.sscan_iter(LIKES_FLUSHING_KEY, count=batch_size):
+        batch.append(tuple(int(part) for part in member.decode().split(':')))
+        if len(batch) >= batch_size:
+            total += _flush_batch(connection, batch)
+            batch = []
+    if batch:
+        total += _flush_batch(connection, batch)
+    connection.delete(LIKES_FLUSHING_KEY)
+    return total
+
+
+def _flush_batch(connection, pairs):
+    pipe = connection.pipeline(transaction=False)
+    for product_id, user_id in pairs:
+        pipe.hexists(LIKES_KEY.format(product_id), user_id)
+    _apply_states({pair: bool(liked) for pair, liked in zip(pairs, pipe.execute())})
+    return len(pairs)
+
+
+def rebuild_like_cache(discard_pending=False, chunk_size=1000):
+    """
+    Перестраивает данные лайков в Redis по базе и сверяет ProductStats.likes_count.
+
+    Блокировка сброса удерживается всё перестроение. Загруженные лайки удаляются
+    одним скриптом и только если после сброса не пришли новые переключения;
+    иначе сброс повторяется, поэтому переключения во время перестроения не теряются.
+
+    Аргументы:
+    - discard_pending (bool): Не сбрасывать в базу ещё не записанные переключения.
+    - chunk_size (int): Количество продуктов, загружаемых за один запрос.
+
+    Возвращает:
+    - int: Количество продуктов с лайками, загруженных в Redis.
+    """
+    connection = get_connection()
+    acquire_flush_lock(connection, wait=True)
+    try:
+        _clear_likes(connection, discard_pending)
+        return _warm_all(connection, chunk_size)
+    finally:
+        connection.delete(LIKES_FLUSH_LOCK)
+
+
+def _clear_likes(connection, discard_pending):
+    clear = connection.register_script(CLEAR_SCRIPT)
+    keys = [LIKES_WARM_KEY, LIKES_DIRTY_KEY, LIKES_FLUSHING_KEY]
+    for _ in range(LIKES_REBUILD_ATTEMPTS):
+        if not discard_pending:
+            _flush_pending(connection)
+        if clear(keys=keys, args=[LIKES_KEY.format(''), int(discard_pending)], client=connection):
+            return
+    raise RuntimeError('Likes keep changing during the rebuild, try again later')
+
+
+def _warm_all(connection, chunk_size):
+    product_ids = list(Likes.objects.filter(is_liked=True).order_by('product_id').values_list(
+        'product_id', flat=True).distinct())
+    for start in range(0, len(product_ids), chunk_size):
+        chunk = product_ids[start:start + chunk_size]
+        warm_products(chunk, connection)
+    refresh_likes_count()
+    return len(product_ids)
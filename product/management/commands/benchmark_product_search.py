@@ -0,0 +1,90 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils.crypto import get_random_string
+
+from category.models import Category
+from product.models import Product
+from product.search import search_products, update_search_vectors
+
+User = get_user_model()
+
+WORDS = (
+    'телефон', 'смартфон', 'чехол', 'кроссовки', 'куртка', 'рюкзак', 'ноутбук', 'наушники', 'часы', 'велосипед',
+    'чайник', 'диван', 'лампа', 'камера', 'кабель', 'зарядка', 'игрушка', 'книга', 'мяч', 'палатка',
+    'phone', 'case', 'sneakers', 'jacket', 'backpack', 'laptop', 'headphones', 'watch', 'bicycle', 'kettle',
+    'sofa', 'lamp', 'camera', 'cable', 'charger', 'toy', 'book', 'ball', 'tent', 'wireless',
+    'новый', 'черный', 'белый', 'кожаный', 'детский', 'спортивный', 'new', 'black', 'white', 'leather',
+)
+QUERIES = ('смартфон', 'кроссовки', 'кожаная куртка', 'wireless headphones', 'laptop', 'палатки', 'black sofa')
+
+
+def random_text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+class Command(BaseCommand):
+    help = 'Compare product search latency: icontains scan vs full-text search (run on a disposable database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, nargs='?', const=1_000_000, default=0,
+                            help='Insert N generated products before measuring (default N: 1 000 000)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert when seeding')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per query and search path')
+        parser.add_argument('--page-size', type=int, default=12, help='Rows fetched per search (one page)')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['seed'], options['batch_size'])
+
+        self.stdout.write(f'Catalog size: {Product.objects.count()} products')
+        paths = {
+            'icontains': lambda text: Product.objects.filter(
+                Q(title__icontains=text) | Q(description__icontains=text)).order_by('id'),
+            'full-text': lambda text: search_products(Product.objects.all(), text),
+        }
+        for text in QUERIES:
+            for name, build in paths.items():
+                timings = []
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    queryset = build(text)
+                    count = queryset.count()
+                    list(queryset[:options['page_size']])
+                    timings.append((time.perf_counter() - started) * 1000)
+                self.stdout.write(
+                    f'{text!r:26} {name:10} matches={count:<8} '
+                    f'median={statistics.median(timings):9.1f} ms  max={max(timings):9.1f} ms')
+
+    def seed(self, total, batch_size):
+        rng = random.Random(42)
+        owner = User.objects.filter(is_superuser=True).first() or User.objects.create_user(
+            'search-benchmark@example.com', get_random_string(16), is_active=True)
+        category, _ = Category.objects.get_or_create(slug='search-benchmark', defaults={'name': 'Search benchmark'})
+        last_id = Product.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        created = 0
+        while created < total:
+            size = min(batch_size, total - created)
+            Product.objects.bulk_create([
+                Product(owner=owner, category=category, price=rng.randint(100, 100000), quantity=rng.randint(0, 50),
+                        title=random_text(rng, 3).capitalize(),
+                        description=f'<p>{random_text(rng, 25)}</p><p>{random_text(rng, 25)}</p>')
+                for _ in range(size)
+            ])
+            created += size
+            self.stdout.write(f'Seeded {created}/{total}', ending='\r')
+        self.stdout.write('')
+        # bulk_create не вызывает сигналы, поэтому векторы считаем пачками отдельно
+        while True:
+            ids = list(Product.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            update_search_vectors(Product.objects.filter(id__in=ids))
+            last_id = ids[-1]
+
+# запуск сравнения на сгенерированном каталоге из миллиона продуктов
+# python manage.py benchmark_product_search --seed
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from product.recommender import (NEIGHBORS_TOP_K, RECOMMENDATIONS_BATCH_SIZE, RECOMMENDATIONS_TOP_K,
+                                 compute_recommendations)
+
+
+class Command(BaseCommand):
+    help = 'Recompute collaborative-filtering product neighbors and per-user recommendations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--neighbors', type=int, default=NEIGHBORS_TOP_K,
+                            help='Number of neighbors stored per product')
+        parser.add_argument('--top', type=int, default=RECOMMENDATIONS_TOP_K,
+                            help='Number of recommendations stored per user')
+        parser.add_argument('--batch-size', type=int, default=RECOMMENDATIONS_BATCH_SIZE,
+                            help='Rows multiplied and saved per batch')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        products, users = compute_recommendations(options['neighbors'], options['top'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Recommendations computed for {products} products and {users} users '
+            f'in {time.perf_counter() - started:.1f} s'))
+
+# пересчёт рекомендаций
+# python manage.py compute_recommendations
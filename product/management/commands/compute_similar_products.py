@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from product.similarity import SIMILAR_BATCH_SIZE, SIMILAR_TOP_K, compute_similar_products
+
+
+class Command(BaseCommand):
+    help = 'Recompute precomputed similar-product lists (TF-IDF cosine similarity)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=SIMILAR_TOP_K,
+                            help='Number of neighbors stored per product')
+        parser.add_argument('--batch-size', type=int, default=SIMILAR_BATCH_SIZE,
+                            help='Number of products scored per batch')
+
+    def handle(self, *args, **options):
+        total = compute_similar_products(k=options['top_k'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Computed similar products for {total} products'))
+
+# запуск пересчёта похожих продуктов
+# python manage.py compute_similar_products
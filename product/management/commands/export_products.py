@@ -0,0 +1,13 @@
+from config.exports import ExportCommand
+from product.models import PRODUCT_EXPORT_FIELDS, Product
+
+
+class Command(ExportCommand):
+    help = 'Stream the product catalog to CSV/JSONL using a server-side cursor'
+    fields = PRODUCT_EXPORT_FIELDS
+
+    def get_queryset(self):
+        return Product.objects.order_by('id')
+
+# выгрузка каталога в сжатый CSV
+# python manage.py export_products products.csv.gz --gzip
@@ -0,0 +1,39 @@
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from product.importer import IMPORT_BATCH_SIZE, IMPORT_FORMATS, import_products
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Bulk import products from a CSV or JSONL file (invalid rows are reported and skipped)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the CSV/JSONL file')
+        parser.add_argument('--format', choices=IMPORT_FORMATS,
+                            help='Input format (detected from the file extension by default)')
+        parser.add_argument('--owner', help='Email of the owner for rows without an "owner" column')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+                            help='Number of rows validated and inserted per transaction')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        if file_format not in IMPORT_FORMATS:
+            raise CommandError('Unknown file format, pass --format csv or --format jsonl')
+        owner = None
+        if options['owner']:
+            owner = User.objects.filter(email__iexact=options['owner']).first()
+            if owner is None:
+                raise CommandError(f'User {options["owner"]} does not exist')
+
+        with open(options['path'], encoding='utf-8-sig', newline='') as stream:
+            result = import_products(stream, file_format, owner, options['batch_size'])
+        for error in result.errors:
+            self.stderr.write(f'line {error["line"]}: {error["errors"]}')
+        self.stdout.write(self.style.SUCCESS(f'Imported {result.created} products, {len(result.errors)} rows failed'))
+
+# импорт каталога поставщика
+# python manage.py import_products catalog.csv --owner admin@example.com
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from product.images import process_product_images
+from product.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Generate resized WebP/JPEG variants for product previews and images (skips up-to-date files)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Size of the process pool (defaults to the number of CPUs)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of products handled per batch')
+
+    def handle(self, *args, **options):
+        last_id, processed = 0, 0
+        while True:
+            ids = list(Product.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[
+                       :options['batch_size']])
+            if not ids:
+                break
+            count, errors = process_product_images(Product.objects.filter(id__in=ids), options['workers'])
+            processed += count
+            for error in errors:
+                self.stderr.write(error)
+            last_id = ids[-1]
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} images'))
+
+# построение уменьшенных копий изображений
+# python manage.py process_product_images --workers 4
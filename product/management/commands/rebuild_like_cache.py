@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from product.likes import rebuild_like_cache
+
+
+class Command(BaseCommand):
+    help = 'Rebuild Redis like state from the database and reconcile likes counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--discard-pending', action='store_true',
+                            help='Drop toggles not yet flushed to the database instead of flushing them first')
+
+    def handle(self, *args, **options):
+        total = rebuild_like_cache(discard_pending=options['discard_pending'])
+        self.stdout.write(self.style.SUCCESS(f'Loaded likes for {total} products into Redis'))
+
+# сверка лайков Redis с базой
+# python manage.py rebuild_like_cache
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from product.models import ProductStats
+
+
+class Command(BaseCommand):
+    help = 'Rebuild denormalized product rating/likes/favorites statistics from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Number of products recalculated per batch')
+        parser.add_argument('products', nargs='*', type=int,
+                            help='Product ids to rebuild (all products by default)')
+
+    def handle(self, *args, **options):
+        product_ids = options['products'] or None
+        total = ProductStats.rebuild(product_ids, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt statistics for {total} products'))
+
+# запуск пересчёта статистики
+# python manage.py rebuild_product_stats
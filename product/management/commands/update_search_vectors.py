@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from product.models import Product
+from product.search import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Recalculate full-text search vectors for products'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Number of products updated per UPDATE statement')
+        parser.add_argument('--missing', action='store_true',
+                            help='Only update products without a search vector')
+
+    def handle(self, *args, **options):
+        queryset = Product.objects.order_by('id')
+        if options['missing']:
+            queryset = queryset.filter(search_vector__isnull=True)
+        batch_size = options['batch_size']
+        last_id, total = 0, 0
+        while True:
+            ids = list(queryset.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            total += update_search_vectors(Product.objects.filter(id__in=ids))
+            last_id = ids[-1]
+        self.stdout.write(self.style.SUCCESS(f'Updated search vectors for {total} products'))
+
+# запуск пересчёта поисковых векторов
+# python manage.py update_search_vectors
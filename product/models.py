@@ -1,8 +1,17 @@
+from collections import Counter, defaultdict
 from random import randint
 from django.contrib.auth import get_user_model
-from django.db import models
-from django.db.models import Avg, Count
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models, transaction
+from django.db.models import Avg, Count, F, Q, Sum
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
 from category.models import Category
+from config.cache import register_cache_tags
+from tracking.models import PageView
 from ckeditor.fields import RichTextField
 from decimal import Decimal
 
@@ -21,8 +30,10 @@ class Product(models.Model):
     - price (DecimalField): Цена продукта.
     - quantity (PositiveSmallIntegerField): Количество доступных продуктов.
     - preview (ImageField): Превью изображение продукта.
+    - preview_variants (JSONField): Пути к уменьшенным копиям превью (WebP/JPEG), заполняются задачей Celery.
     - created_at (DateTimeField): Дата создания продукта.
     - updated_at (DateTimeField): Дата обновления продукта.
+    - search_vector (SearchVectorField): Полнотекстовый индекс по названию и описанию (обновляется сигналом).
     """
     owner = models.ForeignKey(User, on_delete=models.RESTRICT, related_name='products')
     title = models.CharField(max_length=150)
@@ -31,13 +42,25 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=12, decimal_places=2)
     quantity = models.PositiveSmallIntegerField(default=0)
     preview = models.ImageField(upload_to='images/', null=True)
+    preview_variants = models.JSONField(default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector'], name='product_search_vector_gin'),
+        ]
 
     def __str__(self):
         return self.title
 
 
+# Колонки выгрузки каталога (export_products и /products/export/)
+PRODUCT_EXPORT_FIELDS = ('id', 'title', 'description', 'category', 'owner__email', 'price', 'quantity',
+                         'created_at', 'updated_at')
+
+
 class ProductImage(models.Model):
     """
     Модель для изображений продуктов.
@@ -45,9 +68,11 @@ class ProductImage(models.Model):
     Атрибуты:
     - product (ForeignKey): Продукт, к которому относится изображение.
     - image (ImageField): Изображение продукта.
+    - variants (JSONField): Пути к уменьшенным копиям изображения (WebP/JPEG), заполняются задачей Celery.
     """
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='images', blank=True, null=True)
+    variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def generate_name(self):
         return 'image' + str(randint(100000, 999999))
@@ -94,6 +119,401 @@ class Favorite(models.Model):
     def __str__(self):
         return f'{self.product} -> {self.user} -> {self.favorite}'
 
+
+class SimilarProduct(models.Model):
+    """
+    Предрассчитанный список похожих продуктов (TF-IDF по названию, описанию и категории).
+
+    Атрибуты:
+    - product (ForeignKey): Продукт, для которого рассчитан список.
+    - similar (ForeignKey): Похожий продукт.
+    - score (FloatField): Косинусное сходство продуктов.
+    - rank (PositiveSmallIntegerField): Позиция в списке похожих (0 - самый похожий).
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similar_links')
+    similar = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similar_for')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ['product', 'rank']
+        verbose_name = 'similar product'
+        verbose_name_plural = 'similar products'
+
+    def __str__(self):
+        return f'{self.product_id} -> {self.similar_id} ({self.score:.3f})'
+
+
+class ProductNeighbor(models.Model):
+    """
+    Предрассчитанные соседи продукта по поведению пользователей (item-item коллаборативная фильтрация).
+
+    Атрибуты:
+    - product (ForeignKey): Продукт, для которого рассчитан список.
+    - neighbor (ForeignKey): Продукт, с которым пользователи взаимодействуют вместе с product.
+    - score (FloatField): Косинусное сходство векторов взаимодействий.
+    - rank (PositiveSmallIntegerField): Позиция в списке соседей (0 - самый близкий).
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='neighbor_links')
+    neighbor = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='neighbor_for')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ['product', 'rank']
+        verbose_name = 'product neighbor'
+        verbose_name_plural = 'product neighbors'
+
+    def __str__(self):
+        return f'{self.product_id} -> {self.neighbor_id} ({self.score:.3f})'
+
+
+class UserRecommendation(models.Model):
+    """
+    Предрассчитанные персональные рекомендации пользователя.
+
+    Атрибуты:
+    - user (ForeignKey): Пользователь.
+    - product (ForeignKey): Рекомендованный продукт.
+    - score (FloatField): Оценка рекомендации (сумма сходств с продуктами пользователя).
+    - rank (PositiveSmallIntegerField): Позиция в списке рекомендаций (0 - лучшая).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recommendations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommended_for')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        unique_together = ['user', 'rank']
+        verbose_name = 'user recommendation'
+        verbose_name_plural = 'user recommendations'
+
+    def __str__(self):
+        return f'{self.user_id} -> {self.product_id} ({self.score:.3f})'
+
+
+class TrendingSnapshot(models.Model):
+    """
+    Модель снимка списка популярных сейчас продуктов.
+
+    Атрибуты:
+    - product (ForeignKey): Продукт из списка.
+    - score (FloatField): Балл популярности с учётом затухания на момент снимка.
+    - rank (PositiveSmallIntegerField): Место продукта в списке (с нуля).
+    - created_at (DateTimeField): Момент снимка (общий для всех строк одного снимка).
+    """
+    product = models.ForeignKey(Product, related_name='trending_snapshots', on_delete=models.CASCADE)
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ('-created_at', 'rank')
+
+
+class ProductStats(models.Model):
+    """
+    Денормализованная статистика продукта (отзывы, лайки, избранное).
+
+    Счётчики обновляются инкрементально F-выражениями из обработчиков сигналов
+    Review, Likes и Favorite, поэтому сериализатор читает их без дополнительных запросов.
+    Полный пересчёт выполняет команда rebuild_product_stats.
+
+    Атрибуты:
+    - product (OneToOneField): Продукт, к которому относится статистика.
+    - rating_sum (PositiveIntegerField): Сумма оценок всех отзывов.
+    - rating_count (PositiveIntegerField): Количество отзывов.
+    - stars_1 ... stars_5 (PositiveIntegerField): Гистограмма оценок от 1 до 5.
+    - likes_count (PositiveIntegerField): Количество активных лайков.
+    - favorites_count (PositiveIntegerField): Количество добавлений в избранное.
+    - updated_at (DateTimeField): Дата последнего изменения статистики.
+    """
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+    likes_count = models.PositiveIntegerField(default=0)
+    favorites_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'product stats'
+        verbose_name_plural = 'product stats'
+        indexes = [
+            # Фильтр "не меньше N лайков" и сортировка по лайкам
+            models.Index(fields=['likes_count', 'product'], name='product_stats_likes_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} -> {self.rating_count} reviews, {self.likes_count} likes'
+
+    @property
+    def rating_avg(self):
+        return self.rating_sum / self.rating_count if self.rating_count else None
+
+    @property
+    def stars(self):
+        return {str(mark): getattr(self, f'stars_{mark}') for mark in range(5, 0, -1)}
+
+    @classmethod
+    def for_product(cls, product):
+        """
+        Возвращает статистику продукта, пересчитывая её, если запись ещё не создана.
+        """
+        try:
+            return product.stats
+        except cls.DoesNotExist:
+            cls.rebuild([product.pk])
+            return cls.objects.get(product_id=product.pk)
+
+    @classmethod
+    def apply(cls, product_id, create_missing=False, **deltas):
+        """
+        Атомарно применяет приращения к счётчикам продукта через F-выражения.
+
+        Аргументы:
+        - product_id (int): Идентификатор продукта.
+        - create_missing (bool): Пересчитать статистику с нуля, если записи ещё нет.
+        - **deltas: Приращения счётчиков, например likes_count=1.
+
+        Примечание:
+        - Уменьшение не опускает счётчик ниже нуля: если статистика разошлась с данными
+          (запись без статистики, удаление в обход сигналов), удаление не падает на
+          ограничении PositiveIntegerField, а расхождение исправляет rebuild.
+        """
+        changes = {field: F(field) + delta if delta > 0 else Greatest(F(field) + delta, 0)
+                   for field, delta in deltas.items() if delta}
+        if not changes:
+            return
+        changes['updated_at'] = timezone.now()
+        updated = cls.objects.filter(product_id=product_id).update(**changes)
+        if not updated and create_missing:
+            # Пересчёт уже учитывает только что сохранённую запись, поэтому приращение не применяем.
+            cls.rebuild([product_id])
+
+    @classmethod
+    def shift(cls, old, new):
+        """
+        Переносит вклад записи (отзыва, лайка, избранного) из старого состояния в новое.
+
+        Аргументы:
+        - old (tuple | None): Пара (product_id, {поле: значение}) до сохранения.
+        - new (tuple | None): Пара (product_id, {поле: значение}) после сохранения, None при удалении.
+        """
+        deltas = defaultdict(Counter)
+        if old:
+            for field, value in old[1].items():
+                deltas[old[0]][field] -= value
+        if new:
+            for field, value in new[1].items():
+                deltas[new[0]][field] += value
+        for product_id, fields in deltas.items():
+            cls.apply(product_id, create_missing=bool(new) and product_id == new[0], **fields)
+
+    @classmethod
+    def rebuild(cls, product_ids=None, chunk_size=1000):
+        """
+        Пересчитывает статистику с нуля по таблицам отзывов, лайков и избранного.
+
+        Аргументы:
+        - product_ids (iterable | None): Идентификаторы продуктов, None - все продукты.
+        - chunk_size (int): Размер пачки продуктов, обрабатываемой за один проход.
+
+        Возвращает:
+        - int: Количество пересчитанных продуктов.
+        """
+        from rating.models import Review
+
+        if product_ids is None:
+            product_ids = Product.objects.order_by('id').values_list('id', flat=True).iterator(chunk_size=chunk_size)
+        product_ids = iter(product_ids)
+        total = 0
+        while True:
+            chunk = [product_id for _, product_id in zip(range(chunk_size), product_ids)]
+            if not chunk:
+                return total
+            rows = {product_id: cls(product_id=product_id) for product_id in chunk}
+            reviews = Review.objects.filter(product_id__in=chunk).values('product_id').annotate(
+                rating_sum=Sum('rating'), rating_count=Count('id'),
+                **{f'stars_{mark}': Count('id', filter=Q(rating=mark)) for mark in range(1, 6)})
+            for row in reviews:
+                stats = rows[row.pop('product_id')]
+                for field, value in row.items():
+                    setattr(stats, field, value or 0)
+            likes = Likes.objects.filter(product_id__in=chunk, is_liked=True).values('product_id').annotate(
+                count=Count('id'))
+            for row in likes:
+                rows[row['product_id']].likes_count = row['count']
+            favorites = Favorite.objects.filter(product_id__in=chunk, favorite=True).values('product_id').annotate(
+                count=Count('id'))
+            for row in favorites:
+                rows[row['product_id']].favorites_count = row['count']
+            now = timezone.now()
+            for stats in rows.values():
+                stats.updated_at = now
+            cls.objects.bulk_create(
+                rows.values(), update_conflicts=True, unique_fields=['product'],
+                update_fields=[field.name for field in cls._meta.concrete_fields if not field.primary_key])
+            total += len(rows)
+
+
+@receiver(post_save, sender=Product)
+def product_stats_post_save(sender, instance, created, *args, **kwargs):
+    """
+    Создаёт пустую статистику для нового продукта.
+    """
+    if created:
+        ProductStats.objects.get_or_create(product=instance)
+
+
+@receiver(post_save, sender=Product)
+def product_search_vector_update(sender, instance, update_fields=None, *args, **kwargs):
+    """
+    Пересчитывает полнотекстовый вектор продукта после изменения названия или описания.
+    """
+    from .search import update_search_vectors
+
+    if update_fields is None or {'title', 'description'} & set(update_fields):
+        update_search_vectors(Product.objects.filter(pk=instance.pk))
+
+
+# Поля, из которых строятся TF-IDF векторы похожих продуктов (product.similarity.product_terms)
+SIMILARITY_FIELDS = ('title', 'description', 'category_id')
+
+
+def similarity_snapshot(instance):
+    # Отложенные поля (.only()/.defer()) не загружаются ради снимка
+    return tuple(instance.__dict__.get(field) for field in SIMILARITY_FIELDS)
+
+
+@receiver(post_init, sender=Product)
+def product_similarity_snapshot(sender, instance, *args, **kwargs):
+    # Запоминаем загруженные значения, чтобы в post_save отличить правку текста или категории от других правок
+    instance._similarity_snapshot = similarity_snapshot(instance)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_similarity_update(sender, instance, signal, created=False, update_fields=None, *args, **kwargs):
+    """
+    Планирует пересчёт похожих продуктов после изменения каталога.
+
+    Пересчёт нужен только при создании и удалении продукта или при смене названия,
+    описания или категории; правки цены, количества и изображений его не запускают.
+    """
+    from .tasks import schedule_similar_products
+
+    if update_fields is not None and not {'title', 'description', 'category'} & set(update_fields):
+        return
+    snapshot = similarity_snapshot(instance)
+    changed = snapshot != getattr(instance, '_similarity_snapshot', None)
+    instance._similarity_snapshot = snapshot
+    if signal is post_delete or created or changed:
+        transaction.on_commit(schedule_similar_products)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+def product_images_update(sender, instance, *args, **kwargs):
+    """
+    Ставит задачу построения уменьшенных копий, если загружено новое изображение.
+    """
+    from .tasks import process_product_images_task
+
+    if sender is Product:
+        source, variants, product_id = instance.preview.name, instance.preview_variants, instance.pk
+    else:
+        source, variants, product_id = instance.image.name, instance.variants, instance.product_id
+    if source and (variants or {}).get('source') != source:
+        transaction.on_commit(lambda: process_product_images_task.delay(product_id))
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def product_image_touch(sender, instance, *args, **kwargs):
+    """
+    Обновляет Product.updated_at при изменении изображений, чтобы сменился ETag карточки.
+    """
+    Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=PageView)
+def page_view_trending(sender, instance, created, *args, **kwargs):
+    """
+    Учитывает просмотр страницы продукта в списке популярных сейчас продуктов.
+    """
+    from .trending import product_id_from_page, record_event
+
+    product_id = product_id_from_page(instance.page)
+    if created and product_id is not None:
+        record_event(product_id, 'view')
+
+
+def like_contribution(instance):
+    # Вклад лайка в статистику продукта
+    return instance.product_id, {'likes_count': int(bool(instance.__dict__.get('is_liked')))}
+
+
+def favorite_contribution(instance):
+    # Вклад записи избранного в статистику продукта
+    return instance.product_id, {'favorites_count': int(bool(instance.__dict__.get('favorite')))}
+
+
+def track_stats_contribution(model, contribution):
+    """
+    Подключает обработчики сигналов, поддерживающие ProductStats в актуальном состоянии
+    при сохранении и удалении записей модели.
+
+    Аргументы:
+    - model (Model): Модель, записи которой влияют на статистику (Review, Likes, Favorite).
+    - contribution (callable): Функция, возвращающая пару (product_id, {поле: значение}) для записи.
+    """
+    def snapshot(sender, instance, *args, **kwargs):
+        instance._stats_contribution = contribution(instance) if instance.pk else None
+
+    def on_save(sender, instance, *args, **kwargs):
+        new = contribution(instance)
+        ProductStats.shift(getattr(instance, '_stats_contribution', None), new)
+        instance._stats_contribution = new
+
+    def on_delete(sender, instance, *args, **kwargs):
+        ProductStats.shift(getattr(instance, '_stats_contribution', None), None)
+
+    post_init.connect(snapshot, sender=model, weak=False)
+    post_save.connect(on_save, sender=model, weak=False)
+    post_delete.connect(on_delete, sender=model, weak=False)
+
+
+track_stats_contribution(Likes, like_contribution)
+
+
+@receiver(post_save, sender=Likes)
+@receiver(post_delete, sender=Likes)
+def likes_redis_sync(sender, instance, signal, *args, **kwargs):
+    """
+    Переносит в Redis лайки, изменённые напрямую через модель (админка, скрипты).
+
+    Переключения через API пишутся сначала в Redis и попадают в базу массово,
+    минуя этот сигнал.
+    """
+    from .likes import sync_like
+
+    liked = signal is post_save and instance.is_liked
+    product_id, user_id = instance.product_id, instance.user_id
+    transaction.on_commit(lambda: sync_like(product_id, user_id, liked))
+
+
+track_stats_contribution(Favorite, favorite_contribution)
+
+# Закешированные списки продуктов сбрасываются при изменении продуктов и их изображений
+register_cache_tags(Product, 'products')
+register_cache_tags(ProductImage, 'products')
+
+
 # from random import randint
 #
 # from django.contrib.auth import get_user_model
@@ -0,0 +1,181 @@
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from scipy import sparse
+
+from order.models import OrderItem
+from rating.models import Review
+from .models import Favorite, Likes, Product, ProductNeighbor, UserRecommendation
+from .similarity import top_k_neighbors
+
+User = get_user_model()
+
+# Вес взаимодействия пользователя с продуктом: покупка говорит о интересе больше, чем лайк
+INTERACTION_WEIGHTS = {'like': 1.0, 'favorite': 2.0, 'review': 2.0, 'order': 3.0}
+# Отзывы с оценкой ниже не считаются положительным взаимодействием
+REVIEW_MIN_RATING = 4
+# Количество соседей продукта и рекомендаций пользователя, сохраняемых в базе
+NEIGHBORS_TOP_K = 20
+RECOMMENDATIONS_TOP_K = 20
+RECOMMENDATIONS_BATCH_SIZE = 1000
+READ_CHUNK_SIZE = 5000
+
+
+def iter_interactions():
+    """
+    Перебирает положительные взаимодействия пользователей с продуктами без загрузки моделей.
+
+    Возвращает:
+    - generator: Тройки (user_id, product_id, вес).
+    """
+    sources = (
+        (Likes.objects.filter(is_liked=True).values_list('user_id', 'product_id'), INTERACTION_WEIGHTS['like']),
+        (Favorite.objects.filter(favorite=True).values_list('user_id', 'product_id'),
+         INTERACTION_WEIGHTS['favorite']),
+        (Review.objects.filter(rating__gte=REVIEW_MIN_RATING).values_list('user_id', 'product_id'),
+         INTERACTION_WEIGHTS['review']),
+        (OrderItem.objects.values_list('order__user_id', 'product_id'), INTERACTION_WEIGHTS['order']),
+    )
+    for queryset, weight in sources:
+        for user_id, product_id in queryset.iterator(chunk_size=READ_CHUNK_SIZE):
+            yield user_id, product_id, weight
+
+
+def build_interaction_matrix(interactions):
+    """
+    Строит разреженную матрицу пользователь x продукт.
+
+    Повторные взаимодействия суммируются и сглаживаются логарифмом,
+    чтобы десяток заказов одного товара не перевешивал остальные сигналы.
+
+    Возвращает:
+    - tuple: (csr_matrix, массив user_id строк, массив product_id столбцов).
+    """
+    users, products, weights = [], [], []
+    for user_id, product_id, weight in interactions:
+        users.append(user_id)
+        products.append(product_id)
+        weights.append(weight)
+    user_ids, rows = np.unique(np.array(users, dtype=np.int64), return_inverse=True)
+    product_ids, cols = np.unique(np.array(products, dtype=np.int64), return_inverse=True)
+    matrix = sparse.csr_matrix((np.array(weights, dtype=np.float64), (rows, cols)),
+                               shape=(len(user_ids), len(product_ids)))
+    matrix.sum_duplicates()
+    matrix.data = np.log1p(matrix.data)
+    return matrix, user_ids, product_ids
+
+
+def normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.csr_matrix(sparse.diags(1.0 / norms) @ matrix)
+
+
+def top_k_recommendations(matrix, neighbors, k=RECOMMENDATIONS_TOP_K, batch_size=RECOMMENDATIONS_BATCH_SIZE):
+    """
+    Считает рекомендации пользователей: сумма сходств соседей продуктов, с которыми пользователь взаимодействовал.
+
+    Аргументы:
+    - matrix (csr_matrix): Взаимодействия пользователь x продукт.
+    - neighbors (csr_matrix): Сходства продукт x продукт (только top-k соседей).
+
+    Возвращает:
+    - generator: Пары (номер строки пользователя, [(номер продукта, оценка), ...]).
+    """
+    for start in range(0, matrix.shape[0], batch_size):
+        interacted = matrix[start:start + batch_size]
+        block = (interacted @ neighbors).tocsr()
+        for offset in range(block.shape[0]):
+            begin, end = block.indptr[offset], block.indptr[offset + 1]
+            indices, scores = block.indices[begin:end], block.data[begin:end]
+            # Уже купленное или лайкнутое не рекомендуем
+            seen = interacted.indices[interacted.indptr[offset]:interacted.indptr[offset + 1]]
+            mask = ~np.isin(indices, seen) & (scores > 0)
+            indices, scores = indices[mask], scores[mask]
+            if len(scores) > k:
+                best = np.argpartition(-scores, k)[:k]
+                indices, scores = indices[best], scores[best]
+            order = np.lexsort((indices, -scores))
+            yield start + offset, list(zip(indices[order].tolist(), scores[order].tolist()))
+
+
+def compute_recommendations(neighbors_k=NEIGHBORS_TOP_K, recommendations_k=RECOMMENDATIONS_TOP_K,
+                            batch_size=RECOMMENDATIONS_BATCH_SIZE):
+    """
+    Пересчитывает ProductNeighbor и UserRecommendation по всем взаимодействиям.
+
+    Сходство продуктов считается пачками по batch_size (similarity.top_k_neighbors),
+    от каждого продукта остаются neighbors_k соседей, по ним строятся рекомендации пользователей.
+    Записи продуктов и пользователей, у которых не осталось взаимодействий, удаляются.
+
+    Возвращает:
+    - tuple: (количество продуктов, количество пользователей).
+    """
+    matrix, user_ids, product_ids = build_interaction_matrix(iter_interactions())
+    _delete_missing(ProductNeighbor.objects.all(), 'product_id', product_ids, batch_size)
+    _delete_missing(UserRecommendation.objects.all(), 'user_id', user_ids, batch_size)
+    if not matrix.nnz:
+        return 0, 0
+
+    rows, cols, values, batch = [], [], [], []
+    for row, neighbors in top_k_neighbors(normalize_rows(matrix.T.tocsr()), k=neighbors_k, batch_size=batch_size):
+        batch.append((int(product_ids[row]), [(int(product_ids[col]), score) for col, score in neighbors]))
+        for col, score in neighbors:
+            rows.append(row)
+            cols.append(col)
+            values.append(score)
+        if len(batch) >= batch_size:
+            _save_neighbors(batch)
+            batch = []
+    if batch:
+        _save_neighbors(batch)
+
+    neighbors = sparse.csr_matrix((values, (rows, cols)), shape=(len(product_ids), len(product_ids)))
+    batch = []
+    for row, recommended in top_k_recommendations(matrix, neighbors, k=recommendations_k, batch_size=batch_size):
+        batch.append((int(user_ids[row]), [(int(product_ids[col]), score) for col, score in recommended]))
+        if len(batch) >= batch_size:
+            _save_recommendations(batch)
+            batch = []
+    if batch:
+        _save_recommendations(batch)
+    return len(product_ids), len(user_ids)
+
+
+def _delete_missing(queryset, field, ids, batch_size):
+    # Продукты и пользователи вне текущей матрицы потеряли все взаимодействия: их старые списки устарели
+    current = set(ids.tolist())
+    stale = [pk for pk in queryset.values_list(field, flat=True).distinct().iterator(chunk_size=READ_CHUNK_SIZE)
+             if pk not in current]
+    for start in range(0, len(stale), batch_size):
+        queryset.filter(**{f'{field}__in': stale[start:start + batch_size]}).delete()
+
+
+def _save_neighbors(batch):
+    links = [
+        ProductNeighbor(product_id=product_id, neighbor_id=neighbor_id, score=score, rank=rank)
+        for product_id, neighbors in batch
+        for rank, (neighbor_id, score) in enumerate(neighbors)
+    ]
+    with transaction.atomic():
+        # Продукты могли быть удалены, пока шёл расчёт
+        existing = set(Product.objects.filter(
+            id__in={link.product_id for link in links} | {link.neighbor_id for link in links}
+        ).values_list('id', flat=True))
+        ProductNeighbor.objects.filter(product_id__in=[product_id for product_id, _ in batch]).delete()
+        ProductNeighbor.objects.bulk_create(
+            [link for link in links if link.product_id in existing and link.neighbor_id in existing])
+
+
+def _save_recommendations(batch):
+    items = [
+        UserRecommendation(user_id=user_id, product_id=product_id, score=score, rank=rank)
+        for user_id, recommended in batch
+        for rank, (product_id, score) in enumerate(recommended)
+    ]
+    with transaction.atomic():
+        users = set(User.objects.filter(id__in={item.user_id for item in items}).values_list('id', flat=True))
+        products = set(Product.objects.filter(id__in={item.product_id for item in items}).values_list('id', flat=True))
+        UserRecommendation.objects.filter(user_id__in=[user_id for user_id, _ in batch]).delete()
+        UserRecommendation.objects.bulk_create(
+            [item for item in items if item.user_id in users and item.product_id in products])
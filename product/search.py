@@ -0,0 +1,65 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import F, Func, TextField, Value
+
+# Конфигурации PostgreSQL, по которым строится вектор и разбирается запрос (стемминг)
+SEARCH_CONFIGS = ('russian', 'english')
+
+
+class StripTags(Func):
+    """
+    Удаляет HTML-разметку из текста средствами PostgreSQL (описание хранится как RichText).
+    """
+    function = 'regexp_replace'
+    output_field = TextField()
+
+    def __init__(self, expression, **extra):
+        super().__init__(expression, Value('<[^>]*>'), Value(' '), Value('g'), **extra)
+
+
+def search_vector_expression():
+    """
+    Выражение полнотекстового вектора продукта.
+
+    Название получает вес A, очищенное от разметки описание - вес B;
+    каждое поле индексируется и русским, и английским стеммером.
+    """
+    vector = None
+    for config in SEARCH_CONFIGS:
+        for expression, weight in ((F('title'), 'A'), (StripTags(F('description')), 'B')):
+            part = SearchVector(expression, config=config, weight=weight)
+            vector = part if vector is None else vector + part
+    return vector
+
+
+def update_search_vectors(queryset):
+    """
+    Пересчитывает search_vector для продуктов из queryset одним UPDATE.
+
+    Возвращает:
+    - int: Количество обновлённых продуктов.
+    """
+    return queryset.update(search_vector=search_vector_expression())
+
+
+def build_search_query(text):
+    query = None
+    for config in SEARCH_CONFIGS:
+        part = SearchQuery(text, config=config, search_type='websearch')
+        query = part if query is None else query | part
+    return query
+
+
+def search_products(queryset, text):
+    """
+    Фильтрует продукты по полнотекстовому запросу и сортирует по релевантности.
+
+    Аргументы:
+    - queryset (QuerySet): Исходный набор продуктов.
+    - text (str): Поисковая строка пользователя (синтаксис websearch).
+
+    Возвращает:
+    - QuerySet: Продукты, подходящие под запрос, по убыванию ранга.
+    """
+    query = build_search_query(text)
+    return queryset.filter(search_vector=query).annotate(
+        search_rank=SearchRank(F('search_vector'), query)).order_by('-search_rank', 'id')
@@ -1,12 +1,31 @@
-from django.db.models import Avg, Q, Count
+from django.core.files.storage import default_storage
+from django.db import models
+from django.db.models import Q, Count
 from django.shortcuts import get_object_or_404
 from rest_framework import serializers
 from decouple import config
 
+from config.serializers import SparseFieldsetMixin
 from rating.models import Review
-from .models import Product, ProductImage, Likes, Favorite
+from .leaderboard import get_leaderboard
+from .likes import like_counts, liked_product_ids
+from .models import Product, ProductImage, Favorite, ProductStats
 from category.models import Category
 
+# Поле с URL уменьшенных копий изображения: {'thumbnail': {'webp': url, 'jpeg': url}, ...}.
+class ImageVariantsField(serializers.ReadOnlyField):
+    def to_representation(self, value):
+        request = self.context.get('request')
+        variants = {}
+        for size, paths in (value or {}).items():
+            if size == 'source':
+                continue
+            variants[size] = {
+                extension: request.build_absolute_uri(default_storage.url(path)) if request else default_storage.url(path)
+                for extension, path in paths.items()
+            }
+        return variants
+
 # Сериализатор для отображения рекомендованных продуктов с их рейтингом.
 class RecommendedProductSerializer(serializers.ModelSerializer):
     rating = serializers.FloatField()
@@ -22,97 +41,133 @@ class SimilarProductSerializer(serializers.ModelSerializer):
         fields = ('id', 'title', 'preview')
 
 # Сериализатор для списка продуктов с базовой информацией.
-class ProductListSerializer(serializers.ModelSerializer):
+class ProductListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     owner_email = serializers.ReadOnlyField(source='owner.email')
     category_name = serializers.ReadOnlyField(source='category.name')
     parent = serializers.ReadOnlyField(source='category.parent.slug')
+    preview_variants = ImageVariantsField()
 
     class Meta:
         model = Product
         fields = ('id', 'owner', 'owner_email', 'category_name', 'parent', 'title',
-                  'price', 'preview')
+                  'price', 'preview', 'preview_variants')
+
+# Сериализатор для списка продуктов с количеством лайков.
+class ProductLikesListSerializer(ProductListSerializer):
+    likes_count = serializers.ReadOnlyField(source='stats.likes_count')
+
+    class Meta(ProductListSerializer.Meta):
+        fields = ProductListSerializer.Meta.fields + ('likes_count',)
 
 # Сериализатор для изображений продукта.
 class ProductImageSerializer(serializers.ModelSerializer):
+    variants = ImageVariantsField()
+
     class Meta:
         model = ProductImage
-        fields = ('id', 'image')
+        fields = ('id', 'image', 'variants')
+
+def resolve_user_flags(request, products):
+    """
+    Собирает лайки и избранное текущего пользователя для набора продуктов.
+
+    Аргументы:
+    - request (Request | None): Объект запроса с пользователем.
+    - products (iterable): Продукты страницы.
+
+    Возвращает:
+    - dict: ids - идентификаторы продуктов, likes_count - количество лайков по продуктам,
+      liked и favorite - множества идентификаторов продуктов, которые пользователь
+      лайкнул и добавил в избранное.
+    """
+    ids = {product.pk for product in products}
+    # Лайки обслуживаются из Redis (product/likes.py) и сбрасываются в базу периодической задачей
+    flags = {'ids': ids, 'likes_count': like_counts(ids), 'liked': set(), 'favorite': set()}
+    user = getattr(request, 'user', None)
+    if not ids or user is None or not user.is_authenticated:
+        return flags
+    flags['liked'] = liked_product_ids(user.pk, ids)
+    flags['favorite'] = set(Favorite.objects.filter(user=user, product_id__in=ids, favorite=True)
+                            .values_list('product_id', flat=True))
+    return flags
+
+
+# Сериализатор списка для ProductSerializer: флаги пользователя считаются одним запросом на страницу.
+class ProductBatchListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        products = list(data.all() if isinstance(data, models.Manager) else data)
+        if self.child.wants(*ProductSerializer.flag_fields):
+            self.context['user_product_flags'] = resolve_user_flags(self.context.get('request'), products)
+        return super().to_representation(products)
+
 
 # Сериализатор для подробной информации о продукте.
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     images = ProductImageSerializer(many=True, read_only=True)
     owner_email = serializers.ReadOnlyField(source='owner.email')
     owner = serializers.ReadOnlyField(source='owner.id')
     parent = serializers.ReadOnlyField(source='category.parent.slug')
     similar_products = serializers.SerializerMethodField()
     recommended_products = serializers.SerializerMethodField()
+    preview_variants = ImageVariantsField()
 
     class Meta:
         model = Product
         fields = (
             'id', 'owner', 'owner_email', 'title', 'description', 'category', 'parent',
-            'price', 'quantity', 'created_at', 'updated_at', 'preview', 'images',
+            'price', 'quantity', 'created_at', 'updated_at', 'preview', 'preview_variants', 'images',
             'similar_products', 'recommended_products'
         )
+        list_serializer_class = ProductBatchListSerializer
+
+    # Блоки, добавляемые в to_representation: статистика отзывов и флаги лайков/избранного
+    stats_fields = ('rating', 'stars')
+    flag_fields = ('likes_count', 'liked_by_user', 'favorite_by_user')
+    computed_fields = stats_fields + flag_fields
 
     # Метод для получения списка похожих продуктов.
     def get_similar_products(self, obj):
-        similar_products = Product.objects.filter(title__icontains=obj.title.split()[0]).exclude(id=obj.id)[:5]
+        # Списки предрассчитаны в SimilarProduct, выборка идёт по индексу (product, rank)
+        similar_products = Product.objects.filter(similar_for__product=obj).order_by('similar_for__rank')[:5]
         serializer = SimilarProductSerializer(similar_products, many=True)
         return serializer.data
 
-    # Метод для получения среднего рейтинга продукта.
-    @staticmethod
-    def get_avg_r(product):
-        return product.reviews.aggregate(Avg('rating'))['rating__avg']
-
-    # Метод для получения списка рекомендованных продуктов.
+    # Метод для получения списка рекомендованных продуктов из закешированного рейтинга.
     def get_recommended_products(self, instance):
-        products = Product.objects.all()
-        ls = []
-        for product in products:
-            avg_rating = self.get_avg_r(product)
-            if avg_rating is not None:
-                data = {
-                    'id': product.id,
-                    'title': product.title,
-                    'rating': avg_rating,
-                    'preview': product.preview,
-                }
-                ls.append(data)
-
-        recommended_products = sorted(ls, key=lambda x: x['rating'], reverse=True)[:5]
-        serializer = RecommendedProductSerializer(recommended_products, many=True)
+        serializer = RecommendedProductSerializer(get_leaderboard(), many=True)
         return serializer.data
 
     # Метод для получения количества отзывов с разными оценками.
     @staticmethod
     def get_stars(instance):
-        stars = {
-            '5': instance.reviews.filter(rating=5).count(), '4': instance.reviews.filter(rating=4).count(),
-            '3': instance.reviews.filter(rating=3).count(), '2': instance.reviews.filter(rating=2).count(),
-            '1': instance.reviews.filter(rating=1).count()}
-        return stars
+        return ProductStats.for_product(instance).stars
 
     # Метод для представления данных продукта.
     def to_representation(self, instance):
-        request = self.context.get('request')
         repr = super().to_representation(instance)
-        repr['rating'] = instance.reviews.aggregate(Avg('rating'))
-        rating = repr['rating']
-        rating['ratings_count'] = instance.reviews.count()
-        repr['stars'] = self.get_stars(instance)
-        repr['likes_count'] = instance.likes.filter(is_liked=True).count()
-        repr['liked_by_user'] = False
-        repr['favorite_by_user'] = False
-        if request:
-            if request.user.is_authenticated:
-                repr['liked_by_user'] = Likes.objects.filter(user=request.user, product=instance,
-                                                             is_liked=True).exists()
-                repr['favorite_by_user'] = Favorite.objects.filter(user=request.user, favorite=True,
-                                                                   product=instance).exists()
+        # Блоки, не запрошенные через ?fields= / ?omit=, не вычисляются вовсе
+        computed = {}
+        if self.wants(*self.computed_fields):
+            # Статистика денормализована в ProductStats и подгружается через select_related('stats')
+            stats = ProductStats.for_product(instance)
+            computed['rating'] = {'rating__avg': stats.rating_avg, 'ratings_count': stats.rating_count}
+            computed['stars'] = stats.stars
+            if self.wants(*self.flag_fields):
+                flags = self.get_user_flags(instance)
+                computed['likes_count'] = flags['likes_count'].get(instance.pk, stats.likes_count)
+                computed['liked_by_user'] = instance.pk in flags['liked']
+                computed['favorite_by_user'] = instance.pk in flags['favorite']
+        repr.update((name, value) for name, value in computed.items() if self.wants(name))
         return repr
 
+    # Метод для получения флагов "лайк" и "избранное" текущего пользователя.
+    def get_user_flags(self, instance):
+        # Для списка флаги уже собраны ProductBatchListSerializer одним запросом на всю страницу
+        flags = self.context.get('user_product_flags')
+        if flags is None or instance.pk not in flags['ids']:
+            flags = resolve_user_flags(self.context.get('request'), [instance])
+        return flags
+
     # Метод для создания нового продукта.
     def create(self, validated_data):
         request = self.context.get('request')
@@ -0,0 +1,150 @@
+import re
+from collections import Counter
+
+import numpy as np
+from django.db import transaction
+from django.utils.html import strip_tags
+from scipy import sparse
+
+from config.cache import bump_tags
+from .models import Product, SimilarProduct
+
+# Количество похожих продуктов, сохраняемых для каждого продукта
+SIMILAR_TOP_K = 10
+# Количество продуктов, для которых сходство считается за один проход
+SIMILAR_BATCH_SIZE = 500
+# Во сколько раз слова из названия весомее слов из описания
+TITLE_WEIGHT = 3
+CATEGORY_WEIGHT = 2
+# Термины, встречающиеся больше чем в этой доле продуктов (служебные слова, крупные категории),
+# почти не различают продукты, но делают произведение в top_k_neighbors почти плотным
+SIMILAR_MAX_DF = 0.5
+
+TOKEN_RE = re.compile(r'\w{2,}', re.UNICODE)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(strip_tags(text or '').lower())
+
+
+def product_terms(title, description, category_id, parent_id):
+    """
+    Собирает взвешенный мешок слов продукта.
+
+    Возвращает:
+    - Counter: Термин -> количество вхождений с учётом весов.
+    """
+    terms = Counter(tokenize(description))
+    for token in tokenize(title):
+        terms[token] += TITLE_WEIGHT
+    for category in (category_id, parent_id):
+        if category:
+            terms[f'category:{category}'] += CATEGORY_WEIGHT
+    return terms
+
+
+def build_tfidf(documents, max_df=SIMILAR_MAX_DF):
+    """
+    Строит нормированную TF-IDF матрицу (строки - продукты).
+
+    Аргументы:
+    - documents (list[Counter]): Мешки слов продуктов.
+    - max_df (float): Максимальная доля продуктов с термином; более частые термины отбрасываются.
+
+    Возвращает:
+    - scipy.sparse.csr_matrix: Матрица с L2-нормированными строками.
+    """
+    vocabulary = {}
+    rows, cols, values = [], [], []
+    for row, terms in enumerate(documents):
+        for term, count in terms.items():
+            rows.append(row)
+            cols.append(vocabulary.setdefault(term, len(vocabulary)))
+            values.append(count)
+    shape = (len(documents), len(vocabulary))
+    matrix = sparse.csr_matrix((np.array(values, dtype=np.float64), (rows, cols)), shape=shape)
+    # Сублинейный TF и сглаженный IDF
+    matrix.data = 1.0 + np.log(matrix.data)
+    document_frequency = np.bincount(matrix.indices, minlength=shape[1])
+    keep = np.flatnonzero(document_frequency <= max_df * shape[0])
+    matrix, document_frequency = matrix[:, keep], document_frequency[keep]
+    idf = np.log((1.0 + shape[0]) / (1.0 + document_frequency)) + 1.0
+    matrix = matrix @ sparse.diags(idf)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.csr_matrix(sparse.diags(1.0 / norms) @ matrix)
+
+
+def top_k_neighbors(matrix, k=SIMILAR_TOP_K, batch_size=SIMILAR_BATCH_SIZE):
+    """
+    Находит k ближайших соседей для каждой строки матрицы по косинусному сходству.
+
+    Сходство считается пачками разреженного произведения, поэтому полная
+    матрица n x n в памяти не строится.
+
+    Возвращает:
+    - generator: Пары (номер строки, [(номер соседа, сходство), ...]).
+    """
+    transposed = matrix.T.tocsc()
+    for start in range(0, matrix.shape[0], batch_size):
+        block = (matrix[start:start + batch_size] @ transposed).tocsr()
+        for offset in range(block.shape[0]):
+            row = start + offset
+            begin, end = block.indptr[offset], block.indptr[offset + 1]
+            indices, scores = block.indices[begin:end], block.data[begin:end]
+            mask = (indices != row) & (scores > 0)
+            indices, scores = indices[mask], scores[mask]
+            if len(scores) > k:
+                best = np.argpartition(-scores, k)[:k]
+                indices, scores = indices[best], scores[best]
+            order = np.lexsort((indices, -scores))
+            yield row, list(zip(indices[order].tolist(), scores[order].tolist()))
+
+
+def compute_similar_products(k=SIMILAR_TOP_K, batch_size=SIMILAR_BATCH_SIZE):
+    """
+    Пересчитывает таблицу SimilarProduct для всего каталога.
+
+    Записи заменяются пачками по batch_size продуктов, каждая пачка - в своей транзакции.
+
+    Возвращает:
+    - int: Количество обработанных продуктов.
+    """
+    ids, documents = [], []
+    products = Product.objects.order_by('id').values_list(
+        'id', 'title', 'description', 'category_id', 'category__parent_id').iterator(chunk_size=2000)
+    for product_id, title, description, category_id, parent_id in products:
+        ids.append(product_id)
+        documents.append(product_terms(title, description, category_id, parent_id))
+    if not ids:
+        return 0
+
+    matrix = build_tfidf(documents)
+    del documents
+    batch = []
+    for row, neighbors in top_k_neighbors(matrix, k=k, batch_size=batch_size):
+        batch.append((ids[row], neighbors))
+        if len(batch) >= batch_size:
+            _save_batch(ids, batch)
+            batch = []
+    if batch:
+        _save_batch(ids, batch)
+    # Похожие продукты входят в ETag карточки продукта
+    bump_tags('recommendations')
+    return len(ids)
+
+
+def _save_batch(ids, batch):
+    links = [
+        SimilarProduct(product_id=product_id, similar_id=ids[neighbor], score=score, rank=rank)
+        for product_id, neighbors in batch
+        for rank, (neighbor, score) in enumerate(neighbors)
+    ]
+    with transaction.atomic():
+        # Продукты могли быть удалены, пока шёл расчёт
+        existing = set(Product.objects.filter(
+            id__in={link.product_id for link in links} | {link.similar_id for link in links}
+        ).values_list('id', flat=True))
+        links = [link for link in links if link.product_id in existing and link.similar_id in existing]
+        SimilarProduct.objects.filter(product_id__in=[product_id for product_id, _ in batch]).delete()
+        SimilarProduct.objects.bulk_create(links)
@@ -0,0 +1,110 @@
+from django.core.cache import cache
+
+from config.celery import app
+
+from .leaderboard import patch_leaderboard, refresh_leaderboards
+from .likes import flush_likes
+
+# Задержка, за которую изменения каталога собираются в один пересчёт похожих продуктов
+SIMILAR_PRODUCTS_DEBOUNCE = 5 * 60
+SIMILAR_PRODUCTS_SCHEDULED_KEY = 'similar_products:scheduled'
+
+
+@app.task
+def refresh_leaderboards_task():
+    """
+    Периодическая задача пересчёта списков лучших продуктов по рейтингу.
+
+    Примечание:
+    - Результат сохраняется в кеш (Redis) и используется блоком рекомендаций.
+    """
+    return refresh_leaderboards()
+
+
+@app.task
+def patch_leaderboard_task(product_id):
+    """
+    Асинхронная задача точечного обновления списков после изменения отзыва.
+
+    Аргументы:
+    - product_id (int): Идентификатор продукта, отзывы которого изменились.
+    """
+    patch_leaderboard(product_id)
+
+
+@app.task
+def compute_similar_products_task():
+    """
+    Асинхронная задача пересчёта списков похожих продуктов по всему каталогу.
+
+    Примечание:
+    - Флаг планирования снимается до начала расчёта, поэтому изменения, сделанные
+      во время расчёта, запланируют следующий запуск.
+    """
+    from .similarity import compute_similar_products
+
+    cache.delete(SIMILAR_PRODUCTS_SCHEDULED_KEY)
+    return compute_similar_products()
+
+
+def schedule_similar_products():
+    """
+    Планирует пересчёт похожих продуктов не чаще одного раза за SIMILAR_PRODUCTS_DEBOUNCE секунд.
+    """
+    if cache.add(SIMILAR_PRODUCTS_SCHEDULED_KEY, 1, timeout=SIMILAR_PRODUCTS_DEBOUNCE):
+        compute_similar_products_task.apply_async(countdown=SIMILAR_PRODUCTS_DEBOUNCE)
+
+
+@app.task
+def flush_likes_task():
+    """
+    Периодическая задача переноса накопленных в Redis лайков в базу.
+
+    Примечание:
+    - Обновляет таблицу Likes массовыми запросами и пересчитывает ProductStats.likes_count.
+    """
+    return flush_likes()
+
+
+@app.task(bind=True, max_retries=5)
+def process_product_images_task(self, product_id):
+    """
+    Асинхронная задача построения уменьшенных копий превью и изображений продукта.
+
+    Аргументы:
+    - product_id (int): Идентификатор продукта.
+
+    Примечание:
+    - Одновременно обрабатывается не больше одной задачи на продукт, повторные задачи
+      откладываются и затем пропускают уже готовые варианты.
+    """
+    from .images import process_product_images
+    from .models import Product
+
+    lock = f'product_images:{product_id}:lock'
+    if not cache.add(lock, 1, timeout=10 * 60):
+        raise self.retry(countdown=30)
+    try:
+        return process_product_images(Product.objects.filter(pk=product_id))[0]
+    finally:
+        cache.delete(lock)
+
+
+@app.task
+def save_trending_snapshot_task():
+    """
+    Периодическая задача: приводит баллы популярности к текущему моменту и сохраняет снимок топа в базу.
+    """
+    from .trending import save_trending_snapshot
+
+    return save_trending_snapshot()
+
+
+@app.task
+def compute_recommendations_task():
+    """
+    Ночная задача пересчёта персональных рекомендаций и соседей продуктов (коллаборативная фильтрация).
+    """
+    from .recommender import compute_recommendations
+
+    return compute_recommendations()
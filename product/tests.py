@@ -1,3 +1,736 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db.models import Q
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django_redis import get_redis_connection
+from PIL import Image
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from category.models import Category
+from config.cache import cache_response, get_tag_versions, response_cache_key
+from rating.models import Review
+from tracking.models import PageView
+from product import likes
+from product.images import process_product_images
+from product.importer import import_products
+from product.leaderboard import get_leaderboard, leaderboard_key
+from product.models import (PRODUCT_EXPORT_FIELDS, Favorite, Likes, Product, ProductNeighbor, ProductStats,
+                            SimilarProduct, TrendingSnapshot, UserRecommendation)
+from product.recommender import compute_recommendations
+from product.serializers import ProductSerializer
+from product.similarity import build_tfidf, compute_similar_products, product_terms
+from product.trending import (TRENDING_EPOCH_KEY, TRENDING_HALF_LIFE, TRENDING_KEY, get_trending, rebase_trending,
+                              record_events, save_trending_snapshot)
+
+User = get_user_model()
+
+
+class ProductTestMixin:
+    """
+    Общие данные тестов продуктов: администратор, категория и отключённый пересчёт похожих продуктов.
+    """
+
+    def setUp(self):
+        patcher = mock.patch('product.tasks.schedule_similar_products')
+        self.schedule_similar_products = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.admin = User.objects.create_superuser('admin@example.com', 'password123')
+        self.category = Category.objects.create(name='phones')
+
+    def create_product(self, title, description='description', price=100):
+        return Product.objects.create(owner=self.admin, title=title, description=description,
+                                      category=self.category, price=price, quantity=10)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+
+class ProductStatsTest(ProductTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('buyer@example.com', 'password123')
+        self.phone, self.case = self.create_product('phone'), self.create_product('case')
+
+    def stats(self, product):
+        return ProductStats.objects.get(product=product)
+
+    def test_reviews_are_tracked_incrementally(self):
+        review = Review.objects.create(product=self.phone, user=self.user, rating=4)
+        Review.objects.create(product=self.phone, user=self.admin, rating=2)
+        stats = self.stats(self.phone)
+        self.assertEqual((stats.rating_sum, stats.rating_count, stats.rating_avg), (6, 2, 3))
+        self.assertEqual(stats.stars, {'5': 0, '4': 1, '3': 0, '2': 1, '1': 0})
+
+        review.rating = 5
+        review.save()
+        self.assertEqual((self.stats(self.phone).rating_sum, self.stats(self.phone).stars_5), (7, 1))
+
+        # Отзыв перенесён на другой продукт: вклад уходит из старой статистики в новую
+        review.product = self.case
+        review.save()
+        self.assertEqual((self.stats(self.phone).rating_sum, self.stats(self.phone).rating_count), (2, 1))
+        self.assertEqual((self.stats(self.case).rating_sum, self.stats(self.case).stars_5), (5, 1))
+
+        review.delete()
+        self.assertEqual((self.stats(self.case).rating_sum, self.stats(self.case).rating_count), (0, 0))
+
+    def test_likes_and_favorites_are_tracked(self):
+        like = Likes.objects.create(product=self.phone, user=self.user, is_liked=True)
+        Likes.objects.create(product=self.phone, user=self.admin, is_liked=False)
+        favorite = Favorite.objects.create(product=self.phone, user=self.user, favorite=True)
+        self.assertEqual((self.stats(self.phone).likes_count, self.stats(self.phone).favorites_count), (1, 1))
+
+        like.is_liked = False
+        like.save()
+        favorite.delete()
+        self.assertEqual((self.stats(self.phone).likes_count, self.stats(self.phone).favorites_count), (0, 0))
+
+    def test_decrement_after_drift_does_not_go_negative(self):
+        review = Review.objects.create(product=self.phone, user=self.user, rating=3)
+        ProductStats.objects.filter(product=self.phone).update(rating_sum=0, rating_count=0, stars_3=0)
+
+        review.delete()
+        stats = self.stats(self.phone)
+        self.assertEqual((stats.rating_sum, stats.rating_count, stats.stars_3), (0, 0, 0))
+
+    def test_rebuild_repairs_drift(self):
+        Review.objects.create(product=self.phone, user=self.user, rating=5)
+        Likes.objects.create(product=self.case, user=self.user, is_liked=True)
+        ProductStats.objects.update(rating_sum=40, rating_count=9, likes_count=7)
+        ProductStats.objects.filter(product=self.case).delete()
+
+        self.assertEqual(ProductStats.rebuild([self.phone.pk]), 1)
+        self.assertEqual((self.stats(self.phone).rating_sum, self.stats(self.phone).rating_count), (5, 1))
+        call_command('rebuild_product_stats', stdout=io.StringIO())
+        self.assertEqual((self.stats(self.case).likes_count, self.stats(self.case).rating_count), (1, 0))
+
+
+class ProductLikesTest(ProductTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        likes.get_connection().flushdb()
+        self.user = User.objects.create_user('buyer@example.com', 'password123')
+        self.phone = self.create_product('phone')
+
+    def like_state(self):
+        return (list(Likes.objects.filter(product=self.phone).values_list('user_id', 'is_liked')),
+                ProductStats.objects.get(product=self.phone).likes_count)
+
+    def test_toggles_are_buffered_and_flushed_once(self):
+        self.assertEqual([likes.toggle_like(self.phone.pk, self.user.pk) for _ in range(3)], [True, False, True])
+        self.assertEqual(likes.like_counts([self.phone.pk]), {self.phone.pk: 1})
+        self.assertEqual(likes.liked_product_ids(self.user.pk, [self.phone.pk]), {self.phone.pk})
+        self.assertEqual(self.like_state(), ([], 0))
+
+        # В базу попадает итоговое состояние пары, повторный сброс ничего не меняет
+        self.assertEqual(likes.flush_likes(), 1)
+        self.assertEqual(likes.flush_likes(), 0)
+        self.assertEqual(self.like_state(), ([(self.user.pk, True)], 1))
+
+        likes.toggle_like(self.phone.pk, self.user.pk)
+        likes.flush_likes()
+        self.assertEqual(self.like_state(), ([(self.user.pk, False)], 0))
+
+    def test_pending_toggles_survive_cache_clear(self):
+        likes.toggle_like(self.phone.pk, self.user.pk)
+        cache.clear()
+        self.assertEqual(likes.flush_likes(), 1)
+        self.assertEqual(self.like_state(), ([(self.user.pk, True)], 1))
+
+    def test_rebuild_flushes_pending_and_reconciles_drift(self):
+        likes.like_counts([self.phone.pk])
+        # Изменения в обход Redis и сигналов: лайк в базе и неверный счётчик
+        Likes.objects.bulk_create([Likes(product=self.phone, user=self.admin, is_liked=True)])
+        ProductStats.objects.filter(product=self.phone).update(likes_count=5)
+        likes.toggle_like(self.phone.pk, self.user.pk)
+
+        call_command('rebuild_like_cache', stdout=io.StringIO())
+        self.assertEqual(likes.like_counts([self.phone.pk]), {self.phone.pk: 2})
+        self.assertEqual(ProductStats.objects.get(product=self.phone).likes_count, 2)
+
+    def test_rebuild_keeps_toggles_made_during_flush(self):
+        flush_pending = likes._flush_pending
+
+        def flush_then_toggle(connection, *args):
+            total = flush_pending(connection, *args)
+            if not Likes.objects.filter(user=self.admin).exists():
+                likes.toggle_like(self.phone.pk, self.admin.pk)
+            return total
+
+        likes.toggle_like(self.phone.pk, self.user.pk)
+        with mock.patch('product.likes._flush_pending', side_effect=flush_then_toggle):
+            self.assertEqual(likes.rebuild_like_cache(), 1)
+        self.assertEqual(likes.like_counts([self.phone.pk]), {self.phone.pk: 2})
+        self.assertEqual(self.like_state()[1], 2)
+
+
+class ProductUserFlagsTest(ProductTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        likes.get_connection().flushdb()
+        self.user = User.objects.create_user('buyer@example.com', 'password123')
+        self.phone, self.case = self.create_product('phone'), self.create_product('case')
+        likes.toggle_like(self.phone.pk, self.user.pk)
+        Favorite.objects.create(user=self.user, product=self.case, favorite=True)
+
+    def flags(self, data):
+        return {item['id']: (item['likes_count'], item['liked_by_user'], item['favorite_by_user']) for item in data}
+
+    def test_detail_flags_follow_the_user(self):
+        url = f'/api/v1/products/{self.phone.id}/'
+        self.assertEqual(self.flags([self.client_for(self.user).get(url).json()]), {self.phone.id: (1, True, False)})
+        self.assertEqual(self.flags([APIClient().get(url).json()]), {self.phone.id: (1, False, False)})
+
+    def test_list_flags_are_resolved_once_per_page(self):
+        request = Request(APIRequestFactory().get('/api/v1/products/'))
+        request.user = self.user
+        with mock.patch('product.serializers.liked_product_ids', wraps=likes.liked_product_ids) as liked:
+            data = ProductSerializer(Product.objects.order_by('id'), many=True, context={'request': request}).data
+        liked.assert_called_once_with(self.user.pk, {self.phone.id, self.case.id})
+        self.assertEqual(self.flags(data), {self.phone.id: (1, True, False), self.case.id: (0, False, True)})
+
+
+class ProductLikesFilterTest(ProductTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        likes.get_connection().flushdb()
+        self.products = [self.create_product(f'phone {index}') for index in range(3)]
+        users = [User.objects.create_user(f'buyer{index}@example.com', 'password123') for index in range(2)]
+        # У продукта с индексом i - i лайков
+        for index, product in enumerate(self.products):
+            for user in users[:index]:
+                likes.toggle_like(product.pk, user.pk)
+        likes.flush_likes()
+
+    def liked(self, **params):
+        response = self.client_for(self.admin).get('/api/v1/products/likes/', params)
+        self.assertEqual(response.status_code, 200)
+        return [(product['id'], product['likes_count']) for product in response.json()['results']]
+
+    def test_filters_and_orders_by_stored_like_count(self):
+        phone0, phone1, phone2 = self.products
+        self.assertEqual(self.liked(likes_from=1), [(phone1.id, 1), (phone2.id, 2)])
+        self.assertEqual(self.liked(likes_from=0, ordering='-likes'), [(phone2.id, 2), (phone1.id, 1), (phone0.id, 0)])
+        self.assertEqual(self.liked(likes_from=3), [])
+
+    def test_likes_from_is_required_and_admin_only(self):
+        self.assertEqual(self.client_for(self.admin).get('/api/v1/products/likes/', {'likes_from': 'x'}).status_code,
+                         400)
+        self.assertEqual(self.client_for(self.admin).get('/api/v1/products/likes/').status_code, 400)
+        self.assertEqual(APIClient().get('/api/v1/products/likes/', {'likes_from': 0}).status_code, 401)
+
+
+class ProductImagesTest(ProductTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings = override_settings(MEDIA_ROOT=media_root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def upload(self, name, mode='RGBA', size=(800, 400)):
+        buffer = io.BytesIO()
+        Image.new(mode, size, (255, 0, 0, 128) if mode == 'RGBA' else (255, 0, 0)).save(buffer, 'PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def test_variants_are_built_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(owner=self.admin, title='phone', description='description',
+                                             category=self.category, price=100, quantity=10,
+                                             preview=self.upload('phone.png'))
+        product.refresh_from_db()
+        variants = product.preview_variants
+        self.assertEqual(variants['source'], product.preview.name)
+        with Image.open(default_storage.open(variants['thumbnail']['webp'])) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (200, 100)))
+        with Image.open(default_storage.open(variants['card']['jpeg'])) as image:
+            self.assertEqual((image.format, image.mode, image.size), ('JPEG', 'RGB', (600, 300)))
+
+        data = APIClient().get(f'/api/v1/products/{product.id}/').json()
+        self.assertEqual(set(data['preview_variants']), {'thumbnail', 'card', 'full'})
+        self.assertTrue(data['preview_variants']['thumbnail']['webp'].endswith(variants['thumbnail']['webp']))
+        # Повторный запуск пропускает уже построенные варианты
+        self.assertEqual(process_product_images(Product.objects.all()), (0, []))
+
+    def test_broken_image_is_reported(self):
+        product = self.create_product('phone')
+        Product.objects.filter(pk=product.pk).update(
+            preview=default_storage.save('images/broken.png', ContentFile(b'not an image')))
+        processed, errors = process_product_images(Product.objects.all(), workers=1)
+        self.assertEqual((processed, len(errors)), (0, 1))
+        self.assertEqual(Product.objects.get(pk=product.pk).preview_variants, {})
+
+
+class ProductFieldsetTest(ProductTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.phone = self.create_product('phone')
+        self.url = f'/api/v1/products/{self.phone.id}/'
+
+    def test_fields_and_omit_select_top_level_keys(self):
+        client = APIClient()
+        self.assertEqual(client.get(self.url, {'fields': 'id, title,rating'}).json(),
+                         {'id': self.phone.id, 'title': 'phone', 'rating': {'rating__avg': None, 'ratings_count': 0}})
+        data = client.get(self.url, {'omit': 'images,stars'}).json()
+        self.assertNotIn('images', data)
+        self.assertNotIn('stars', data)
+        self.assertIn('liked_by_user', data)
+        self.assertEqual(list(client.get('/api/v1/products/', {'fields': 'id,title'}).json()['results'][0]),
+                         ['id', 'title'])
+
+    def test_unselected_blocks_are_not_computed(self):
+        with mock.patch('product.serializers.get_leaderboard') as leaderboard, \
+                mock.patch('product.serializers.resolve_user_flags') as user_flags:
+            self.client_for(self.admin).get(self.url, {'fields': 'id,stars'})
+            self.client_for(self.admin).get(self.url, {'omit': 'recommended_products,likes_count,liked_by_user,'
+                                                                'favorite_by_user'})
+        leaderboard.assert_not_called()
+        user_flags.assert_not_called()
+
+
+class ProductSearchTest(ProductTestMixin, TestCase):
+
+    def search(self, **params):
+        cache.clear()
+        return [product['id'] for product in APIClient().get('/api/v1/products/', params).json()['results']]
+
+    def test_search_uses_stemming_and_ranks_title_first(self):
+        in_description = self.create_product('Чехол', '<p>Подходит для <b>телефонов</b> Samsung</p>')
+        in_title = self.create_product('Телефон Samsung', 'Смартфон')
+        self.create_product('Ноутбук', 'Apple')
+
+        self.assertEqual(self.search(q='телефон'), [in_title.id, in_description.id])
+        self.assertEqual(self.search(search='samsung'), [in_title.id, in_description.id])
+        # Разметка описания не попадает в индекс
+        self.assertEqual(self.search(q='<b>'), [])
+
+    def test_vector_follows_title_changes(self):
+        product = self.create_product('Nokia', 'classic')
+        product.title = 'Xiaomi'
+        product.save()
+        self.assertEqual(self.search(q='xiaomi'), [product.id])
+
+        Product.objects.filter(pk=product.pk).update(title='Huawei', search_vector=None)
+        self.assertEqual(self.search(q='huawei'), [])
+        call_command('update_search_vectors', '--missing', stdout=io.StringIO())
+        self.assertEqual(self.search(q='huawei'), [product.id])
+
+
+class ProductLeaderboardTest(ProductTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.reviewers = [User.objects.create_user(f'reviewer{index}@example.com', 'password123') for index in range(3)]
+
+    def review(self, product, *ratings):
+        with self.captureOnCommitCallbacks(execute=True):
+            for user, rating in zip(self.reviewers, ratings):
+                Review.objects.update_or_create(product=product, user=user, defaults={'rating': rating})
+
+    def test_leaderboard_by_rating_and_category(self):
+        phone, case, note = self.create_product('phone'), self.create_product('case'), self.create_product('note')
+        Product.objects.filter(pk=note.pk).update(category=Category.objects.create(name='books'))
+        self.review(phone, 4, 4)
+        self.review(case, 5, 4)
+        self.review(note, 5)
+        self.create_product('unrated')
+
+        self.assertEqual([(product.id, product.rating) for product in get_leaderboard()],
+                         [(note.id, 5.0), (case.id, 4.5), (phone.id, 4.0)])
+        self.assertEqual([product.id for product in get_leaderboard('phones')], [case.id, phone.id])
+        with self.assertNumQueries(0):
+            self.assertEqual(len(get_leaderboard(size=2)), 2)
+
+    def test_reviews_patch_cached_boards(self):
+        phone, case = self.create_product('phone'), self.create_product('case')
+        self.review(phone, 4)
+        self.review(case, 3)
+        self.assertEqual([product.id for product in get_leaderboard()], [phone.id, case.id])
+
+        # Новый отзыв точечно обновляет общий список и список категории без полного пересчёта
+        self.review(case, 3, 5, 5)
+        self.assertEqual([product.id for product in get_leaderboard()], [case.id, phone.id])
+        self.assertEqual([item['id'] for item in cache.get(leaderboard_key('phones'))], [case.id, phone.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.filter(product=phone).get().delete()
+        self.assertEqual([product.id for product in get_leaderboard()], [case.id])
+
+        response = APIClient().get('/api/v1/products/recommended/', {'limit': 5})
+        self.assertEqual([product['id'] for product in response.json()], [case.id])
+
+
+class ProductImportTest(ProductTestMixin, TestCase):
+
+    def test_owner_email_is_case_insensitive(self):
+        owner = User.objects.create_user('John.Doe@example.com', 'password123')
+        rows = [{'title': 'phone', 'description': 'd', 'category': 'phones', 'price': '10', 'owner': email}
+                for email in ('John.Doe@example.com', 'john.doe@EXAMPLE.com')]
+        stream = io.StringIO(''.join(json.dumps(row) + '\n' for row in rows))
+
+        result = import_products(stream, 'jsonl')
+        self.assertEqual((result.created, result.errors), (2, []))
+        self.assertEqual(Product.objects.filter(owner=owner).count(), 2)
+
+    def test_endpoint_imports_valid_rows_and_reports_errors(self):
+        upload = SimpleUploadedFile('catalog.csv', (
+            'title,description,category,price,quantity\n'
+            'Samsung phone,android,phones,100,5\n'
+            'Nokia phone,classic,tablets,50,1\n'
+            'Apple phone,ios,phones,-1,1\n').encode())
+
+        response = self.client_for(self.admin).post('/api/v1/products/import/', {'file': upload})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json()['created'], response.json()['failed']), (1, 2))
+        self.assertEqual([error['line'] for error in response.json()['errors']], [3, 4])
+        product = Product.objects.get()
+        self.assertEqual((product.owner, product.quantity, product.stats.likes_count), (self.admin, 5, 0))
+        # Поисковый вектор строится при импорте, хотя bulk_create не вызывает сигналы
+        self.assertEqual(APIClient().get('/api/v1/products/', {'q': 'samsung'}).json()['count'], 1)
+
+
+class CountingView:
+    calls = 0
+
+    @cache_response(tags=('products',))
+    def get(self, request):
+        self.calls += 1
+        return HttpResponse(f'built {self.calls}', content_type='text/plain')
+
+
+class ProductCacheTest(ProductTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.request = RequestFactory().get('/cached/')
+        self.request.user = AnonymousUser()
+        self.key = response_cache_key(CountingView.get.__wrapped__, self.request)
+
+    def test_list_is_cached_until_products_change(self):
+        self.create_product('phone')
+        client = APIClient()
+        self.assertEqual(client.get('/api/v1/products/').json()['count'], 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get('/api/v1/products/').json()['count'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_product('case')
+        self.assertEqual(client.get('/api/v1/products/').json()['count'], 2)
+
+    def test_cold_miss_waits_for_the_rebuilding_process(self):
+        view = CountingView()
+        cache.add(f'{self.key}:lock', 'other')
+
+        def built_elsewhere(seconds):
+            cache.set(self.key, (get_tag_versions(('products',)), b'built elsewhere', 200, 'text/plain'))
+
+        with mock.patch('config.cache.time.sleep', side_effect=built_elsewhere):
+            self.assertEqual(view.get(self.request).content, b'built elsewhere')
+        self.assertEqual(view.calls, 0)
+
+    def test_foreign_lock_is_not_released(self):
+        view = CountingView()
+        cache.add(f'{self.key}:lock', 'other')
+        # Другой процесс так и не сохранил ответ: собираем сами, но его блокировку не трогаем
+        with mock.patch('config.cache.CACHE_COLD_WAIT', 0):
+            self.assertEqual(view.get(self.request).content, b'built 1')
+        self.assertEqual(cache.get(f'{self.key}:lock'), 'other')
+        self.assertEqual(view.get(self.request).content, b'built 1')
+
+        cache.delete(f'{self.key}:lock')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_product('phone')
+        self.assertEqual(view.get(self.request).content, b'built 2')
+        self.assertIsNone(cache.get(f'{self.key}:lock'))
+
+
+class ProductPaginationTest(ProductTestMixin, TestCase):
+
+    def test_cursor_mode_walks_all_products_by_id(self):
+        products = [self.create_product(f'phone {index}') for index in range(15)]
+        client, ids, url, params = APIClient(), [], '/api/v1/products/', {'pagination': 'cursor'}
+        while url:
+            data = client.get(url, params).json()
+            self.assertNotIn('count', data)
+            ids += [product['id'] for product in data['results']]
+            url, params = data['next'], None
+        self.assertEqual(ids, [product.id for product in products])
+        self.assertEqual(client.get('/api/v1/products/', {'page': 2}).json()['count'], 15)
+
+    def test_reviews_cursor_mode_newest_first(self):
+        product = self.create_product('phone')
+        reviewers = [User.objects.create_user(f'reviewer{index}@example.com', 'password123') for index in range(3)]
+        reviews = [Review.objects.create(product=product, user=user, rating=5) for user in reviewers]
+        url = f'/api/v1/products/{product.id}/reviews/'
+
+        data = APIClient().get(url, {'pagination': 'cursor'}).json()
+        self.assertEqual([review['id'] for review in data['results']], [review.id for review in reversed(reviews)])
+        self.assertIsNone(data['next'])
+        # Без параметра отзывы по-прежнему отдаются списком
+        self.assertEqual(len(APIClient().get(url).json()), 3)
+
+    def test_cursor_mode_rejects_other_orderings(self):
+        self.create_product('Samsung phone')
+        client = self.client_for(self.admin)
+        for path, params in (('/api/v1/products/', {'q': 'samsung'}), ('/api/v1/products/', {'search': 'samsung'}),
+                             ('/api/v1/products/likes/', {'likes_from': 0, 'ordering': '-likes'})):
+            self.assertEqual(client.get(path, {**params, 'pagination': 'cursor'}).status_code, 400)
+            self.assertEqual(client.get(path, params).status_code, 200)
+
+
+class ProductFacetsTest(ProductTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_facets_count_categories_roots_prices_and_owners(self):
+        electronics = Category.objects.create(name='electronics')
+        Category.objects.filter(pk=self.category.pk).update(parent=electronics)
+        smartphones = Category.objects.create(name='smartphones', parent=Category.objects.get(pk=self.category.pk))
+        books = Category.objects.create(name='books')
+        seller = User.objects.create_user('seller@example.com', 'password123')
+        self.create_product('Nokia phone', price=500)
+        for title, category, price in (('Samsung phone', smartphones, 7000), ('Apple phone', smartphones, 60000),
+                                       ('Phone book', books, 20)):
+            Product.objects.create(owner=seller, title=title, description='description', category=category,
+                                   price=price, quantity=1)
+
+        data = APIClient().get('/api/v1/products/facets/').json()
+        self.assertEqual(data['total'], 4)
+        self.assertEqual([(row['slug'], row['count']) for row in data['categories']],
+                         [('smartphones', 2), ('books', 1), ('phones', 1)])
+        # Продукты внуков засчитываются корню, а не непосредственному родителю
+        self.assertEqual([(row['slug'], row['count']) for row in data['parents']], [('electronics', 3), ('books', 1)])
+        self.assertEqual([row['count'] for row in data['prices']], [2, 0, 1, 0, 1, 0])
+        self.assertEqual([(row['email'], row['count']) for row in data['owners']],
+                         [(seller.email, 3), (self.admin.email, 1)])
+        self.assertEqual(APIClient().get('/api/v1/products/facets/', {'q': 'samsung'}).json()['total'], 1)
+
+
+class ProductExportTest(ProductTestMixin, TestCase):
+
+    def export(self, **params):
+        response = self.client_for(self.admin).get('/api/v1/products/export/', {'file_format': 'jsonl', **params})
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_export_honours_search_query(self):
+        phones = [self.create_product('Samsung phone'), self.create_product('Nokia phone')]
+        self.create_product('Leather case')
+
+        self.assertEqual(len(self.export()), 3)
+        lines = self.export(q='phone')
+        self.assertEqual(len(lines), 2)
+        # Выгрузка идёт в порядке id, а не по релевантности поиска
+        self.assertEqual([json.loads(line)['id'] for line in lines], [product.id for product in phones])
+
+    def test_csv_and_gzip_downloads(self):
+        product = self.create_product('Samsung phone, 5G', 'экран "6.1"')
+        response = self.client_for(self.admin).get('/api/v1/products/export/', {'gzip': '1'})
+        self.assertEqual((response['Content-Type'], response['Content-Disposition']),
+                         ('application/gzip', 'attachment; filename="products.csv.gz"'))
+        rows = list(csv.reader(io.StringIO(gzip.decompress(b''.join(response.streaming_content)).decode())))
+        self.assertEqual(rows[0], list(PRODUCT_EXPORT_FIELDS))
+        self.assertEqual(rows[1][:5], [str(product.id), 'Samsung phone, 5G', 'экран "6.1"', str(self.category.pk),
+                                       'admin@example.com'])
+        self.assertEqual(len(rows), 2)
+
+    def test_unknown_format_and_permissions(self):
+        self.assertEqual(self.client_for(self.admin).get('/api/v1/products/export/',
+                                                         {'file_format': 'xml'}).status_code, 400)
+        self.assertEqual(APIClient().get('/api/v1/products/export/').status_code, 401)
+
+    def test_command_writes_the_same_rows(self):
+        self.create_product('Samsung phone')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'products.jsonl')
+            call_command('export_products', path, '--format', 'jsonl', '--chunk-size', '1', stderr=io.StringIO())
+            with open(path) as output:
+                self.assertEqual(output.read().splitlines(), self.export())
+
+
+class ProductSimilarityTriggerTest(ProductTestMixin, TestCase):
+
+    def assertScheduled(self, expected, action):
+        self.schedule_similar_products.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            action()
+        self.assertEqual(self.schedule_similar_products.called, expected)
+
+    def test_only_text_and_category_changes_schedule_recompute(self):
+        product = None
+
+        def create():
+            nonlocal product
+            product = self.create_product('Samsung phone')
+
+        self.assertScheduled(True, create)
+        product.price, product.quantity = 90, 5
+        self.assertScheduled(False, product.save)
+        product.title = 'Samsung Galaxy'
+        self.assertScheduled(False, lambda: product.save(update_fields=['price']))
+        self.assertScheduled(True, product.save)
+        product = Product.objects.get(pk=product.pk)
+        product.category = Category.objects.create(name='cases')
+        self.assertScheduled(True, product.save)
+        self.assertScheduled(False, Product.objects.only('id', 'price').get(pk=product.pk).save)
+        self.assertScheduled(True, product.delete)
+
+
+class ProductSimilarityTest(ProductTestMixin, TestCase):
+
+    def test_frequent_terms_are_pruned(self):
+        documents = [product_terms(title, 'и для', 'phones', None)
+                     for title in ('samsung galaxy', 'samsung note', 'apple iphone', 'nokia lumia')]
+        matrix = build_tfidf(documents)
+        # Остаются только слова названий не чаще чем в половине продуктов
+        self.assertEqual(matrix.shape, (4, 7))
+        self.assertEqual((matrix @ matrix.T)[2, 3], 0)
+
+    def test_compute_similar_products(self):
+        galaxy = self.create_product('Samsung Galaxy', 'android смартфон для работы')
+        note = self.create_product('Samsung Note', 'android смартфон для работы')
+        for title in ('Apple iPhone', 'Nokia Lumia', 'Xiaomi Redmi'):
+            self.create_product(title, 'смартфон для работы')
+
+        self.assertEqual(compute_similar_products(k=2), 5)
+        self.assertEqual(list(SimilarProduct.objects.filter(product=galaxy).values_list('similar_id', flat=True)),
+                         [note.id])
+
+
+class ProductConditionalTest(ProductTestMixin, TestCase):
+
+    def test_like_changes_etag_without_last_modified(self):
+        product = self.create_product('Samsung phone')
+        url = f'/api/v1/products/{product.id}/'
+        client = APIClient()
+        response = client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        self.client_for(self.admin).get(f'/api/v1/products/{product.id}/toggle_like/')
+        # Лайк не меняет даты продукта: If-Modified-Since не должен давать 304
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        self.assertEqual(client.get(url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT').status_code, 200)
+
+
+class ProductRecommendedTest(ProductTestMixin, TestCase):
+
+    def test_limit_must_be_positive(self):
+        product = self.create_product('Samsung phone')
+        client = self.client_for(self.admin)
+
+        for params in ({'limit': -1, 'product': product.id}, {'limit': 0}, {'limit': -1}):
+            self.assertEqual(client.get('/api/v1/products/recommended/', params).status_code, 400)
+        self.assertEqual(client.get('/api/v1/products/recommended/', {'limit': 1}).status_code, 200)
+
+
+    def test_stale_rows_are_removed_when_interactions_disappear(self):
+        phone, case, charger = (self.create_product(title) for title in ('phone', 'case', 'charger'))
+        buyer = User.objects.create_user('buyer@example.com', 'password123')
+        Likes.objects.bulk_create([Likes(user=user, product=product, is_liked=True)
+                                   for user, product in ((self.admin, phone), (self.admin, case), (buyer, phone))])
+
+        self.assertEqual(compute_recommendations(), (2, 2))
+        self.assertEqual(list(UserRecommendation.objects.filter(user=buyer).values_list('product_id', flat=True)),
+                         [case.id])
+        self.assertTrue(ProductNeighbor.objects.filter(product=case).exists())
+
+        # Все взаимодействия покупателя и продукта case исчезли: их списки удаляются
+        Likes.objects.filter(Q(user=buyer) | Q(product=case)).delete()
+        Favorite.objects.create(user=self.admin, product=charger, favorite=True)
+        self.assertEqual(compute_recommendations(), (2, 1))
+        self.assertFalse(UserRecommendation.objects.filter(user=buyer).exists())
+        self.assertFalse(ProductNeighbor.objects.filter(product=case).exists())
+
+        Likes.objects.all().delete()
+        Favorite.objects.all().delete()
+        self.assertEqual(compute_recommendations(), (0, 0))
+        self.assertFalse(ProductNeighbor.objects.exists() or UserRecommendation.objects.exists())
+
+class ProductTrendingTest(ProductTestMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        get_redis_connection('default').delete(TRENDING_KEY, TRENDING_EPOCH_KEY)
+
+    def test_limit_must_be_positive(self):
+        products = [self.create_product(f'phone {index}') for index in range(3)]
+        record_events({product.id: index + 1 for index, product in enumerate(products)})
+        client = APIClient()
+
+        for limit in (0, -1, -5):
+            self.assertEqual(client.get('/api/v1/products/trending/', {'limit': limit}).status_code, 400)
+            self.assertEqual(get_trending(limit), [])
+        self.assertEqual([product['id'] for product in client.get('/api/v1/products/trending/', {'limit': 2}).json()],
+                         [products[2].id, products[1].id])
+
+
+    def test_older_events_decay_by_half_life(self):
+        old, new = self.create_product('old'), self.create_product('new')
+        start = 1_000_000.0
+        record_events({old.id: 10}, now=start)
+        record_events({new.id: 6}, now=start + TRENDING_HALF_LIFE)
+
+        trending = get_trending(now=start + TRENDING_HALF_LIFE)
+        self.assertEqual([product_id for product_id, _ in trending], [new.id, old.id])
+        self.assertAlmostEqual(trending[1][1], 5)
+        # Перенос эпохи не меняет текущие баллы, а почти угасшие продукты удаляются
+        record_events({old.id + new.id: 0.001}, now=start)
+        self.assertEqual(rebase_trending(now=start + 2 * TRENDING_HALF_LIFE), 2)
+        self.assertEqual([round(score, 6) for _, score in get_trending(now=start + 2 * TRENDING_HALF_LIFE)], [3, 2.5])
+
+    def test_views_likes_and_snapshot(self):
+        viewed, liked, deleted = (self.create_product(title) for title in ('viewed', 'liked', 'deleted'))
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(2):
+                PageView.objects.create(page=f'/api/v1/products/{viewed.id}/?fields=id', ip_address='127.0.0.1')
+            PageView.objects.create(page='/api/v1/products/', ip_address='127.0.0.1')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_for(self.admin).get(f'/api/v1/products/{liked.id}/toggle_like/')
+        deleted_id = deleted.id
+        record_events({deleted_id: 1})
+        deleted.delete()
+
+        self.assertEqual([product_id for product_id, _ in get_trending()], [liked.id, viewed.id, deleted_id])
+        self.assertEqual(save_trending_snapshot(), 2)
+        self.assertEqual(list(TrendingSnapshot.objects.order_by('rank').values_list('product_id', flat=True)),
+                         [liked.id, viewed.id])
+
+
+class ProductBoughtTogetherTest(ProductTestMixin, TestCase):
+
+    def test_limit_must_be_positive(self):
+        product = self.create_product('Samsung phone')
+        url = f'/api/v1/products/{product.id}/bought_together/'
+
+        for limit in (0, -1):
+            self.assertEqual(APIClient().get(url, {'limit': limit}).status_code, 400)
+        self.assertEqual(APIClient().get(url, {'limit': 1}).status_code, 200)
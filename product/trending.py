@@ -0,0 +1,148 @@
+import re
+import time
+
+from django.db import transaction
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from .models import Product, TrendingSnapshot
+
+# Сортированное множество product_id -> накопленный вес событий (в масштабе TRENDING_EPOCH_KEY)
+TRENDING_KEY = 'trending:products'
+# Момент, относительно которого масштабированы веса (секунды)
+TRENDING_EPOCH_KEY = 'trending:epoch'
+# Вес события в баллах популярности
+TRENDING_WEIGHTS = {'view': 1.0, 'like': 3.0, 'order': 5.0}
+# За это время вклад события уменьшается вдвое
+TRENDING_HALF_LIFE = 6 * 60 * 60
+# Продукты с меньшим текущим баллом удаляются из множества при пересчёте
+TRENDING_MIN_SCORE = 0.01
+TRENDING_MAX_SIZE = 10000
+TRENDING_SNAPSHOT_SIZE = 100
+# Снимки старше этого срока удаляются
+TRENDING_SNAPSHOT_TTL = timezone.timedelta(days=30)
+# Просмотр страницы продукта: /products/<id>/ (с префиксом API или без)
+PRODUCT_PAGE_RE = re.compile(r'/products/(\d+)/?$')
+
+# Вместо уменьшения всех баллов со временем новые события получают вес 2^((now - epoch) / half_life):
+# отношение баллов остаётся тем же, а запись - одна операция ZINCRBY на продукт.
+RECORD_SCRIPT = """
+local epoch = tonumber(redis.call('GET', KEYS[2]))
+if not epoch then
+    epoch = tonumber(ARGV[1])
+    redis.call('SET', KEYS[2], ARGV[1])
+end
+local factor = 2 ^ ((tonumber(ARGV[1]) - epoch) / tonumber(ARGV[2]))
+for i = 3, #ARGV, 2 do
+    redis.call('ZINCRBY', KEYS[1], string.format('%.17g', tonumber(ARGV[i + 1]) * factor), ARGV[i])
+end
+return 1
+"""
+
+# Переносит эпоху в текущий момент, чтобы множитель событий не рос неограниченно,
+# и убирает угасшие продукты; выполняется атомарно относительно RECORD_SCRIPT.
+REBASE_SCRIPT = """
+local epoch = tonumber(redis.call('GET', KEYS[2])) or tonumber(ARGV[1])
+-- Эпоха не переносится назад, даже если часы процесса отстают
+local now = math.max(tonumber(ARGV[1]), epoch)
+local factor = 2 ^ ((epoch - now) / tonumber(ARGV[2]))
+local items = redis.call('ZRANGE', KEYS[1], 0, -1, 'WITHSCORES')
+for i = 1, #items, 2 do
+    redis.call('ZADD', KEYS[1], string.format('%.17g', tonumber(items[i + 1]) * factor), items[i])
+end
+redis.call('SET', KEYS[2], string.format('%.17g', now))
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', '(' .. ARGV[3])
+redis.call('ZREMRANGEBYRANK', KEYS[1], 0, -tonumber(ARGV[4]) - 1)
+return redis.call('ZCARD', KEYS[1])
+"""
+
+
+def get_connection():
+    return get_redis_connection('default')
+
+
+def record_events(weights, now=None):
+    """
+    Добавляет события популярности продуктов одним обращением к Redis.
+
+    Аргументы:
+    - weights (dict): product_id -> вес событий (например, TRENDING_WEIGHTS['order'] * количество).
+    - now (float): Момент событий в секундах (по умолчанию текущий).
+    """
+    args = [item for product_id, weight in weights.items() if weight for item in (product_id, weight)]
+    if not args:
+        return
+    connection = get_connection()
+    record = connection.register_script(RECORD_SCRIPT)
+    record(keys=[TRENDING_KEY, TRENDING_EPOCH_KEY], args=[now or time.time(), TRENDING_HALF_LIFE, *args],
+           client=connection)
+
+
+def record_event(product_id, event):
+    """
+    Добавляет одно событие ('view', 'like' или 'order') после фиксации текущей транзакции.
+    """
+    transaction.on_commit(lambda: record_events({product_id: TRENDING_WEIGHTS[event]}))
+
+
+def product_id_from_page(page):
+    """
+    Возвращает id продукта из адреса просмотренной страницы или None.
+    """
+    match = PRODUCT_PAGE_RE.search(page.split('?', 1)[0])
+    return int(match.group(1)) if match else None
+
+
+def get_trending(size=10, now=None):
+    """
+    Возвращает самые популярные сейчас продукты (ZREVRANGE, O(log n + size)).
+
+    Возвращает:
+    - list: Пары (product_id, текущий балл) по убыванию балла.
+    """
+    if size <= 0:
+        # ZREVRANGE с концом -1 и меньше читает множество до конца
+        return []
+    connection = get_connection()
+    pipe = connection.pipeline(transaction=False)
+    pipe.get(TRENDING_EPOCH_KEY)
+    pipe.zrevrange(TRENDING_KEY, 0, size - 1, withscores=True)
+    epoch, items = pipe.execute()
+    now = now or time.time()
+    factor = 2 ** (min(float(epoch) - now, 0) / TRENDING_HALF_LIFE) if epoch else 1.0
+    return [(int(product_id), score * factor) for product_id, score in items]
+
+
+def rebase_trending(now=None):
+    """
+    Переводит баллы к текущему моменту и обрезает множество до TRENDING_MAX_SIZE продуктов.
+
+    Возвращает:
+    - int: Количество продуктов в множестве.
+    """
+    connection = get_connection()
+    rebase = connection.register_script(REBASE_SCRIPT)
+    return rebase(keys=[TRENDING_KEY, TRENDING_EPOCH_KEY],
+                  args=[now or time.time(), TRENDING_HALF_LIFE, TRENDING_MIN_SCORE, TRENDING_MAX_SIZE],
+                  client=connection)
+
+
+def save_trending_snapshot(size=TRENDING_SNAPSHOT_SIZE):
+    """
+    Сохраняет текущий топ популярных продуктов в TrendingSnapshot и удаляет устаревшие снимки.
+
+    Возвращает:
+    - int: Количество сохранённых строк.
+    """
+    rebase_trending()
+    created_at = timezone.now()
+    trending = get_trending(size)
+    with transaction.atomic():
+        TrendingSnapshot.objects.filter(created_at__lt=created_at - TRENDING_SNAPSHOT_TTL).delete()
+        # Продукты могли быть удалены после события
+        existing = set(Product.objects.filter(
+            id__in=[product_id for product_id, _ in trending]).values_list('id', flat=True))
+        snapshot = TrendingSnapshot.objects.bulk_create([
+            TrendingSnapshot(product_id=product_id, score=score, rank=rank, created_at=created_at)
+            for rank, (product_id, score) in enumerate(item for item in trending if item[0] in existing)])
+    return len(snapshot)
@@ -1,32 +1,75 @@
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
+from django.core.cache import cache
 from django_filters.rest_framework import DjangoFilterBackend
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import viewsets, permissions, status, response
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotAuthenticated
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 
+from config.cache import CACHE_RESPONSE_TIMEOUT, cache_response, get_tag_versions
+from config.conditional import conditional_response
+from config.exports import export_request_options, export_response
+from config.pagination import CursorOptInPagination
+from order.bought_together import BOUGHT_TOGETHER_TOP_K
 from rating.serializers import ReviewActionSerializer
 from . import serializers
-from .models import Product, ProductImage, Likes, Favorite
+from .facets import compute_facets, facets_cache_key
+from .filters import ProductSearchFilter
+from .importer import IMPORT_FORMATS, import_products
+from .leaderboard import get_leaderboard
+from .likes import like_counts, liked_product_ids, toggle_like
+from .models import PRODUCT_EXPORT_FIELDS, Product, ProductImage, Favorite
 from .permissions import IsAuthorOrAdmin, IsAuthor
-from .serializers import ProductSerializer
+from .recommender import RECOMMENDATIONS_TOP_K
+from .search import search_products
+from .trending import TRENDING_SNAPSHOT_SIZE, get_trending, record_event
 
 
-class StandartResultPagination(PageNumberPagination):
+class StandartResultPagination(CursorOptInPagination):
     page_size = 12
     page_query_param = 'page'
+    cursor_ordering = ('id',)
+    # Поиск сортирует по релевантности, ?ordering= (действие likes) - по лайкам
+    cursor_conflicting_params = ('ordering', 'q', 'search')
+
+
+class ReviewCursorPagination(CursorOptInPagination):
+    # Отзывы продукта по умолчанию отдаются списком; курсор включается параметром ?pagination=cursor
+    page_size = 10
+    cursor_ordering = ('-created_at', '-id')
+
+
+def product_state(view, request, pk=None, **kwargs):
+    """
+    Состояние карточки продукта для ETag без запуска сериализатора.
+
+    Данные продукта и его изображений отражает Product.updated_at, отзывы и избранное -
+    ProductStats.updated_at (один запрос по первичному ключу). Лайки берутся из Redis,
+    блоки похожих и рекомендованных продуктов - из версии тега 'recommendations'.
+    Last-Modified не отдаётся: ответ зависит от пользователя и счётчиков без дат изменения,
+    и клиент с одним If-Modified-Since получил бы устаревший 304.
+    """
+    try:
+        row = Product.objects.filter(pk=pk).values_list('id', 'updated_at', 'stats__updated_at').first()
+    except (TypeError, ValueError):
+        return None
+    if row is None:
+        return None
+    product_id, updated_at, stats_updated_at = row
+    user = request.user
+    liked = user.is_authenticated and product_id in liked_product_ids(user.pk, [product_id])
+    parts = (product_id, updated_at, stats_updated_at, get_tag_versions(('recommendations',)),
+             like_counts([product_id])[product_id], user.pk, liked)
+    return parts, None
 
 
 class ProductViewSet(viewsets.ModelViewSet):
     # Запрос всех продуктов из модели Product, отсортированных по id
-    queryset = Product.objects.all().order_by('id')
+    queryset = Product.objects.select_related('stats').order_by('id')
     pagination_class = StandartResultPagination
-    filter_backends = (DjangoFilterBackend, SearchFilter)
-    search_fields = ('title', 'description')  # Поля, по которым будет происходить поиск
+    filter_backends = (DjangoFilterBackend, ProductSearchFilter)  # Поиск идёт по полнотекстовому индексу
     filterset_fields = ('owner', 'category')  # Поля, по которым можно фильтровать
 
     def get_queryset(self):
@@ -35,10 +78,14 @@ class ProductViewSet(viewsets.ModelViewSet):
         search_query = self.request.query_params.get('q')
 
         if search_query:
-            queryset = queryset.filter(title__icontains=search_query) | queryset.filter(description__icontains=search_query)
+            queryset = search_products(queryset, search_query)
 
         return queryset
 
+    @conditional_response(product_state)  # 304 для неизменившегося продукта без сборки ответа
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         # Устанавливаем владельца продукта как текущего аутентифицированного пользователя при создании
         serializer.save(owner=self.request.user)
@@ -53,24 +100,104 @@ class ProductViewSet(viewsets.ModelViewSet):
         # Возвращаем разрешения в зависимости от типа действия (action)
         if self.action in ('retrieve', 'toggle_like', 'toggle_favorites', 'reviews'):
             return [permissions.IsAuthenticatedOrReadOnly(), ]
-        elif self.action == 'list':
+        elif self.action in ('list', 'facets', 'recommended', 'bought_together', 'trending'):
             return [permissions.AllowAny(), ]
         return [permissions.IsAdminUser(), ]
 
-    @method_decorator(cache_page(60))  # Кеширование ответа на 1 минуту
+    @cache_response(tags=('products', 'categories'))  # Кеш сбрасывается при изменении продуктов и категорий
     def list(self, request, *args, **kwargs):
         # Возвращаем разбитый на страницы список продуктов
         return super().list(request, *args, **kwargs)
 
+    @action(detail=False, methods=['GET'])
+    def facets(self, request):
+        # Фасеты для текущих фильтров (owner, category) и поиска q: количество по категориям
+        # с подсчётом по корневым, гистограмма цен и продавцы - одним агрегирующим запросом.
+        # Результат кешируется по нормализованному запросу до изменения продуктов или категорий.
+        key = facets_cache_key(request.query_params, get_tag_versions(('products', 'categories')))
+        data = cache.get(key)
+        if data is None:
+            data = compute_facets(self.filter_queryset(self.get_queryset()))
+            cache.set(key, data, timeout=CACHE_RESPONSE_TIMEOUT)
+        return Response(data)
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('product', openapi.IN_QUERY, 'products often chosen together with this product', False,
+                          type=openapi.TYPE_INTEGER),
+        openapi.Parameter('limit', openapi.IN_QUERY, f'number of products (max {RECOMMENDATIONS_TOP_K})', False,
+                          type=openapi.TYPE_INTEGER)])
+    @action(detail=False, methods=['GET'])
+    def recommended(self, request):
+        # Рекомендации из предрассчитанных таблиц (команда compute_recommendations, ночная задача):
+        # ?product=<id> - соседи продукта, иначе персональные рекомендации текущего пользователя.
+        # Если рекомендаций нет (аноним, новый пользователь), отдаём лучшие продукты по рейтингу.
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), RECOMMENDATIONS_TOP_K)
+            product_id = request.query_params.get('product')
+            product_id = int(product_id) if product_id else None
+        except ValueError:
+            return Response('product and limit must be integers', status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response('limit must be a positive integer', status=status.HTTP_400_BAD_REQUEST)
+        queryset = Product.objects.select_related('owner', 'category__parent')
+        products = []
+        if product_id is not None:
+            products = list(queryset.filter(neighbor_for__product_id=product_id).order_by('neighbor_for__rank')[:limit])
+        elif request.user.is_authenticated:
+            products = list(queryset.filter(recommended_for__user=request.user).order_by(
+                'recommended_for__rank')[:limit])
+        if not products:
+            ids = [product.id for product in get_leaderboard(size=limit)]
+            products = sorted(queryset.filter(id__in=ids), key=lambda product: ids.index(product.id))
+        serializer = serializers.ProductListSerializer(products, many=True, context=self.get_serializer_context())
+        return Response(serializer.data)
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('limit', openapi.IN_QUERY, f'number of products (max {TRENDING_SNAPSHOT_SIZE})', False,
+                          type=openapi.TYPE_INTEGER)])
+    @action(detail=False, methods=['GET'])
+    def trending(self, request):
+        # Популярные сейчас продукты: баллы просмотров, лайков и заказов с затуханием хранятся в Redis,
+        # топ читается из сортированного множества без обращения к истории событий.
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), TRENDING_SNAPSHOT_SIZE)
+        except ValueError:
+            return Response('limit must be an integer', status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response('limit must be a positive integer', status=status.HTTP_400_BAD_REQUEST)
+        scores = dict(get_trending(limit))
+        products = Product.objects.select_related('owner', 'category__parent').filter(id__in=scores)
+        products = sorted(products, key=lambda product: -scores[product.id])
+        serializer = serializers.ProductListSerializer(products, many=True, context=self.get_serializer_context())
+        return Response(serializer.data)
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('limit', openapi.IN_QUERY, f'number of products (max {BOUGHT_TOGETHER_TOP_K})', False,
+                          type=openapi.TYPE_INTEGER)])
     @action(detail=True, methods=['GET'])
-    def toggle_like(self, request, pk):
-        # Переключает статус "лайк" для продукта текущего аутентифицированного пользователя
+    def bought_together(self, request, pk):
+        # Продукты, которые чаще всего покупали в одном заказе с этим (таблица BoughtTogether)
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), BOUGHT_TOGETHER_TOP_K)
+        except ValueError:
+            return Response('limit must be an integer', status=status.HTTP_400_BAD_REQUEST)
+        if limit < 1:
+            return Response('limit must be a positive integer', status=status.HTTP_400_BAD_REQUEST)
         product = self.get_object()
-        user = request.user
-        like_obj, created = Likes.objects.get_or_create(product=product, user=user)
+        products = Product.objects.select_related('owner', 'category__parent').filter(
+            bought_together_for__product=product).order_by('-bought_together_for__count', 'id')[:limit]
+        serializer = serializers.ProductListSerializer(products, many=True, context=self.get_serializer_context())
+        return Response(serializer.data)
 
-        like_obj.is_liked = not like_obj.is_liked
-        like_obj.save()
+    @action(detail=True, methods=['GET'])
+    def toggle_like(self, request, pk):
+        # Переключает статус "лайк" для продукта текущего аутентифицированного пользователя.
+        # Переключение пишется в Redis, в таблицу Likes его переносит задача flush_likes_task.
+        product = self.get_object()
+        if not request.user.is_authenticated:
+            raise NotAuthenticated()
+        if toggle_like(product.pk, request.user.pk):
+            record_event(product.pk, 'like')
         return Response('like toggled')
 
     # api/v1/products/id/toggle_favorites/
@@ -87,17 +214,61 @@ class ProductViewSet(viewsets.ModelViewSet):
 
     @swagger_auto_schema(manual_parameters=[
         openapi.Parameter('likes_from', openapi.IN_QUERY, 'filter products by amount of likes', True,
-                          type=openapi.TYPE_INTEGER)])
+                          type=openapi.TYPE_INTEGER),
+        openapi.Parameter('ordering', openapi.IN_QUERY, 'sort by amount of likes', False,
+                          type=openapi.TYPE_STRING, enum=['likes', '-likes'])])
     @action(detail=False, methods=["GET"])
     def likes(self, request, pk=None):
-        # Возвращает продукты, у которых количество лайков больше или равно указанному значению
-        from django.db.models import Count
-        q = request.query_params.get("likes_from")  # request.query_params = request.GET
-        queryset = self.get_queryset()
-        queryset = queryset.annotate(Count('likes')).filter(likes__count__gte=q)
+        # Возвращает продукты, у которых количество лайков больше или равно указанному значению.
+        # Количество берётся из индексированного ProductStats.likes_count (обновляется flush_likes_task).
+        try:
+            likes_from = int(request.query_params.get('likes_from'))
+        except (TypeError, ValueError):
+            return Response('likes_from must be an integer', status=status.HTTP_400_BAD_REQUEST)
+        queryset = self.filter_queryset(self.get_queryset()).select_related('owner', 'category__parent').filter(
+            stats__likes_count__gte=likes_from)
+        ordering = request.query_params.get('ordering')
+        if ordering in ('likes', '-likes'):
+            queryset = queryset.order_by(ordering.replace('likes', 'stats__likes_count'), 'id')
+
+        page = self.paginate_queryset(queryset)
+        serializer = serializers.ProductLikesListSerializer(page, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
 
-        serializer = ProductSerializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('file', openapi.IN_FORM, 'CSV or JSONL file', True, type=openapi.TYPE_FILE),
+        openapi.Parameter('file_format', openapi.IN_FORM, 'input format (detected from the file name by default)',
+                          False, type=openapi.TYPE_STRING, enum=['csv', 'jsonl'])])
+    @action(detail=False, methods=['POST'], parser_classes=(MultiPartParser,), url_path='import')
+    def import_products(self, request):
+        # Массовый импорт продуктов из CSV/JSONL (только для администраторов).
+        # Файл читается построчно и сохраняется пачками, ошибочные строки возвращаются в errors.
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response('file is required', status=status.HTTP_400_BAD_REQUEST)
+        file_format = request.data.get('file_format') or upload.name.rsplit('.', 1)[-1].lower()
+        if file_format not in IMPORT_FORMATS:
+            return Response(f'file_format must be one of: {", ".join(IMPORT_FORMATS)}',
+                            status=status.HTTP_400_BAD_REQUEST)
+        result = import_products(upload, file_format, default_owner=request.user)
+        return Response({'created': result.created, 'failed': len(result.errors), 'errors': result.errors},
+                        status=status.HTTP_201_CREATED if result.created else status.HTTP_400_BAD_REQUEST)
+
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('file_format', openapi.IN_QUERY, 'output format', False,
+                          type=openapi.TYPE_STRING, enum=['csv', 'jsonl']),
+        openapi.Parameter('gzip', openapi.IN_QUERY, 'compress the file with gzip', False,
+                          type=openapi.TYPE_BOOLEAN)])
+    @action(detail=False, methods=['GET'])
+    def export(self, request):
+        # Потоковая выгрузка каталога (только для администраторов) с учётом фильтров owner, category и q.
+        # Строки читаются серверным курсором, поэтому память не растёт с размером таблицы.
+        file_format, compress = export_request_options(request)
+        if file_format is None:
+            return Response('file_format must be one of: csv, jsonl', status=status.HTTP_400_BAD_REQUEST)
+        # get_queryset применяет поиск q; сортировка по id возвращается после ранжирования поиска
+        queryset = self.filter_queryset(self.get_queryset()).order_by('id')
+        return export_response(queryset, PRODUCT_EXPORT_FIELDS, file_format, 'products', compress)
 
     def get_serializer_context(self):
         # Возвращает контекст сериализатора с запросом (request) для использования в сериализаторах
@@ -109,7 +280,11 @@ class ProductViewSet(viewsets.ModelViewSet):
         # Получает или добавляет отзывы к продукту
         product = self.get_object()
         if request.method == 'GET':
-            reviews = product.reviews.all()
+            reviews = product.reviews.select_related('user', 'product')
+            paginator = ReviewCursorPagination()
+            if paginator.use_cursor(request):
+                page = paginator.paginate_queryset(reviews, request, view=self)
+                return paginator.get_paginated_response(ReviewActionSerializer(page, many=True).data)
             serializer = ReviewActionSerializer(reviews, many=True).data
             return response.Response(serializer, status=200)
         else:
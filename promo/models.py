@@ -1,6 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.db import models
 
+from config.cache import register_cache_tags
+
 User = get_user_model()
 
 class Promo(models.Model):
@@ -24,6 +26,10 @@ class Promo(models.Model):
         # Возвращает строковое представление объекта Promo, состоящее из имени пользователя и текста промо (первые 25 символов)
         return f'{self.user} - {self.text[:25]}'
 
+
+# Закешированный список промо сбрасывается при изменении промо
+register_cache_tags(Promo, 'promo')
+
 # from django.contrib.auth import get_user_model
 # from django.db import models
 #
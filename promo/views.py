@@ -1,8 +1,7 @@
-from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
 from rest_framework import permissions
 from rest_framework.viewsets import ModelViewSet
 
+from config.cache import cache_response
 from promo.models import Promo
 from . import serializers
 
@@ -24,7 +23,7 @@ class PromoViewSet(ModelViewSet):
             return [permissions.AllowAny(), ]  # Для действий retrieve и list разрешаем доступ всем
         return [permissions.IsAdminUser(), ]  # Для других действий требуем права администратора
 
-    @method_decorator(cache_page(60))  # Кеширование ответа на 1 минуту
+    @cache_response(tags=('promo',))  # Кеширование ответа до изменения промо
     def list(self, request, *args, **kwargs):
         # Возвращаем разбитый на страницы список всех объектов Promo
         return super().list(request, *args, **kwargs)
@@ -0,0 +1,13 @@
+from config.exports import ExportCommand
+from rating.models import REVIEW_EXPORT_FIELDS, Review
+
+
+class Command(ExportCommand):
+    help = 'Stream product reviews to CSV/JSONL using a server-side cursor'
+    fields = REVIEW_EXPORT_FIELDS
+
+    def get_queryset(self):
+        return Review.objects.order_by('id')
+
+# выгрузка отзывов в CSV
+# python manage.py export_reviews reviews.csv
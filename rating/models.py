@@ -1,5 +1,8 @@
-from django.db import models
-from product.models import Product
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from product.models import Product, track_stats_contribution
+from product.tasks import patch_leaderboard_task
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
@@ -33,11 +36,43 @@ class Review(models.Model):
     class Meta:
         # Уникальное совместное значение для пары (user, product), чтобы пользователь мог оставить только один отзыв на продукт
         unique_together = ['user', 'product']
+        indexes = [
+            # Отзывы продукта от новых к старым, используется keyset-пагинацией
+            models.Index(fields=['product', '-created_at', '-id'], name='review_product_created_idx'),
+        ]
 
     def __str__(self):
         # Возвращает строковое представление объекта Review, состоящее из названия продукта, имени пользователя и оценки
         return f'{self.product} -> {self.user} -> {self.rating}'
 
+
+# Колонки выгрузки отзывов (export_reviews и /ratings/export/)
+REVIEW_EXPORT_FIELDS = ('id', 'product_id', 'user__email', 'rating', 'text', 'created_at')
+
+
+def review_contribution(instance):
+    # Вклад отзыва в статистику продукта: сумма, количество и гистограмма оценок
+    rating = instance.__dict__.get('rating')
+    if not rating:
+        return instance.product_id, {}
+    return instance.product_id, {'rating_sum': rating, 'rating_count': 1, f'stars_{rating}': 1}
+
+
+# Поддерживаем ProductStats в актуальном состоянии при изменении отзывов
+track_stats_contribution(Review, review_contribution)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def review_leaderboard_update(sender, instance, *args, **kwargs):
+    """
+    Обработчик сигналов post_save и post_delete для модели Review.
+
+    После фиксации транзакции ставит задачу точечного обновления списка лучших продуктов.
+    """
+    product_id = instance.product_id
+    transaction.on_commit(lambda: patch_leaderboard_task.delay(product_id))
+
 # from django.db import models
 # from product.models import Product
 # from django.contrib.auth import get_user_model
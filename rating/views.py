@@ -1,7 +1,12 @@
-from rest_framework import permissions
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import permissions, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet
 
-from .models import Review
+from config.exports import export_request_options, export_response
+from .models import REVIEW_EXPORT_FIELDS, Review
 from .serializers import ReviewSerializer
 
 class RatingViewSet(ModelViewSet):
@@ -17,10 +22,23 @@ class RatingViewSet(ModelViewSet):
 
     def get_permissions(self):
         # Возвращаем разрешения в зависимости от типа действия (action)
-        if self.action in ('update', 'partial_update', 'destroy'):
-            return [permissions.IsAdminUser(), ]  # Только администраторам разрешено изменение и удаление отзывов
+        if self.action in ('update', 'partial_update', 'destroy', 'export'):
+            return [permissions.IsAdminUser(), ]  # Только администраторам разрешено изменение, удаление и выгрузка отзывов
         return [permissions.IsAuthenticatedOrReadOnly(), ]  # Для других действий разрешено аутентифицированным пользователям, остальным только чтение # Аутентифицированным пользователям разрешено создание и просмотр отзывов
 
+    @swagger_auto_schema(manual_parameters=[
+        openapi.Parameter('file_format', openapi.IN_QUERY, 'output format', False,
+                          type=openapi.TYPE_STRING, enum=['csv', 'jsonl']),
+        openapi.Parameter('gzip', openapi.IN_QUERY, 'compress the file with gzip', False,
+                          type=openapi.TYPE_BOOLEAN)])
+    @action(detail=False, methods=['GET'])
+    def export(self, request):
+        # Потоковая выгрузка всех отзывов (только для администраторов) через серверный курсор
+        file_format, compress = export_request_options(request)
+        if file_format is None:
+            return Response('file_format must be one of: csv, jsonl', status=status.HTTP_400_BAD_REQUEST)
+        return export_response(Review.objects.order_by('id'), REVIEW_EXPORT_FIELDS, file_format, 'reviews', compress)
+
 # from rest_framework import permissions
 # from rest_framework.viewsets import ModelViewSet
 #